@@ -7,23 +7,27 @@ import pandas as pd
 from pathlib import Path
 from typing import List, Tuple, Optional
 from ai_prompt_templates import AIPromptTemplates
+from reference_workbook import ReferenceWorkbook
+from excel_reader import ExcelReader
 
 logger = logging.getLogger(__name__)
 
 class AIRecommendationEngine:
     """AI 推薦引擎類別"""
     
-    def __init__(self):
+    def __init__(self, reader: Optional[ExcelReader] = None):
         self.prompt_templates = AIPromptTemplates()
+        self.reader = reader
         self.reference_data = None
         self.reference_file_path = None
     
-    def load_reference_data(self, file_path: str) -> bool:
+    def load_reference_data(self, file_path: str, reference: Optional[ReferenceWorkbook] = None) -> bool:
         """
         載入參考資料
         
         Args:
             file_path: 參考資料檔案路徑
+            reference: 已解析的參考檔案（與比對流程共用，避免重複讀取）
             
         Returns:
             bool: 是否成功載入
@@ -43,14 +47,9 @@ class AIRecommendationEngine:
                     raise Exception("無法使用任何編碼讀取 CSV 檔案")
             else:
                 # 讀取 Excel 檔案的 "Test Item All" 工作表
-                # 跳過前3行空行，第4行是標題
-                self.reference_data = pd.read_excel(file_path, sheet_name="Test Item All", skiprows=3)
-                # 重新命名欄位
-                if len(self.reference_data.columns) >= 8:
-                    self.reference_data.columns = [
-                        'Main Function', 'Interface', 'Interenal Error Code', 
-                        'Description', 'Chinese', 'Version', 'Error Code', 'Note'
-                    ]
+                # 跳過前3行空行，第4行是標題，並重新命名為 8 個欄位
+                reference = reference or ReferenceWorkbook.shared(file_path, reader=self.reader)
+                self.reference_data = reference.ai_frame()
             
             self.reference_file_path = file_path
             logger.info(f"成功載入參考資料: {file_path}")
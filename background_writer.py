@@ -0,0 +1,101 @@
+"""
+背景寫檔模組
+以單一背景執行緒依序執行寫檔工作，呼叫端送出後即可繼續下一個階段（例如下一個工作表的 AI 推薦）；
+佇列有上限，寫檔跟不上時送出端會等待，記憶體中待寫入的結果數量有限。
+每個工作以 concurrent.futures.Future 回報結果或錯誤，介面可用 add_done_callback 等待完成而不凍結
+"""
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 佇列中最多等待的寫檔工作數
+WRITE_QUEUE_SIZE = 4
+
+
+class BackgroundWriter:
+    """依送出順序執行寫檔工作的背景執行緒（第一次送出時啟動）"""
+
+    def __init__(self, max_pending: int = WRITE_QUEUE_SIZE,
+                 on_change: Optional[Callable[[int], None]] = None):
+        """
+        Args:
+            max_pending: 佇列上限
+            on_change: 未完成工作數變更時呼叫（參數為未完成工作數，可能在背景執行緒呼叫）
+        """
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pending = 0
+        self.on_change = on_change
+
+    @property
+    def pending(self) -> int:
+        """已送出但尚未完成的工作數"""
+        return self._pending
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """
+        送出寫檔工作，佇列已滿時等待
+
+        Returns:
+            Future: 完成時為 func 的回傳值，失敗時為 func 拋出的例外
+        """
+        future: Future = Future()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="background-writer", daemon=True)
+                self._thread.start()
+            self._pending += 1
+        self._notify()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def wait(self):
+        """等待所有已送出的工作完成"""
+        self._queue.join()
+
+    def shutdown(self, wait: bool = True):
+        """停止背景執行緒（wait 時先完成佇列中的工作）"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return
+        self._queue.put(None)
+        if wait:
+            thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            future, func, args, kwargs = item
+            result, error = None, None
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = func(*args, **kwargs)
+                except BaseException as e:
+                    logger.error(f"背景寫檔時發生錯誤: {str(e)}")
+                    error = e
+            # 先更新未完成數再設定結果，完成回呼看到的狀態已不含此工作
+            with self._lock:
+                self._pending -= 1
+            self._notify()
+            if error is not None:
+                future.set_exception(error)
+            elif future.running():
+                future.set_result(result)
+            self._queue.task_done()
+
+    def _notify(self):
+        if self.on_change is not None:
+            try:
+                self.on_change(self._pending)
+            except Exception as e:
+                logger.warning(f"更新寫檔狀態時發生錯誤: {e}")
@@ -0,0 +1,143 @@
+"""
+資料夾批次比對模組
+將資料夾中每個 TestFlow 檔案與同一份 Test Item Code 比對：參考資料與 TestID 索引在主程序建立一次，
+透過 ProcessPoolExecutor 的 initializer 傳給每個工作程序（每個程序只接收一次），
+每個來源檔案輸出一個 _compare_ERRORCODE.xlsx，最後輸出 compare_summary.xlsx 彙總
+"""
+import os
+import time
+import logging
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Optional, Callable
+from excel_handler import ExcelHandler, filter_station_sheets, FOUND_COLUMN
+from compare_pipeline import output_path_for
+from excel_reader import get_reader
+from file_finder import FileFinder
+from reference_workbook import ReferenceWorkbook
+from testid_index import TestIDIndex
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FILE_NAME = "compare_summary.xlsx"
+
+# 工作程序內的共用狀態（由 _init_worker 設定）
+_worker_state: Dict[str, object] = {}
+
+
+def _init_worker(testid_index: TestIDIndex, df_output: pd.DataFrame, engine: str,
+                 not_found_text: str, not_found_cn_text: str, handler_options: Dict[str, object],
+                 reference_path: Optional[str] = None):
+    """工作程序初始化：保存參考資料與讀取引擎、輸出設定，之後每個檔案都直接使用"""
+    _worker_state['handler'] = ExcelHandler(get_reader(engine), **handler_options)
+    _worker_state['reference_path'] = reference_path
+    _worker_state['testid_index'] = testid_index
+    _worker_state['output'] = df_output
+    _worker_state['not_found'] = (not_found_text, not_found_cn_text)
+
+
+def compare_workbook(source_path: str) -> Dict[str, object]:
+    """
+    比對單一來源檔案的所有測站工作表並輸出結果（在工作程序中執行）
+
+    Returns:
+        Dict[str, object]: 彙總資訊（檔案、輸出、工作表數、行數、查無說明數、錯誤訊息、耗時）
+    """
+    start = time.perf_counter()
+    handler: ExcelHandler = _worker_state['handler']
+    not_found_text, not_found_cn_text = _worker_state['not_found']
+    summary = {
+        'file': os.path.basename(source_path),
+        'output': '',
+        'sheets': 0,
+        'rows': 0,
+        'not_found': 0,
+        'skipped_sheets': '',
+        'error': '',
+        'seconds': 0.0,
+    }
+    try:
+        sheets = filter_station_sheets(handler.get_sheet_names(source_path))
+        # 檔案之間已平行處理，工作表在程序內依序讀取
+        sources = handler.load_source_sheets(source_path, sheets, max_workers=1)
+        results = {}
+        skipped = []
+        for sheet_name, df_source in sources.items():
+            df_merge = None
+            if df_source is not None:
+                df_merge = handler.build_compare_result(
+                    df_source, _worker_state['testid_index'], not_found_text, not_found_cn_text
+                )
+            if df_merge is None:
+                skipped.append(sheet_name)
+                continue
+            results[sheet_name] = df_merge
+        summary['skipped_sheets'] = ', '.join(skipped)
+        if not results:
+            summary['error'] = "沒有可比對的工作表（找不到 Description 或 TestID 欄位）"
+        else:
+            output_path = output_path_for(source_path)
+            if handler.save_results(results, _worker_state['output'], output_path,
+                                    reference_path=_worker_state['reference_path']):
+                summary['output'] = os.path.basename(handler.output_file(output_path))
+            else:
+                summary['error'] = "儲存結果失敗"
+            summary['sheets'] = len(results)
+            summary['rows'] = sum(len(df) for df in results.values())
+            summary['not_found'] = sum(int((~df[FOUND_COLUMN]).sum()) for df in results.values())
+    except Exception as e:
+        summary['error'] = str(e)
+    summary['seconds'] = round(time.perf_counter() - start, 2)
+    return summary
+
+
+def compare_directory(directory: str, reference: ReferenceWorkbook, not_found_text: str,
+                      not_found_cn_text: str, max_workers: Optional[int] = None,
+                      progress_callback: Optional[Callable[[int, int, str], None]] = None,
+                      handler_options: Optional[Dict[str, object]] = None) -> Optional[str]:
+    """
+    以多程序比對資料夾中的所有 TestFlow 檔案，並輸出彙總檔
+
+    Args:
+        directory: 來源檔案所在資料夾
+        reference: 已解析的參考檔案
+        not_found_text: 查無說明時的文字
+        not_found_cn_text: 查無中文說明時的文字
+        max_workers: 工作程序數，None 或 0 為 CPU 核心數
+        progress_callback: 進度回呼 (完成數, 總數, 訊息)
+        handler_options: 工作程序 ExcelHandler 的輸出設定（見 ExcelHandler.output_options，省略時為預設值）
+
+    Returns:
+        Optional[str]: 彙總檔路徑，沒有來源檔案或失敗時為 None
+    """
+    try:
+        files = FileFinder.find_source_files(directory)
+        if not files:
+            logger.warning(f"{directory} 中沒有可比對的 Excel 檔案")
+            return None
+        workers = min(max_workers or os.cpu_count() or 1, len(files))
+        logger.info(f"資料夾批次比對: {len(files)} 個檔案，{workers} 個工作程序")
+
+        init_args = (reference.testid_index(), reference.output_frame(), reference.reader.name,
+                     not_found_text, not_found_cn_text, handler_options or {}, reference.file_path)
+        summaries: List[Dict[str, object]] = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as executor:
+            futures = {executor.submit(compare_workbook, path): path for path in files}
+            for done, future in enumerate(as_completed(futures), start=1):
+                summary = future.result()
+                summaries.append(summary)
+                if summary['error']:
+                    logger.error(f"比對 {summary['file']} 失敗: {summary['error']}")
+                if progress_callback:
+                    progress_callback(done, len(files), f"已完成 {done}/{len(files)}: {summary['file']}")
+
+        # 彙總依檔名排序輸出
+        summary_path = os.path.join(directory, SUMMARY_FILE_NAME)
+        df_summary = pd.DataFrame(sorted(summaries, key=lambda s: s['file']))
+        df_summary.insert(0, 'reference', os.path.basename(reference.file_path))
+        df_summary.to_excel(summary_path, index=False, sheet_name='Summary')
+        logger.info(f"資料夾批次比對完成，彙總檔: {summary_path}")
+        return summary_path
+    except Exception as e:
+        logger.error(f"資料夾批次比對時發生錯誤: {str(e)}")
+        return None
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+效能量測工具
+量測 Excel 讀取引擎等處理步驟的速度，預設使用 EXCEL 目錄中的檔案
+
+用法:
+    python benchmark.py engines [--dir EXCEL] [--repeat 3]
+    python benchmark.py compare [--ref "EXCEL/Test Item Code V2.00_20241106.xlsx"] [--rows 1000 10000 100000]
+    python benchmark.py write [--dir EXCEL] [--ref ...] [--repeat 3] [--write-engine openpyxl|xlsxwriter] [--reference-sheet full|used]
+                              [--export csv|parquet|jsonl [--export-only]]
+    python benchmark.py parity [--dir EXCEL] [--ref ...]
+    python benchmark.py background [--dir EXCEL] [--ref ...] [--repeat 3] [--rows 20] [--write-engine openpyxl|xlsxwriter]
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+import logging
+import tempfile
+import warnings
+
+# 量測時不輸出各模組的 INFO 日誌
+logging.disable(logging.INFO)
+warnings.filterwarnings('ignore')
+
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+from excel_reader import READERS, get_reader
+from ai_recommendation_engine import AIRecommendationEngine
+from background_writer import BackgroundWriter
+from excel_handler import ExcelHandler, filter_station_sheets, REFERENCE_FULL, REFERENCE_USED
+from reference_workbook import ReferenceWorkbook
+from file_finder import FileFinder
+from result_export import EXPORT_FORMATS, parquet_available
+from styled_writer import HIGHLIGHT_STATIC, HIGHLIGHT_CONDITIONAL, DEFAULT_WRITE_ENGINE, WRITE_ENGINES
+
+DEFAULT_REFERENCE = os.path.join("EXCEL", "Test Item Code V2.00_20241106.xlsx")
+
+
+def _best_time(func, repeat):
+    """執行 repeat 次，回傳最短時間（秒）與最後一次的結果"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_engines(args):
+    """比較各讀取引擎讀取每個工作表的時間，並檢查結果是否與 openpyxl 相同"""
+    files = sorted(glob.glob(os.path.join(args.dir, "*.xlsx")))
+    if not files:
+        print(f"{args.dir} 中沒有 xlsx 檔案")
+        return 1
+    engines = [cls() for cls in READERS.values() if cls.is_available()]
+    skipped = [name for name, cls in READERS.items() if not cls.is_available()]
+    if skipped:
+        print(f"未安裝的引擎（略過）: {', '.join(skipped)}")
+
+    handler = ExcelHandler()
+    totals = {engine.name: 0.0 for engine in engines}
+    print(f"{'檔案 / 工作表':<60}" + "".join(f"{engine.name:>20}" for engine in engines))
+    for file_path in files:
+        for sheet_name in handler.get_sheet_names(file_path):
+            baseline = None
+            cells = []
+            for engine in engines:
+                elapsed, df = _best_time(lambda: engine.read_sheet(file_path, sheet_name), args.repeat)
+                totals[engine.name] += elapsed
+                mark = ""
+                if baseline is None:
+                    baseline = df
+                elif not df.equals(baseline):
+                    mark = "*"
+                cells.append(f"{elapsed * 1000:>17.1f}ms{mark or ' '}")
+            label = f"{os.path.basename(file_path)[:40]} / {sheet_name}"[:58]
+            print(f"{label:<60}" + "".join(cells))
+    print("-" * (60 + 20 * len(engines)))
+    print(f"{'總計':<60}" + "".join(f"{totals[e.name] * 1000:>17.1f}ms " for e in engines))
+    print("* 表示結果與第一個引擎不同")
+    return 0
+
+
+def _loop_compare_data(handler, df_source, not_found_text, not_found_cn_text):
+    """原本的 compare_data：iterrows 逐列 str().strip() 後查字典（作為量測基準）"""
+    df_result = df_source[['Description', 'TestID']].copy()
+    df_result.columns = ['你的 description', '你寫的 Error Code']
+    cd_list = []
+    ce_list = []
+    for idx, row in df_result.iterrows():
+        test_id = str(row['你寫的 Error Code']).strip()
+        if test_id in handler.error_code_map:
+            description, chinese_desc = handler.error_code_map[test_id]
+            cd_list.append(description)
+            ce_list.append(chinese_desc)
+        else:
+            cd_list.append(not_found_text)
+            ce_list.append(not_found_cn_text)
+    df_result['Test Item 文件的 description'] = cd_list
+    df_result['Test Item 的 Error Code'] = ce_list
+    return df_result
+
+
+def bench_compare(args):
+    """比較 compare_data 向量化版本與原本逐列迴圈在不同行數下的吞吐量（行/秒）"""
+    reference = ReferenceWorkbook(args.ref)
+    handler = ExcelHandler()
+    handler.load_error_codes(args.ref, reference)
+    testids = reference.merge_frame()['TestID'].dropna()
+    testids = testids[testids.astype(str).str.strip() != '']
+
+    print(f"{'行數':>10}{'迴圈 (行/秒)':>20}{'向量化 (行/秒)':>20}{'倍數':>10}")
+    for rows in args.rows:
+        # 約九成可查到、一成查無資料的來源欄位
+        sample = testids.sample(rows, replace=True, random_state=0).reset_index(drop=True)
+        sample[sample.index % 10 == 0] = 'NOT_EXIST'
+        df_source = pd.DataFrame({'Description': [f"desc {i}" for i in range(rows)], 'TestID': sample})
+
+        loop_time, loop_result = _best_time(
+            lambda: _loop_compare_data(handler, df_source, '查無說明', '查無中文說明'), args.repeat)
+        vector_time, vector_result = _best_time(
+            lambda: handler.compare_data(df_source, '查無說明', '查無中文說明'), args.repeat)
+        found_same = (
+            (loop_result['Test Item 文件的 description'] == '查無說明')
+            == (vector_result['Test Item 文件的 description'] == '查無說明')
+        ).all()
+        mark = "" if found_same else "  *"
+        print(f"{rows:>10}{rows / loop_time:>20,.0f}{rows / vector_time:>20,.0f}{loop_time / vector_time:>9.1f}x{mark}")
+    print("* 表示兩種方式查到的列不同")
+    return 0
+
+
+def _sample_results(handler, file_path):
+    """範例檔案所有測站工作表的比對結果，AI 推薦欄位以固定內容代替（只量測寫檔）"""
+    sheets = filter_station_sheets(handler.get_sheet_names(file_path))
+    results = {}
+    for sheet_name, df_source in handler.load_source_sheets(file_path, sheets).items():
+        df_result = None
+        if df_source is not None:
+            df_result = handler.build_compare_result(df_source, handler.testid_index, '查無說明', '查無中文說明')
+        if df_result is not None:
+            results[sheet_name] = df_result
+    recommendations = {
+        sheet_name: [(str(tid), '推薦說明') for tid in df_result['你寫的 Error Code']]
+        for sheet_name, df_result in results.items()
+    }
+    return results, recommendations
+
+
+def bench_write(args):
+    """量測範例檔案所有測站工作表的比對結果（含 AI 推薦欄位與 Test Item All 反白）寫檔時間與檔案大小"""
+    files = FileFinder.find_source_files(args.dir)
+    if not files:
+        print(f"{args.dir} 中沒有 TestFlow 檔案")
+        return 1
+    if not WRITE_ENGINES[args.write_engine].is_available():
+        print(f"寫檔引擎 {args.write_engine} 未安裝")
+        return 1
+    reference = ReferenceWorkbook(args.ref)
+    if args.export == 'parquet' and not parquet_available():
+        print("Parquet 匯出需要安裝 pyarrow")
+        return 1
+    handler = ExcelHandler(highlight_mode=args.highlight, write_engine=args.write_engine,
+                           reference_sheet=args.reference_sheet, export_format=args.export,
+                           export_only=args.export_only)
+    handler.load_error_codes(args.ref, reference)
+    df_output = reference.output_frame()
+
+    print(f"寫檔引擎: {args.write_engine}，反白方式: {args.highlight}，參考工作表: {args.reference_sheet}，"
+          f"匯出: {args.export or '無'}{'（只輸出匯出檔）' if handler.export_only else ''}")
+    print(f"{'檔案':<50}{'工作表':>8}{'行數':>8}{'寫檔時間':>14}{'檔案大小':>14}")
+    total_time = 0.0
+    with tempfile.TemporaryDirectory() as tmp:
+        for file_path in files:
+            results, recommendations = _sample_results(handler, file_path)
+            output_path = os.path.join(tmp, os.path.basename(file_path))
+            elapsed, ok = _best_time(
+                lambda: handler.save_results(results, df_output, output_path, recommendations), args.repeat)
+            if not ok:
+                print(f"{os.path.basename(file_path)} 寫檔失敗")
+                return 1
+            total_time += elapsed
+            rows = sum(len(df) for df in results.values())
+            size = os.path.getsize(handler.output_file(output_path))
+            print(f"{os.path.basename(file_path)[:48]:<50}{len(results):>8}{rows:>8}"
+                  f"{elapsed * 1000:>12.1f}ms{size / 1024:>12.1f}KB")
+    print(f"{'總計':<50}{'':>16}{total_time * 1000:>12.1f}ms")
+    return 0
+
+
+def bench_background(args):
+    """
+    比較全部工作表比對的 AI 推薦與寫檔：依序執行（全部推薦完才寫檔）與背景寫檔（每個工作表推薦完成即寫入）
+
+    範例檔案的所有測站工作表合併成一個活頁簿，每個工作表只取前 --rows 行（AI 推薦每行約需數秒）；
+    「比對執行緒」為比對執行緒被佔用的時間（背景寫檔時送出最後一個工作表即結束），「完成」為輸出檔寫完的時間
+    """
+    files = FileFinder.find_source_files(args.dir)
+    if not files:
+        print(f"{args.dir} 中沒有 TestFlow 檔案")
+        return 1
+    if not WRITE_ENGINES[args.write_engine].is_available():
+        print(f"寫檔引擎 {args.write_engine} 未安裝")
+        return 1
+    reference = ReferenceWorkbook(args.ref)
+    handler = ExcelHandler(write_engine=args.write_engine)
+    handler.load_error_codes(args.ref, reference)
+    engine = AIRecommendationEngine(get_reader('openpyxl'))
+    engine.load_reference_data(args.ref, reference)
+    df_output = reference.output_frame()
+    results = {}
+    for index, file_path in enumerate(files):
+        for sheet_name, df_result in _sample_results(handler, file_path)[0].items():
+            results[f"{index}_{sheet_name}"[:31]] = df_result.head(args.rows)
+
+    def recommend(df_result):
+        return engine.generate_recommendations_with_search(df_result['你的 description'].fillna('').astype(str).tolist())
+
+    def sequential(output_path):
+        start = time.perf_counter()
+        recommendations = {sheet_name: recommend(df_result) for sheet_name, df_result in results.items()}
+        handler.save_results(results, df_output, output_path, recommendations)
+        elapsed = time.perf_counter() - start
+        return elapsed, elapsed
+
+    def background(output_path):
+        writer = BackgroundWriter()
+        start = time.perf_counter()
+        result_file = handler.open_results(output_path)
+        for sheet_name, df_result in results.items():
+            writer.submit(result_file.add, sheet_name, df_result, recommend(df_result))
+        future = writer.submit(result_file.close, df_output)
+        busy = time.perf_counter() - start
+        future.result()
+        elapsed = time.perf_counter() - start
+        writer.shutdown()
+        return busy, elapsed
+
+    rows = sum(len(df) for df in results.values())
+    print(f"寫檔引擎: {args.write_engine}，{len(results)} 個工作表共 {rows} 行（含 AI 推薦）")
+    print(f"{'方式':<20}{'比對執行緒':>14}{'完成':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, run in (("依序執行", sequential), ("背景寫檔", background)):
+            best = None
+            for _ in range(max(1, args.repeat)):
+                timing = run(os.path.join(tmp, f"{label}.xlsx"))
+                best = timing if best is None or timing[1] < best[1] else best
+            print(f"{label:<20}{best[0] * 1000:>12.1f}ms{best[1] * 1000:>12.1f}ms")
+    return 0
+
+
+def _cell_format(cell):
+    """比較用的儲存格內容與格式（填色只比較 RGB：openpyxl 與 xlsxwriter 寫入的 alpha 不同，Excel 不使用）"""
+    fill = cell.fill.fgColor.rgb if cell.fill.fill_type else None
+    border = tuple(getattr(cell.border, side).style for side in ('left', 'right', 'top', 'bottom'))
+    return (cell.value, cell.font.name, cell.font.sz, bool(cell.font.b), cell.fill.fill_type,
+            fill[-6:] if isinstance(fill, str) else fill, border, cell.alignment.horizontal, cell.alignment.vertical)
+
+
+def _column_widths(ws):
+    """欄號 -> 欄寬（xlsxwriter 會把相同寬度的相鄰欄合併成一個範圍）"""
+    widths = {}
+    for dimension in ws.column_dimensions.values():
+        if dimension.width and dimension.min:
+            for index in range(dimension.min, dimension.max + 1):
+                widths[index] = dimension.width
+    return widths
+
+
+def _compare_outputs(expected_path, actual_path):
+    """逐一比較兩個輸出檔的工作表、儲存格內容與格式、欄寬、凍結窗格與條件式格式，回傳差異說明"""
+    expected, actual = load_workbook(expected_path), load_workbook(actual_path)
+    if expected.sheetnames != actual.sheetnames:
+        return [f"工作表不同: {expected.sheetnames} / {actual.sheetnames}"]
+    differences = []
+    for ws_expected in expected.worksheets:
+        ws_actual = actual[ws_expected.title]
+        title = ws_expected.title
+        if ws_expected.sheet_state != ws_actual.sheet_state:
+            differences.append(f"{title}: 顯示狀態 {ws_expected.sheet_state} / {ws_actual.sheet_state}")
+        if ws_expected.freeze_panes != ws_actual.freeze_panes:
+            differences.append(f"{title}: 凍結窗格 {ws_expected.freeze_panes} / {ws_actual.freeze_panes}")
+        if (ws_expected.max_row, ws_expected.max_column) != (ws_actual.max_row, ws_actual.max_column):
+            differences.append(f"{title}: 大小 {ws_expected.max_row}x{ws_expected.max_column} / "
+                               f"{ws_actual.max_row}x{ws_actual.max_column}")
+        widths_expected, widths_actual = _column_widths(ws_expected), _column_widths(ws_actual)
+        for index in sorted(set(widths_expected) | set(widths_actual)):
+            # xlsxwriter 以像素為單位記錄欄寬，容許 1 像素（1/7 字元）誤差
+            if abs(widths_expected.get(index, 0) - widths_actual.get(index, 0)) > 1 / 7 + 1 / 256:
+                differences.append(f"{title}: {get_column_letter(index)} 欄寬 "
+                                   f"{widths_expected.get(index)} / {widths_actual.get(index)}")
+        rules = [
+            sorted((str(cf.sqref), tuple(f for rule in cf.rules for f in rule.formula)) for cf in ws.conditional_formatting)
+            for ws in (ws_expected, ws_actual)
+        ]
+        if rules[0] != rules[1]:
+            differences.append(f"{title}: 條件式格式 {rules[0]} / {rules[1]}")
+        for row_expected, row_actual in zip(ws_expected.iter_rows(), ws_actual.iter_rows()):
+            for cell_expected, cell_actual in zip(row_expected, row_actual):
+                if _cell_format(cell_expected) != _cell_format(cell_actual):
+                    differences.append(f"{title}!{cell_expected.coordinate}: "
+                                       f"{_cell_format(cell_expected)} / {_cell_format(cell_actual)}")
+    return differences
+
+
+def bench_parity(args):
+    """以各寫檔引擎寫出範例檔案的比對結果，與 openpyxl 的輸出逐格比較內容與格式"""
+    files = FileFinder.find_source_files(args.dir)
+    if not files:
+        print(f"{args.dir} 中沒有 TestFlow 檔案")
+        return 1
+    engines = [name for name, book in WRITE_ENGINES.items() if name != DEFAULT_WRITE_ENGINE and book.is_available()]
+    skipped = [name for name, book in WRITE_ENGINES.items() if not book.is_available()]
+    if skipped:
+        print(f"未安裝的寫檔引擎（略過）: {', '.join(skipped)}")
+    if not engines:
+        return 1
+    reference = ReferenceWorkbook(args.ref)
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for highlight_mode in (HIGHLIGHT_STATIC, HIGHLIGHT_CONDITIONAL):
+            handlers = {name: ExcelHandler(highlight_mode=highlight_mode, write_engine=name)
+                        for name in [DEFAULT_WRITE_ENGINE] + engines}
+            for handler in handlers.values():
+                handler.load_error_codes(args.ref, reference)
+            for file_path in files:
+                results, recommendations = _sample_results(handlers[DEFAULT_WRITE_ENGINE], file_path)
+                paths = {}
+                for name, handler in handlers.items():
+                    paths[name] = os.path.join(tmp, f"{name}_{os.path.basename(file_path)}")
+                    handler.save_results(results, reference.output_frame(), paths[name], recommendations)
+                for name in engines:
+                    differences = _compare_outputs(paths[DEFAULT_WRITE_ENGINE], paths[name])
+                    status = "相同" if not differences else f"{len(differences)} 處不同"
+                    print(f"{os.path.basename(file_path)[:48]:<50}{name:>12}{highlight_mode:>14}  {status}")
+                    for difference in differences[:10]:
+                        print(f"    {difference}")
+                    failed = failed or bool(differences)
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Error Code Comparer 效能量測工具")
+    sub = parser.add_subparsers(dest="command")
+
+    p_engines = sub.add_parser("engines", help="比較 Excel 讀取引擎")
+    p_engines.add_argument("--dir", default="EXCEL", help="要量測的 xlsx 檔案目錄")
+    p_engines.add_argument("--repeat", type=int, default=3, help="每項量測重複次數（取最短時間）")
+    p_engines.set_defaults(func=bench_engines)
+
+    p_compare = sub.add_parser("compare", help="比較 compare_data 向量化與逐列迴圈的吞吐量")
+    p_compare.add_argument("--ref", default=DEFAULT_REFERENCE, help="Test Item Code 參考檔案")
+    p_compare.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000], help="來源行數")
+    p_compare.add_argument("--repeat", type=int, default=3, help="每項量測重複次數（取最短時間）")
+    p_compare.set_defaults(func=bench_compare)
+
+    p_write = sub.add_parser("write", help="量測比對結果寫檔時間與檔案大小")
+    p_write.add_argument("--dir", default="EXCEL", help="TestFlow 範例檔案目錄")
+    p_write.add_argument("--ref", default=DEFAULT_REFERENCE, help="Test Item Code 參考檔案")
+    p_write.add_argument("--repeat", type=int, default=3, help="每項量測重複次數（取最短時間）")
+    p_write.add_argument("--highlight", choices=[HIGHLIGHT_STATIC, HIGHLIGHT_CONDITIONAL], default=HIGHLIGHT_STATIC,
+                         help="Test Item All 反白方式")
+    p_write.add_argument("--write-engine", choices=sorted(WRITE_ENGINES), default=DEFAULT_WRITE_ENGINE,
+                         help="輸出檔寫檔引擎")
+    p_write.add_argument("--reference-sheet", choices=[REFERENCE_FULL, REFERENCE_USED], default=REFERENCE_FULL,
+                         help="輸出檔的參考工作表")
+    p_write.add_argument("--export", choices=sorted(EXPORT_FORMATS), help="另存不含格式的比對結果")
+    p_write.add_argument("--export-only", action="store_true", help="只輸出匯出檔（量測匯出檔大小）")
+    p_write.set_defaults(func=bench_write)
+
+    p_parity = sub.add_parser("parity", help="逐格比較各寫檔引擎與 openpyxl 輸出的內容與格式")
+    p_parity.add_argument("--dir", default="EXCEL", help="TestFlow 範例檔案目錄")
+    p_parity.add_argument("--ref", default=DEFAULT_REFERENCE, help="Test Item Code 參考檔案")
+    p_parity.set_defaults(func=bench_parity)
+
+    p_background = sub.add_parser("background", help="比較全部工作表比對時依序寫檔與背景寫檔的時間")
+    p_background.add_argument("--dir", default="EXCEL", help="TestFlow 範例檔案目錄")
+    p_background.add_argument("--ref", default=DEFAULT_REFERENCE, help="Test Item Code 參考檔案")
+    p_background.add_argument("--repeat", type=int, default=3, help="每項量測重複次數（取最短時間）")
+    p_background.add_argument("--rows", type=int, default=20, help="每個工作表的行數")
+    p_background.add_argument("--write-engine", choices=list(WRITE_ENGINES), default=DEFAULT_WRITE_ENGINE,
+                              help="寫檔引擎")
+    p_background.set_defaults(func=bench_background)
+
+    args = parser.parse_args()
+    if not hasattr(args, "func"):
+        parser.print_help()
+        return 1
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
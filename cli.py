@@ -0,0 +1,119 @@
+"""
+命令列比對模組
+提供不需要視窗介面的比對入口（python main.py compare ...），供建置伺服器或排程使用；
+只載入 Excel/比對/AI 模組，不會載入 tkinter、ttkbootstrap 或 PIL
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+from typing import List, Optional
+from config_manager import ConfigManager
+from excel_handler import ExcelHandler, REFERENCE_FULL, REFERENCE_USED, FOUND_COLUMN
+from excel_reader import get_reader, get_reader_from_config, READERS
+from reference_cache import ReferenceCache
+from ai_recommendation_engine import AIRecommendationEngine
+from compare_pipeline import ComparePipeline, CompareError, output_path_for
+from stream_compare import should_stream
+from result_export import EXPORT_FORMATS, parquet_available
+from styled_writer import HIGHLIGHT_STATIC, DEFAULT_WRITE_ENGINE, WRITE_ENGINES
+
+logger = logging.getLogger(__name__)
+
+# 結束代碼：全部 TestID 都找到說明 / 有查無說明的 TestID / 參數、檔案或比對錯誤
+EXIT_OK = 0
+EXIT_MISMATCH = 1
+EXIT_ERROR = 2
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="main.py", description="Error Code 比對工具（命令列模式）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compare = subparsers.add_parser(
+        "compare", help="比對單一工作表並輸出 _compare_ERRORCODE.xlsx",
+        description=f"結束代碼：{EXIT_OK} 全部找到、{EXIT_MISMATCH} 有查無說明的 TestID、{EXIT_ERROR} 錯誤"
+    )
+    compare.add_argument("--ref", required=True, help="Test Item Code 參考檔案")
+    compare.add_argument("--src", required=True, help="來源 TestFlow Excel 檔案")
+    compare.add_argument("--sheet", required=True, help="要比對的工作表名稱")
+    compare.add_argument("--out", help="輸出檔案路徑（預設為來源檔案旁的 <檔名>_compare_ERRORCODE.xlsx，已存在時直接覆蓋）")
+    compare.add_argument("--ai", action="store_true", help="同時寫入 AI 推薦欄位")
+    compare.add_argument("--engine", choices=["auto"] + sorted(READERS), help="Excel 讀取引擎（預設依 setup.txt）")
+    compare.add_argument("--write-engine", choices=sorted(WRITE_ENGINES), help="輸出檔寫檔引擎（預設依 setup.txt）")
+    compare.add_argument("--reference-sheet", choices=[REFERENCE_FULL, REFERENCE_USED],
+                         help="輸出檔的參考工作表：full 完整 Test Item All 副本、used 只含引用到的行（預設依 setup.txt）")
+    compare.add_argument("--export", choices=sorted(EXPORT_FORMATS),
+                         help="另存不含格式的比對結果（csv / parquet / jsonl，預設依 setup.txt）")
+    compare.add_argument("--export-only", action="store_true", help="只輸出 --export 的匯出檔，不寫入 xlsx")
+    compare.add_argument("--not-found", help="查無說明時的文字（預設依 setup.txt）")
+    compare.add_argument("--not-found-cn", help="查無中文說明時的文字（預設依 setup.txt）")
+    compare.add_argument("-v", "--verbose", action="store_true", help="顯示詳細日誌")
+    return parser
+
+
+def run_compare(args: argparse.Namespace) -> int:
+    """執行 compare 子命令，回傳結束代碼"""
+    start = time.perf_counter()
+    config_manager = ConfigManager()
+    for path in (args.ref, args.src):
+        if not os.path.isfile(path):
+            print(f"找不到檔案: {path}", file=sys.stderr)
+            return EXIT_ERROR
+    reader = get_reader(args.engine) if args.engine else get_reader_from_config(config_manager)
+    excel_handler = ExcelHandler(
+        reader, highlight_mode=config_manager.get('HighlightMode', HIGHLIGHT_STATIC),
+        write_engine=args.write_engine or config_manager.get('WriteEngine', DEFAULT_WRITE_ENGINE),
+        reference_sheet=args.reference_sheet or config_manager.get('ReferenceSheet', REFERENCE_FULL),
+        export_format=args.export or config_manager.get('ExportFormat', ''),
+        export_only=args.export_only or config_manager.get('ExportOnly', '0') == '1'
+    )
+    if excel_handler.export_format == 'parquet' and not parquet_available():
+        print("Parquet 匯出需要安裝 pyarrow", file=sys.stderr)
+        return EXIT_ERROR
+    if args.export_only and not excel_handler.export_format:
+        print("--export-only 需要同時指定匯出格式（--export 或 setup.txt 的 ExportFormat）", file=sys.stderr)
+        return EXIT_ERROR
+    if args.sheet not in excel_handler.get_sheet_names(args.src):
+        print(f"來源檔案沒有工作表: {args.sheet}", file=sys.stderr)
+        return EXIT_ERROR
+    pipeline = ComparePipeline(
+        excel_handler, AIRecommendationEngine(reader), reader,
+        cache=ReferenceCache.from_config(config_manager),
+        fast_parser=config_manager.get('ReferenceFastParser', '1') == '1'
+    )
+    not_found = args.not_found or config_manager.get('NotFound')
+    not_found_cn = args.not_found_cn or config_manager.get('NotFoundCN')
+    output_path = args.out or output_path_for(args.src)
+    try:
+        pipeline.load_reference(args.ref)
+        min_rows = int(config_manager.get('StreamCompareMinRows', '200000'))
+        if should_stream(args.src, args.sheet, min_rows):
+            if args.ai:
+                logger.warning("工作表行數眾多，改用串流比對，不執行 AI 推薦")
+            rows, missing = pipeline.stream(args.ref, args.src, args.sheet, output_path, not_found, not_found_cn,
+                                            int(config_manager.get('StreamChunkRows', '50000')))
+        else:
+            df_result = pipeline.match(args.ref, args.src, args.sheet, output_path, not_found, not_found_cn)
+            pipeline.write(args.ref, args.src, args.sheet, output_path, not_found, not_found_cn, with_ai=args.ai)
+            rows = len(df_result)
+            missing = int((~df_result[FOUND_COLUMN]).sum())
+    except CompareError as e:
+        print(str(e), file=sys.stderr)
+        return EXIT_ERROR
+    print(f"{args.sheet}: {rows} 行，查無說明 {missing} 行，耗時 {time.perf_counter() - start:.2f} 秒，"
+          f"輸出 {excel_handler.output_file(output_path)}")
+    return EXIT_MISMATCH if missing else EXIT_OK
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令列進入點，回傳結束代碼"""
+    args = build_parser().parse_args(argv)
+    # config_manager 匯入時已設定 INFO 等級的日誌，命令列預設只顯示警告
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    try:
+        if args.command == "compare":
+            return run_compare(args)
+    except Exception as e:
+        logger.error(f"命令列比對時發生錯誤: {str(e)}")
+    return EXIT_ERROR
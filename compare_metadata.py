@@ -0,0 +1,100 @@
+"""
+比對結果中繼資料模組
+在 _compare_ERRORCODE.xlsx 中以隱藏工作表記錄每個來源列的指紋與參考檔案雜湊，
+重新比對時未變更的列直接沿用上次的比對結果與 AI 推薦，只重新處理變更或新增的列
+"""
+import os
+import logging
+import pandas as pd
+from openpyxl import load_workbook
+from typing import Optional, List
+
+logger = logging.getLogger(__name__)
+
+META_SHEET_NAME = "_compare_meta"
+# 中繼資料格式版本，格式變更時遞增使舊輸出不再沿用
+META_VERSION = 1
+
+KEY_COLUMNS = ['你的 description', '你寫的 Error Code']
+MATCH_COLUMNS = ['Test Item 文件的 description', 'Test Item 的 Error Code']
+AI_COLUMNS = ['AI推薦 test ID', 'AI推薦 中文']
+# 比對結果附帶的狀態欄位（依 TestID 索引判斷是否找到說明、中文說明；不寫入輸出工作表）
+FOUND_COLUMN = 'Found'
+CHINESE_FOUND_COLUMN = 'HasChinese'
+FLAG_COLUMNS = [FOUND_COLUMN, CHINESE_FOUND_COLUMN]
+
+
+def row_fingerprints(df_result: pd.DataFrame) -> pd.Series:
+    """每列 (你的 description, 你寫的 Error Code) 的 64 位元雜湊（十六進位字串）"""
+    hashes = pd.util.hash_pandas_object(df_result[KEY_COLUMNS], index=False)
+    return pd.Series([format(h, '016x') for h in hashes], index=df_result.index, dtype=object)
+
+
+def build_metadata(df_result: pd.DataFrame, sheet_name: str, reference_sha256: str, settings: str) -> pd.DataFrame:
+    """
+    建立中繼資料表：每列一個指紋，版本、參考檔案雜湊與設定只寫在第一列
+
+    Args:
+        df_result: 比對結果（含 KEY_COLUMNS）
+        sheet_name: 比對的工作表名稱
+        reference_sha256: 參考檔案內容的 SHA-256
+        settings: 影響比對結果的設定（查無說明文字等）
+    """
+    rows = len(df_result)
+    header = [''] * max(rows - 1, 0)
+    return pd.DataFrame({
+        'sheet': [sheet_name] * rows,
+        'fingerprint': row_fingerprints(df_result).tolist(),
+        'version': [META_VERSION] + header if rows else [],
+        'reference_sha256': [reference_sha256] + header if rows else [],
+        'settings': [settings] + header if rows else [],
+    })
+
+
+def read_previous_results(output_path: str, sheet_name: str, reference_sha256: str,
+                          settings: str) -> Optional[pd.DataFrame]:
+    """
+    讀取上次輸出的比對結果，供未變更的列沿用
+
+    Returns:
+        Optional[pd.DataFrame]: 以指紋為索引的 MATCH_COLUMNS（有 AI 推薦時含 AI_COLUMNS）；
+        沒有輸出檔、沒有中繼資料，或參考檔案、設定、工作表不同時為 None
+    """
+    if not os.path.exists(output_path):
+        return None
+    try:
+        wb = load_workbook(output_path, read_only=True, data_only=True)
+        try:
+            if META_SHEET_NAME not in wb.sheetnames or sheet_name not in wb.sheetnames:
+                return None
+            meta_rows = list(wb[META_SHEET_NAME].iter_rows(min_row=2, values_only=True))
+            if not meta_rows:
+                return None
+            _, _, version, previous_sha, previous_settings = meta_rows[0][:5]
+            if version != META_VERSION or previous_sha != reference_sha256 or previous_settings != settings:
+                logger.info("參考檔案或設定已變更，不沿用上次比對結果")
+                return None
+            fingerprints = [row[1] for row in meta_rows if row[0] == sheet_name]
+            result_rows = wb[sheet_name].iter_rows(values_only=True)
+            headers = [str(v) if v is not None else '' for v in next(result_rows)]
+            values: List[tuple] = []
+            for row in result_rows:
+                if len(values) == len(fingerprints):
+                    break
+                values.append(row)
+        finally:
+            wb.close()
+        if len(values) != len(fingerprints) or not all(c in headers for c in MATCH_COLUMNS):
+            logger.info("上次輸出的列數與中繼資料不一致，不沿用上次比對結果")
+            return None
+        columns = MATCH_COLUMNS + [c for c in AI_COLUMNS if c in headers]
+        positions = [headers.index(c) for c in columns]
+        df_previous = pd.DataFrame(
+            [['' if row[p] is None else row[p] for p in positions] for row in values],
+            columns=columns, index=pd.Index(fingerprints, name='fingerprint'),
+        )
+        # 相同內容的列結果相同，保留第一筆
+        return df_previous[~df_previous.index.duplicated(keep='first')]
+    except Exception as e:
+        logger.warning(f"讀取上次比對結果失敗，改為完整比對: {e}")
+        return None
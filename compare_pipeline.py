@@ -0,0 +1,298 @@
+"""
+比對流程模組
+將單一工作表的比對拆成明確的階段：載入參考檔案 → 載入來源工作表 → 比對 →（AI 推薦）→ 寫檔，
+每個階段的結果依輸入指紋快取，重新執行時只重跑輸入有變更的階段
+（例如只換工作表時不重新載入參考檔案，只改覆蓋選項時不重新比對與寫檔）；
+輸出檔內的列指紋讓程式重新啟動後也能只處理變更或新增的列
+"""
+import os
+import logging
+from collections import OrderedDict
+import pandas as pd
+from pathlib import Path
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple, List
+from excel_handler import ExcelHandler
+from excel_reader import ExcelReader
+from reference_cache import ReferenceCache, file_sha256
+from reference_workbook import ReferenceWorkbook
+from ai_recommendation_engine import AIRecommendationEngine
+from background_writer import BackgroundWriter
+from stream_compare import STREAM_CHUNK_ROWS, stream_compare_sheet
+from compare_metadata import AI_COLUMNS, build_metadata, read_previous_results, row_fingerprints
+
+logger = logging.getLogger(__name__)
+
+# 每個階段保留的最近結果數（例如在幾個工作表之間切換時都能沿用）
+STAGE_MEMO_SIZE = 4
+
+
+class CompareError(Exception):
+    """比對流程無法繼續（訊息可直接顯示給使用者）"""
+
+
+def file_fingerprint(file_path: str) -> Tuple[str, int, int]:
+    """檔案指紋（絕對路徑、大小、修改時間）"""
+    stat = os.stat(file_path)
+    return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
+
+
+def output_path_for(source_path: str) -> str:
+    """比對結果路徑：與來源檔案放在同一目錄，檔名加上 _compare_ERRORCODE"""
+    return str(Path(source_path).with_name(f"{Path(source_path).stem}_compare_ERRORCODE.xlsx"))
+
+
+class ComparePipeline:
+    """單一工作表比對流程，各階段依輸入指紋快取最近的結果"""
+
+    def __init__(self, excel_handler: ExcelHandler, ai_engine: AIRecommendationEngine,
+                 reader: ExcelReader, cache: Optional[ReferenceCache] = None, fast_parser: bool = False):
+        self.excel_handler = excel_handler
+        self.ai_engine = ai_engine
+        self.reader = reader
+        self.cache = cache
+        self.fast_parser = fast_parser
+        # 階段名稱 -> {輸入指紋: 結果}（依使用順序，超過 STAGE_MEMO_SIZE 時移除最舊的）
+        self._memo: Dict[str, OrderedDict] = {}
+        # 輸出檔案 -> (比對指紋, 是否已寫入 AI 推薦, 寫入後的檔案指紋)
+        self._outputs: Dict[str, Tuple[tuple, bool, tuple]] = {}
+        # 輸出檔案 -> 尚未確認完成的背景寫檔 (比對指紋, 是否含 AI 推薦, Future, 寫入後的檔案指紋)；
+        # _outputs 與此表只在呼叫端執行緒存取，讀取或覆寫同一輸出檔前先等待寫檔完成
+        self._pending_writes: Dict[str, Tuple[Optional[tuple], bool, Future, Dict[str, tuple]]] = {}
+
+    def _run_stage(self, stage: str, fingerprint: tuple, compute: Callable[[], object]):
+        """輸入指紋與最近的結果相同時直接沿用，否則重新計算"""
+        memo = self._memo.setdefault(stage, OrderedDict())
+        if fingerprint in memo:
+            logger.debug(f"{stage} 階段輸入未變更，沿用上次結果")
+            memo.move_to_end(fingerprint)
+            return memo[fingerprint]
+        result = compute()
+        memo[fingerprint] = result
+        while len(memo) > STAGE_MEMO_SIZE:
+            memo.popitem(last=False)
+        return result
+
+    def _reference_fingerprint(self, reference_path: str) -> tuple:
+        return file_fingerprint(reference_path) + (self.reader.name, self.fast_parser)
+
+    def _match_fingerprint(self, reference_path: str, source_path: str, sheet_name: str, output_path: str,
+                           not_found_text: str, not_found_cn_text: str) -> tuple:
+        # 輸出檔案決定沿用哪一份上次結果，也是指紋的一部分
+        return (self._reference_fingerprint(reference_path), file_fingerprint(source_path), sheet_name,
+                os.path.abspath(output_path), not_found_text, not_found_cn_text)
+
+    def load_reference(self, reference_path: str) -> ReferenceWorkbook:
+        """階段一：載入參考檔案並建立錯誤碼字典與 TestID 索引"""
+        def compute():
+            reference = ReferenceWorkbook.shared(
+                reference_path, cache=self.cache, reader=self.reader, fast_parser=self.fast_parser
+            )
+            reference.testid_index()
+            return reference
+        reference = self._run_stage('reference', self._reference_fingerprint(reference_path), compute)
+        # 沿用快取時 ExcelHandler 可能仍指向其他參考檔案（各檢視已建立，重新指定不需重新解析）
+        if self.excel_handler.reference is not reference:
+            if not self.excel_handler.load_error_codes(reference_path, reference):
+                raise CompareError("載入錯誤碼檔案失敗")
+        return reference
+
+    def load_source(self, source_path: str, sheet_name: str) -> pd.DataFrame:
+        """階段二：串流載入來源工作表的 Description/TestID 欄位"""
+        def compute():
+            df_source = self.excel_handler.load_source_columns(source_path, sheet_name)
+            if df_source is None:
+                raise CompareError("載入來源工作表失敗")
+            return df_source
+        fingerprint = (file_fingerprint(source_path), sheet_name, self.reader.name)
+        return self._run_stage('source', fingerprint, compute)
+
+    def reference_sha256(self, reference_path: str) -> str:
+        """參考檔案內容的 SHA-256（記錄在輸出檔中繼資料）"""
+        return self._run_stage('reference_sha256', self._reference_fingerprint(reference_path),
+                               lambda: file_sha256(reference_path))
+
+    def _match_stage(self, reference_path: str, source_path: str, sheet_name: str, output_path: str,
+                     not_found_text: str, not_found_cn_text: str) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+        """比對結果與沿用的上次結果（上次寫入 output_path 的輸出檔中指紋相同的列）"""
+        def compute():
+            reference = self.load_reference(reference_path)
+            df_source = self.load_source(source_path, sheet_name)
+            # 上次的背景寫檔完成後才讀取輸出檔
+            self.wait_for_write(output_path)
+            previous = read_previous_results(
+                output_path, sheet_name, self.reference_sha256(reference_path),
+                f"{not_found_text}|{not_found_cn_text}"
+            )
+            df_result = self.excel_handler.build_compare_result(
+                df_source, reference.testid_index(), not_found_text, not_found_cn_text, previous
+            )
+            if df_result is None:
+                raise CompareError(f"找不到 Description 或 TestID 欄位，實際欄位: {df_source.columns.tolist()[:5]}")
+            return df_result, previous
+        fingerprint = self._match_fingerprint(reference_path, source_path, sheet_name, output_path,
+                                              not_found_text, not_found_cn_text)
+        return self._run_stage('match', fingerprint, compute)
+
+    def match(self, reference_path: str, source_path: str, sheet_name: str, output_path: str,
+              not_found_text: str, not_found_cn_text: str) -> pd.DataFrame:
+        """階段三：以 TestID 索引比對，產生比對結果（output_path 上次輸出中未變更的列直接沿用）"""
+        return self._match_stage(reference_path, source_path, sheet_name, output_path,
+                                 not_found_text, not_found_cn_text)[0]
+
+    def stream(self, reference_path: str, source_path: str, sheet_name: str, output_path: str,
+               not_found_text: str, not_found_cn_text: str, chunk_rows: int = STREAM_CHUNK_ROWS) -> Tuple[int, int]:
+        """超大工作表的串流比對：逐區塊比對並直接寫入輸出檔案（不經過 source/match 階段，結果不快取），回傳 (行數, 查無說明行數)"""
+        self.load_reference(reference_path)
+        self.wait_for_write(output_path)
+        counts = stream_compare_sheet(self.excel_handler, source_path, sheet_name, output_path,
+                                    not_found_text, not_found_cn_text, chunk_rows)
+        if counts is None:
+            raise CompareError("串流比對失敗")
+        # 輸出檔案已被覆寫，不再是 write 階段記錄的狀態
+        self._outputs.pop(os.path.abspath(output_path), None)
+        return counts
+
+    def _output_current(self, output_path: str, match_fingerprint: tuple, with_ai: bool) -> bool:
+        """輸出檔案是否仍是本流程以相同比對結果寫入的狀態（且未被外部修改）"""
+        self.wait_for_write(output_path)
+        state = self._outputs.get(os.path.abspath(output_path))
+        if state is None or state[0] != match_fingerprint or (with_ai and not state[1]):
+            return False
+        try:
+            return file_fingerprint(self.excel_handler.output_file(output_path)) == state[2]
+        except OSError:
+            return False
+
+    def needs_write(self, reference_path: str, source_path: str, sheet_name: str, output_path: str,
+                    not_found_text: str, not_found_cn_text: str, with_ai: bool = False) -> bool:
+        """寫檔階段是否需要執行（供呼叫端決定是否詢問覆蓋）"""
+        fingerprint = self._match_fingerprint(reference_path, source_path, sheet_name, output_path,
+                                              not_found_text, not_found_cn_text)
+        return not self._output_current(output_path, fingerprint, with_ai=with_ai)
+
+    def write(self, reference_path: str, source_path: str, sheet_name: str, output_path: str,
+              not_found_text: str, not_found_cn_text: str, with_ai: bool = False,
+              progress_callback: Optional[Callable[[int, int, str], None]] = None) -> str:
+        """
+        階段四：寫入比對結果與 Test Item All 副本（含反白）
+
+        with_ai 時先由記憶體中的比對結果計算 AI 推薦，與比對結果一起寫出，輸出檔案只寫一次
+
+        Returns:
+            str: 實際寫出的主要檔案（只輸出匯出檔時為匯出檔）
+        """
+        fingerprint, save, saved = self._prepare_write(reference_path, source_path, sheet_name, output_path,
+                                                       not_found_text, not_found_cn_text, with_ai, progress_callback)
+        written = save()
+        self._record_write(output_path, fingerprint, with_ai, saved)
+        return written
+
+    def write_async(self, writer: BackgroundWriter, reference_path: str, source_path: str, sheet_name: str,
+                    output_path: str, not_found_text: str, not_found_cn_text: str, with_ai: bool = False,
+                    progress_callback: Optional[Callable[[int, int, str], None]] = None) -> Future:
+        """
+        同 write，比對與 AI 推薦在呼叫端執行緒完成後，存檔交給背景寫檔執行緒
+
+        Returns:
+            Future: 完成時為實際寫出的主要檔案，存檔失敗時為 CompareError
+        """
+        fingerprint, save, saved = self._prepare_write(reference_path, source_path, sheet_name, output_path,
+                                                       not_found_text, not_found_cn_text, with_ai, progress_callback)
+        future = writer.submit(save)
+        self._pending_writes[os.path.abspath(output_path)] = (fingerprint, with_ai, future, saved)
+        return future
+
+    def track_write(self, output_path: str, future: Future):
+        """記錄不經過 write 階段的背景寫檔（例如全部工作表比對），讀取或覆寫同一輸出檔前先等待完成"""
+        self.wait_for_write(output_path)
+        self._outputs.pop(os.path.abspath(output_path), None)
+        self._pending_writes[os.path.abspath(output_path)] = (None, False, future, {})
+
+    def wait_for_write(self, output_path: str):
+        """等待 output_path 尚未完成的背景寫檔，完成後在呼叫端執行緒記錄寫入後的狀態"""
+        pending = self._pending_writes.pop(os.path.abspath(output_path), None)
+        if pending is None:
+            return
+        fingerprint, with_ai, future, saved = pending
+        try:
+            future.result()
+        except Exception as e:
+            # 錯誤已由 Future 回報給送出寫檔的一方，這裡只需確保不沿用寫到一半的檔案
+            logger.warning(f"上次背景寫檔失敗: {e}")
+            return
+        self._record_write(output_path, fingerprint, with_ai, saved)
+
+    def _record_write(self, output_path: str, fingerprint: Optional[tuple], with_ai: bool,
+                      saved: Dict[str, tuple]):
+        """記錄 write 階段寫入後的輸出檔狀態（沒有實際寫檔或不是 write 階段的寫檔時不記錄）"""
+        if fingerprint is not None and 'file' in saved:
+            self._outputs[os.path.abspath(output_path)] = (fingerprint, with_ai, saved['file'])
+
+    def _prepare_write(self, reference_path: str, source_path: str, sheet_name: str, output_path: str,
+                       not_found_text: str, not_found_cn_text: str, with_ai: bool,
+                       progress_callback: Optional[Callable[[int, int, str], None]]
+                       ) -> Tuple[tuple, Callable[[], str], Dict[str, tuple]]:
+        """
+        執行寫檔前的各階段
+
+        Returns:
+            (比對指紋, 存檔函式, 寫入後的檔案指紋)：存檔函式可在其他執行緒執行，只寫檔並把檔案指紋放進
+            最後一項（鍵 'file'），不存取各階段快取；輸入未變更時存檔函式不寫檔，最後一項維持空白
+        """
+        fingerprint = self._match_fingerprint(reference_path, source_path, sheet_name, output_path,
+                                              not_found_text, not_found_cn_text)
+        written = self.excel_handler.output_file(output_path)
+        saved: Dict[str, tuple] = {}
+        if self._output_current(output_path, fingerprint, with_ai=with_ai):
+            logger.info("write 階段輸入未變更且輸出檔案未被修改，略過寫檔")
+            return fingerprint, lambda: written, saved
+        df_result = self.match(reference_path, source_path, sheet_name, output_path, not_found_text, not_found_cn_text)
+        reference = self.load_reference(reference_path)
+        recommendations = None
+        if with_ai:
+            # save_result 會補齊推薦列表，傳入複本以保留快取內容
+            recommendations = list(self.recommend(reference_path, source_path, sheet_name, output_path,
+                                                  not_found_text, not_found_cn_text, progress_callback))
+        metadata = build_metadata(df_result, sheet_name, self.reference_sha256(reference_path),
+                                  f"{not_found_text}|{not_found_cn_text}")
+        df_error_codes = reference.output_frame()
+
+        def save() -> str:
+            if not self.excel_handler.save_result(df_result, df_error_codes, output_path, sheet_name,
+                                                  ai_recommendations=recommendations, metadata=metadata,
+                                                  reference_path=reference_path):
+                raise CompareError("儲存結果失敗")
+            saved['file'] = file_fingerprint(written)
+            return written
+        return fingerprint, save, saved
+
+    def recommend(self, reference_path: str, source_path: str, sheet_name: str, output_path: str,
+                  not_found_text: str, not_found_cn_text: str,
+                  progress_callback: Optional[Callable[[int, int, str], None]] = None) -> List[Tuple[str, str]]:
+        """AI 推薦計算（依比對結果的指紋快取；上次輸出已有推薦且內容未變更的列直接沿用）"""
+        def compute():
+            reference = self.load_reference(reference_path)
+            df_result, previous = self._match_stage(reference_path, source_path, sheet_name, output_path,
+                                                    not_found_text, not_found_cn_text)
+            if not self.ai_engine.load_reference_data(reference_path, reference):
+                raise CompareError("無法載入 Error Code 參考資料")
+            descriptions = df_result['你的 description'].fillna('').astype(str)
+            if previous is None or not all(c in previous.columns for c in AI_COLUMNS):
+                return self.ai_engine.generate_recommendations_with_search(descriptions.tolist(), progress_callback)
+            fingerprints = row_fingerprints(df_result)
+            changed = ~fingerprints.isin(previous.index)
+            carried = previous[AI_COLUMNS].reindex(fingerprints)
+            recommendations = list(zip(carried[AI_COLUMNS[0]], carried[AI_COLUMNS[1]]))
+            logger.info(f"沿用上次 AI 推薦 {int((~changed).sum())} 行，重新推薦 {int(changed.sum())} 行")
+            if changed.any():
+                positions = [i for i, flag in enumerate(changed) if flag]
+                new_recommendations = self.ai_engine.generate_recommendations_with_search(
+                    descriptions[changed].tolist(), progress_callback
+                )
+                for position, recommendation in zip(positions, new_recommendations):
+                    recommendations[position] = recommendation
+            return recommendations
+        fingerprint = self._match_fingerprint(reference_path, source_path, sheet_name, output_path,
+                                              not_found_text, not_found_cn_text)
+        return self._run_stage('recommend', fingerprint, compute)
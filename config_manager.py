@@ -54,6 +54,19 @@ class ConfigManager:
             'LastExcelPath': '',
             'LastXMLPath': '',
             'LastOutputDir': '',
+            'ReferenceCacheEnabled': '1',
+            'ReferenceCacheMaxMB': '50',
+            'ExcelReadEngine': 'auto',
+            'ReferenceFastParser': '1',
+            'BatchCompareWorkers': '4',
+            'DirectoryCompareWorkers': '0',
+            'StreamCompareMinRows': '200000',
+            'StreamChunkRows': '50000',
+            'HighlightMode': 'static',
+            'WriteEngine': 'openpyxl',
+            'ReferenceSheet': 'full',
+            'ExportFormat': '',
+            'ExportOnly': '0',
         }
         self.config = {}
         self.lines = []  # 保留原始所有行
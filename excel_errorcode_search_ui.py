@@ -11,10 +11,12 @@ Excel Error Code 查詢工具 UI
 """
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import pandas as pd
 import os
 import logging
 from config_manager import ConfigManager
+from reference_workbook import ReferenceWorkbook
+from reference_cache import ReferenceCache
+from excel_reader import get_reader_from_config
 
 # 設定 logger
 logger = logging.getLogger(__name__)
@@ -80,6 +82,9 @@ class ExcelErrorCodeSearchUI:
         if not self.config_manager.get(tip_key):
             self.config_manager.set(tip_key, default_tip)
         self.df = None  # 儲存 Test Item All sheet 的 DataFrame
+        self.reference_cache = ReferenceCache.from_config(self.config_manager)
+        self.reader = get_reader_from_config(self.config_manager)
+        self.reference_fast_parser = self.config_manager.get('ReferenceFastParser', '1') == '1'
         # 讀取字體大小與上次檔案路徑
         self.font_size = int(self.config_manager.get('SearchUIFontSize', self.config_manager.get('FontSize', 12)))
         self.last_excel_path = self.config_manager.get('LastExcelPath', os.getcwd())
@@ -287,20 +292,11 @@ class ExcelErrorCodeSearchUI:
         # 若有上次檔案路徑自動載入
         if self.last_excel_path and os.path.exists(self.last_excel_path):
             try:
-                # 讀取 Excel 檔案，跳過前3行空行，第4行是標題
-                df = pd.read_excel(self.last_excel_path, sheet_name="Test Item All", skiprows=3)
-                # 重新命名欄位
-                if len(df.columns) >= 8:
-                    df.columns = [
-                        'Main Function', 'Interface', 'Interenal Error Code', 
-                        'Description', 'Chinese', 'Version', 'Error Code', 'Note'
-                    ]
-                # 只取 BCDE 欄（Interface, Interenal Error Code, Description, Chinese）
-                if df.shape[1] >= 5:
-                    df = df.iloc[:, 1:5]
-                    # 重新命名為正確的欄位名稱
-                    df.columns = ['Interface', 'Interenal Error Code', 'Description', 'Chinese']
-                self.df = df
+                # 讀取 Test Item All（有快取時直接讀取快取），只取 BCDE 欄
+                self.df = ReferenceWorkbook.shared(
+                    self.last_excel_path, cache=self.reference_cache,
+                    reader=self.reader, fast_parser=self.reference_fast_parser
+                ).search_frame()
                 self._show_table(self.df)
                 
                 # 更新文件標籤
@@ -337,57 +333,11 @@ class ExcelErrorCodeSearchUI:
         self.update_status("正在讀取檔案...", "orange")
         
         try:
-            # 使用智能讀取方式來處理標題行
-            try:
-                # 首先嘗試正常讀取
-                df = pd.read_excel(file_path, sheet_name="Test Item All", skiprows=3)
-                
-                # 檢查是否有 "Unnamed" 欄位
-                if any('Unnamed' in str(col) for col in df.columns):
-                    logger.info("檢測到 Unnamed 欄位，嘗試跳過更多行")
-                    df = pd.read_excel(file_path, sheet_name="Test Item All", skiprows=4)
-                
-                # 如果還是有 Unnamed，嘗試使用 header=None 並手動設定欄位名稱
-                if any('Unnamed' in str(col) for col in df.columns):
-                    logger.info("仍有 Unnamed 欄位，嘗試使用 header=None")
-                    df = pd.read_excel(file_path, sheet_name="Test Item All", header=None)
-                    # 尋找包含 "Main Function" 的行作為標題行
-                    header_row = None
-                    for i, row in df.iterrows():
-                        if 'Main Function' in str(row.values):
-                            header_row = i
-                            break
-                    
-                    if header_row is not None:
-                        logger.info(f"找到標題行在第 {header_row + 1} 行")
-                        df.columns = df.iloc[header_row]
-                        df = df.drop(df.index[:header_row + 1]).reset_index(drop=True)
-                    else:
-                        # 如果找不到標題行，使用第一行
-                        df.columns = df.iloc[0]
-                        df = df.drop(df.index[0]).reset_index(drop=True)
-                
-                # 清理欄位名稱
-                df.columns = [str(col).strip() for col in df.columns]
-                
-            except Exception as e:
-                logger.warning(f"特殊讀取方式失敗，使用預設方式: {e}")
-                df = pd.read_excel(file_path, sheet_name="Test Item All", skiprows=3)
-            
-            # 重新命名欄位
-            if len(df.columns) >= 8:
-                df.columns = [
-                    'Main Function', 'Interface', 'Interenal Error Code', 
-                    'Description', 'Chinese', 'Version', 'Error Code', 'Note'
-                ]
-            # 只取 BCDE 欄（Interface, Interenal Error Code, Description, Chinese）
-            if df.shape[1] >= 5:
-                df = df.iloc[:, 1:5]
-                # 重新命名為正確的欄位名稱
-                df.columns = ['Interface', 'Interenal Error Code', 'Description', 'Chinese']
-            
-            # 清理欄位名稱，移除多餘的空白
-            df.columns = [str(col).strip() for col in df.columns]
+            # 智能判斷標題行並只取 BCDE 欄（有快取時直接讀取快取）
+            df = ReferenceWorkbook.shared(
+                file_path, cache=self.reference_cache,
+                reader=self.reader, fast_parser=self.reference_fast_parser
+            ).search_frame()
             
             self.df = df
             self.file_label.config(text=self._format_path_display(file_path))
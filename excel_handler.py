@@ -4,71 +4,136 @@ Excel處理模組
 """
 import os
 import logging
+import zipfile
+from xml.etree import ElementTree
 import pandas as pd
 from pathlib import Path
-from openpyxl import load_workbook
-from openpyxl.styles import Font, Border, Side, Alignment, PatternFill
-from typing import Tuple, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Dict, Optional, List, Iterator, Set
+from reference_workbook import ReferenceWorkbook, frame_with_header, REFERENCE_SHEET_NAME
+from reference_cache import file_sha256
+from result_export import ResultExporter, export_frame, export_path_for, EXPORT_FORMATS
+from excel_reader import ExcelReader, get_reader
+from testid_index import TestIDIndex, normalize_testids, testid_keys
+from compare_metadata import (META_SHEET_NAME, MATCH_COLUMNS, FOUND_COLUMN, CHINESE_FOUND_COLUMN, FLAG_COLUMNS,
+                              row_fingerprints)
+from xlsx_stream import read_sheet_names
+from styled_writer import write_frame, open_workbook, HIGHLIGHT_STATIC, HIGHLIGHT_CONDITIONAL, DEFAULT_WRITE_ENGINE
 
 logger = logging.getLogger(__name__)
 
+# 來源工作表標題列偵測時掃描的行數
+HEADER_SCAN_ROWS = 20
+
+# 不屬於測站的工作表（不區分大小寫），下拉選單與全部工作表比對都會排除
+EXCLUDED_SHEETS = ['properties', 'duts', 'switch', 'instrument']
+
+# 比對結果的欄位順序
+RESULT_COLUMNS = ['你的 description', '你寫的 Error Code', 'Test Item 文件的 description', 'Test Item 的 Error Code']
+
+# 輸出檔的參考工作表：full 為完整 Test Item All 副本（含反白），used 只寫入來源引用到的行與參考檔案指標
+REFERENCE_FULL = 'full'
+REFERENCE_USED = 'used'
+USED_SHEET_NAME = 'Test Item Used'
+REFERENCE_INFO_SHEET_NAME = 'Reference'
+
+
+def without_flags(df_result: pd.DataFrame) -> pd.DataFrame:
+    """去除狀態欄位，寫入輸出工作表用"""
+    return df_result.drop(columns=FLAG_COLUMNS, errors='ignore')
+
+
+def filter_station_sheets(sheets: List[str]) -> List[str]:
+    """排除非測站的工作表，保留原本順序"""
+    return [sheet for sheet in sheets if sheet.lower() not in EXCLUDED_SHEETS]
+
+
+def find_header(rows: Iterator[Tuple], targets: Tuple[str, ...]) -> Tuple[List[int], List[str]]:
+    """
+    在串流的前 HEADER_SCAN_ROWS 行中尋找同時包含所有目標欄位的標題列（忽略大小寫與空白）
+
+    Returns:
+        Tuple[List[int], List[str]]: 目標欄位的位置與原始標題；rows 停在標題列之後
+
+    Raises:
+        ValueError: 找不到標題列
+    """
+    for i, row in enumerate(rows):
+        if i >= HEADER_SCAN_ROWS:
+            break
+        names = ['' if v is None else str(v).strip().lower() for v in row]
+        if all(t.lower() in names for t in targets):
+            positions = [names.index(t.lower()) for t in targets]
+            return positions, [str(row[p]).strip() for p in positions]
+    raise ValueError(f"前 {HEADER_SCAN_ROWS} 行找不到欄位 {list(targets)}")
+
+
 class ExcelHandler:
     """Excel 檔案處理類別，負責讀取、比對、寫入、格式化等操作"""
-    def __init__(self):
+    def __init__(self, reader: Optional[ExcelReader] = None, highlight_mode: str = HIGHLIGHT_STATIC,
+                 write_engine: str = DEFAULT_WRITE_ENGINE, reference_sheet: str = REFERENCE_FULL,
+                 export_format: Optional[str] = None, export_only: bool = False):
+        self.reader = reader or get_reader()
+        # Test Item All 反白方式（HIGHLIGHT_STATIC 或 HIGHLIGHT_CONDITIONAL）
+        self.highlight_mode = highlight_mode
+        # 寫檔引擎（openpyxl 或 xlsxwriter，未安裝 XlsxWriter 時退回 openpyxl）
+        self.write_engine = write_engine
+        # 輸出檔的參考工作表（REFERENCE_FULL 或 REFERENCE_USED）
+        self.reference_sheet = reference_sheet
+        # 另存的匯出格式（csv / parquet / jsonl，None 為不匯出）；export_only 時只輸出匯出檔，不寫 xlsx
+        if export_format and export_format not in EXPORT_FORMATS:
+            logger.warning(f"未知的匯出格式 {export_format}，不匯出")
+            export_format = None
+        self.export_format = export_format or None
+        self.export_only = bool(export_only and self.export_format)
         self.error_code_map: Dict[str, Tuple[str, str]] = {}
         self.current_sheet: Optional[str] = None
+        self.reference: Optional[ReferenceWorkbook] = None
+        self.testid_index: Optional[TestIDIndex] = None
+        # (檔案, 工作表, 大小, 修改時間) -> 標題列位置，重複比對時略過偵測
+        self._header_rows: Dict[Tuple[str, str, int, int], int] = {}
 
-    def load_error_codes(self, file_path: str) -> bool:
-        """載入錯誤碼Excel檔案，建立 TestID 對應說明的字典"""
+    def load_error_codes(self, file_path: str, reference: Optional[ReferenceWorkbook] = None) -> bool:
+        """載入錯誤碼Excel檔案，建立 TestID 對應說明的字典（可傳入已解析的 ReferenceWorkbook 共用）"""
         try:
-            df_error_codes = pd.read_excel(file_path, sheet_name="Test Item All")
-            self.error_code_map = {
-                str(k).strip(): (str(v1).strip(), str(v2).strip())
-                for k, v1, v2 in zip(df_error_codes.iloc[:, 2], df_error_codes.iloc[:, 3], df_error_codes.iloc[:, 4])
-            }
+            self.reference = reference or ReferenceWorkbook.shared(file_path, reader=self.reader)
+            self.error_code_map = self.reference.error_code_map()
+            self.testid_index = self.reference.testid_index()
             logger.info(f"成功載入錯誤碼檔案: {file_path}")
             return True
         except Exception as e:
             logger.error(f"載入錯誤碼檔案時發生錯誤: {str(e)}")
             return False
 
+    def _detect_header_row(self, raw: pd.DataFrame) -> int:
+        """
+        在前 HEADER_SCAN_ROWS 行中偵測標題列
+        依序檢查前三行是否完整（無空白欄位），否則尋找含 "Main Function" 的行，都沒有則使用第一行
+        """
+        head = raw.iloc[:HEADER_SCAN_ROWS]
+        for i in range(min(3, len(head))):
+            if head.iloc[i].notna().all():
+                if i > 0:
+                    logger.info(f"檢測到 Unnamed 欄位，跳過前 {i} 行")
+                return i
+        for i, row in enumerate(head.itertuples(index=False)):
+            if 'Main Function' in str(row):
+                logger.info(f"找到標題行在第 {i + 1} 行")
+                return i
+        return 0
+
     def load_source_sheet(self, file_path: str, sheet_name: str) -> Optional[pd.DataFrame]:
-        """載入來源Excel檔案的指定工作表"""
+        """載入來源Excel檔案的指定工作表（只讀取一次，於記憶體中判斷標題列）"""
         try:
-            # 嘗試不同的讀取方式來處理標題行
             try:
-                # 首先嘗試正常讀取
-                df_source = pd.read_excel(file_path, sheet_name=sheet_name)
-                
-                # 檢查是否有 "Unnamed" 欄位，如果有則嘗試跳過第一行
-                if any('Unnamed' in str(col) for col in df_source.columns):
-                    logger.info("檢測到 Unnamed 欄位，嘗試跳過第一行重新讀取")
-                    df_source = pd.read_excel(file_path, sheet_name=sheet_name, skiprows=1)
-                    
-                    # 如果還是有 Unnamed，嘗試跳過更多行
-                    if any('Unnamed' in str(col) for col in df_source.columns):
-                        logger.info("仍有 Unnamed 欄位，嘗試跳過前兩行")
-                        df_source = pd.read_excel(file_path, sheet_name=sheet_name, skiprows=2)
-                
-                # 如果還是有 Unnamed，嘗試使用 header=None 並手動設定欄位名稱
-                if any('Unnamed' in str(col) for col in df_source.columns):
-                    logger.info("仍有 Unnamed 欄位，嘗試使用 header=None")
-                    df_source = pd.read_excel(file_path, sheet_name=sheet_name, header=None)
-                    # 尋找包含 "Main Function" 的行作為標題行
-                    header_row = None
-                    for i, row in df_source.iterrows():
-                        if 'Main Function' in str(row.values):
-                            header_row = i
-                            break
-                    
-                    if header_row is not None:
-                        logger.info(f"找到標題行在第 {header_row + 1} 行")
-                        df_source.columns = df_source.iloc[header_row]
-                        df_source = df_source.drop(df_source.index[:header_row + 1]).reset_index(drop=True)
-                    else:
-                        # 如果找不到標題行，使用第一行
-                        df_source.columns = df_source.iloc[0]
-                        df_source = df_source.drop(df_source.index[0]).reset_index(drop=True)
+                raw = self.reader.read_sheet(file_path, sheet_name)
+                stat = os.stat(file_path)
+                key = (os.path.abspath(file_path), sheet_name, stat.st_size, stat.st_mtime_ns)
+                header_row = self._header_rows.get(key)
+                if header_row is None:
+                    header_row = self._detect_header_row(raw)
+                    self._header_rows[key] = header_row
+                df_source = frame_with_header(raw, header_row)
                 
                 # 清理欄位名稱
                 df_source.columns = [str(col).strip() for col in df_source.columns]
@@ -85,6 +150,136 @@ class ExcelHandler:
             logger.error(f"載入來源工作表時發生錯誤: {str(e)}")
             return None
 
+    def load_source_columns(self, file_path: str, sheet_name: str,
+                            targets: Tuple[str, ...] = ('Description', 'TestID')) -> Optional[pd.DataFrame]:
+        """
+        以讀取引擎逐列串流讀取來源工作表（openpyxl 為 read_only），只保留比對需要的欄位
+
+        Args:
+            file_path: 來源 Excel 檔案路徑
+            sheet_name: 工作表名稱
+            targets: 需要的欄位名稱（忽略大小寫與空白）
+
+        Returns:
+            Optional[pd.DataFrame]: 只含目標欄位的 DataFrame；無法串流（如 .xls 或找不到標題）時改用 load_source_sheet
+        """
+        try:
+            rows = self.reader.iter_rows(file_path, sheet_name)
+            try:
+                positions, headers = find_header(rows, targets)
+                # 只保存目標欄位的值；整列空白的尾端行與 pd.read_excel 一樣捨棄
+                columns = [[] for _ in positions]
+                last_used = 0
+                for row in rows:
+                    width = len(row)
+                    for values, p in zip(columns, positions):
+                        values.append(row[p] if p < width else None)
+                    if row.count(None) != width:
+                        last_used = len(columns[0])
+            finally:
+                rows.close()
+            df_source = pd.DataFrame({h: v[:last_used] for h, v in zip(headers, columns)})
+            self.current_sheet = sheet_name
+            logger.info(f"串流載入來源工作表: {sheet_name}，欄位 {headers}，共 {len(df_source)} 行")
+            return df_source
+        except Exception as e:
+            logger.info(f"無法串流讀取來源工作表，改用一般讀取: {e}")
+            return self.load_source_sheet(file_path, sheet_name)
+
+    def iter_source_chunks(self, file_path: str, sheet_name: str, chunk_rows: int,
+                           targets: Tuple[str, ...] = ('Description', 'TestID'),
+                           reader: Optional[ExcelReader] = None) -> Iterator[pd.DataFrame]:
+        """
+        逐列串流讀取來源工作表，每 chunk_rows 行產生一個只含目標欄位的 DataFrame
+        （記憶體只保留一個區塊；與 load_source_columns 一樣捨棄表尾整列空白的行）
+
+        Args:
+            reader: 讀取引擎，預設為 self.reader
+
+        Raises:
+            ValueError: 找不到標題列
+        """
+        rows = (reader or self.reader).iter_rows(file_path, sheet_name)
+        try:
+            positions, headers = find_header(rows, targets)
+            columns = [[] for _ in positions]
+            # 連續整列空白的行數：之後還有資料才補上，表尾的空白行直接捨棄
+            pending_blank = 0
+            for row in rows:
+                width = len(row)
+                if row.count(None) == width:
+                    pending_blank += 1
+                    continue
+                for values in columns:
+                    values.extend([None] * pending_blank)
+                pending_blank = 0
+                for values, p in zip(columns, positions):
+                    values.append(row[p] if p < width else None)
+                if len(columns[0]) >= chunk_rows:
+                    yield pd.DataFrame(dict(zip(headers, columns)))
+                    columns = [[] for _ in positions]
+            if columns[0]:
+                yield pd.DataFrame(dict(zip(headers, columns)))
+        finally:
+            rows.close()
+
+    def load_source_sheets(self, file_path: str, sheet_names: List[str],
+                           max_workers: int = 4) -> Dict[str, Optional[pd.DataFrame]]:
+        """
+        以執行緒平行載入多個來源工作表（各自只取比對需要的欄位）
+
+        Args:
+            file_path: 來源 Excel 檔案路徑
+            sheet_names: 工作表名稱列表
+            max_workers: 同時讀取的工作表數
+
+        Returns:
+            Dict[str, Optional[pd.DataFrame]]: 工作表名稱 -> 資料（依 sheet_names 順序，失敗為 None）
+        """
+        workers = max(1, min(max_workers, len(sheet_names)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            frames = executor.map(lambda name: self.load_source_columns(file_path, name), sheet_names)
+            return dict(zip(sheet_names, frames))
+
+    def build_compare_result(self, df_source: pd.DataFrame, testid_index: TestIDIndex,
+                             not_found_text: str, not_found_cn_text: str,
+                             previous: Optional[pd.DataFrame] = None) -> Optional[pd.DataFrame]:
+        """
+        以 TestID 索引整欄查詢，比對來源資料與參考檔案的 Description/ChineseDesc
+
+        Args:
+            previous: 上次的比對結果（以列指紋為索引，見 compare_metadata），指紋相同的列直接沿用
+
+        Returns:
+            Optional[pd.DataFrame]: RESULT_COLUMNS 四欄的比對結果加上 FLAG_COLUMNS 狀態欄位；
+            找不到 Description 或 TestID 欄位時為 None
+        """
+        desc_col = self.find_column(df_source, 'Description')
+        testid_col = self.find_column(df_source, 'TestID')
+        if not desc_col or not testid_col:
+            logger.error(f"找不到 Description 或 TestID 欄位，實際欄位: {df_source.columns.tolist()[:5]}")
+            return None
+        df_result = df_source[[desc_col, testid_col]].reset_index(drop=True)
+        df_result.columns = RESULT_COLUMNS[:2]
+        changed = pd.Series(True, index=df_result.index)
+        if previous is not None:
+            fingerprints = row_fingerprints(df_result)
+            changed = ~fingerprints.isin(previous.index)
+            for column in MATCH_COLUMNS:
+                df_result[column] = previous[column].reindex(fingerprints).to_numpy(dtype=object)
+            logger.info(f"沿用上次比對結果 {int((~changed).sum())} 行，重新比對 {int(changed.sum())} 行")
+        else:
+            for column in MATCH_COLUMNS:
+                df_result[column] = pd.Series(dtype=object, index=df_result.index)
+        # 整欄查詢只是雜湊查表；沿用的列也重新取得狀態（參考檔案相同時結果不變）
+        matched = testid_index.lookup(df_result['你寫的 Error Code'], not_found_text, not_found_cn_text)
+        if changed.any():
+            df_result.loc[changed, 'Test Item 文件的 description'] = matched.loc[changed, 'Description']
+            df_result.loc[changed, 'Test Item 的 Error Code'] = matched.loc[changed, 'ChineseDesc']
+        df_result[FOUND_COLUMN] = matched['Found'].to_numpy(dtype=bool)
+        df_result[CHINESE_FOUND_COLUMN] = matched['HasChinese'].to_numpy(dtype=bool)
+        return df_result
+
     def find_column(self, df: pd.DataFrame, target: str) -> Optional[str]:
         """在DataFrame中尋找目標欄位名稱（忽略大小寫與空白）"""
         for col in df.columns:
@@ -93,30 +288,14 @@ class ExcelHandler:
         return None
 
     def compare_data(self, df_source: pd.DataFrame, not_found_text: str, not_found_cn_text: str) -> Optional[pd.DataFrame]:
-        """比對來源資料與錯誤碼字典，產生比對結果DataFrame（已優化可用merge）"""
+        """比對來源資料與已載入的錯誤碼（整欄正規化後以 TestID 索引批次查詢，查無資料一次補上）"""
         try:
-            desc_col = self.find_column(df_source, 'Description')
-            testid_col = self.find_column(df_source, 'TestID')
-            if not desc_col or not testid_col:
-                logger.error(f"找不到必要欄位，實際欄位: {df_source.columns.tolist()}")
+            if self.testid_index is None:
+                logger.error("尚未載入錯誤碼檔案")
+                return None
+            df_result = self.build_compare_result(df_source, self.testid_index, not_found_text, not_found_cn_text)
+            if df_result is None:
                 return None
-            df_result = df_source[[desc_col, testid_col]].copy()
-            # 修改 header 名稱
-            df_result.columns = ['你的 description', '你寫的 Error Code']
-            # merge 或 for 迴圈比對
-            cd_list = []
-            ce_list = []
-            for idx, row in df_result.iterrows():
-                test_id = str(row['你寫的 Error Code']).strip()
-                if test_id in self.error_code_map:
-                    description, chinese_desc = self.error_code_map[test_id]
-                    cd_list.append(description)
-                    ce_list.append(chinese_desc)
-                else:
-                    cd_list.append(not_found_text)
-                    ce_list.append(not_found_cn_text)
-            df_result['Test Item 文件的 description'] = cd_list
-            df_result['Test Item 的 Error Code'] = ce_list
             logger.info("成功完成資料比對")
             return df_result
         except Exception as e:
@@ -124,57 +303,137 @@ class ExcelHandler:
             return None
 
     def save_result(self, df_result: pd.DataFrame, df_error_codes: pd.DataFrame, 
-                   output_path: str, sheet_name: str, ai_recommendations: list = None) -> bool:
+                   output_path: str, sheet_name: str, ai_recommendations: list = None,
+                   metadata: Optional[pd.DataFrame] = None, reference_path: Optional[str] = None) -> bool:
         """儲存比對結果，並反白來源TestID對應Test Item All行"""
+        return self.save_results({sheet_name: df_result}, df_error_codes, output_path,
+                                 {sheet_name: ai_recommendations} if ai_recommendations else None, metadata,
+                                 reference_path)
+
+    def save_results(self, results: Dict[str, pd.DataFrame], df_error_codes: pd.DataFrame,
+                     output_path: str, ai_recommendations: Optional[Dict[str, list]] = None,
+                     metadata: Optional[pd.DataFrame] = None, reference_path: Optional[str] = None) -> bool:
+        """
+        將多個工作表的比對結果寫入同一個活頁簿（每個測站一個工作表，最後為 Test Item All），
+        並反白所有來源 TestID 對應的 Test Item All 行；格式在寫出時一併套用，只寫檔一次
+
+        Args:
+            results: 工作表名稱 -> 比對結果（build_compare_result 的結果，依寫入順序）
+            df_error_codes: Test Item All 輸出副本
+            output_path: 輸出檔案路徑
+            ai_recommendations: 工作表名稱 -> AI 推薦列表（可省略）
+            metadata: 列指紋等中繼資料，寫入隱藏工作表供下次增量比對（可省略）
+            reference_path: 參考檔案路徑，REFERENCE_USED 時寫入參考檔案指標（省略時使用已載入的參考檔案）
+
+        Returns:
+            bool: 是否成功
+        """
         try:
-            # 檢查輸出檔案是否被佔用
-            if os.path.exists(output_path):
-                try:
-                    # 嘗試開啟檔案檢查是否被佔用
-                    with open(output_path, 'a'):
-                        pass
-                except PermissionError:
-                    logger.warning(f"檔案被佔用，嘗試重新命名: {output_path}")
-                    # 生成備用檔名
-                    base_name = os.path.splitext(output_path)[0]
-                    extension = os.path.splitext(output_path)[1]
-                    counter = 1
-                    while True:
-                        new_path = f"{base_name}_backup_{counter}{extension}"
-                        try:
-                            with open(new_path, 'a'):
-                                pass
-                            output_path = new_path
-                            logger.info(f"使用備用檔名: {output_path}")
-                            break
-                        except PermissionError:
-                            counter += 1
-                            if counter > 10:  # 避免無限循環
-                                raise Exception(f"無法找到可用的檔名，檔案可能被多個程式佔用")
-            
-            # 如果有 AI 推薦，新增 E、F 欄位
-            if ai_recommendations and len(ai_recommendations) > 0:
-                df_result = self._add_ai_recommendations(df_result, ai_recommendations)
-            
-            with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-                df_result.to_excel(writer, index=False, sheet_name=sheet_name)
-                df_error_codes.to_excel(writer, index=False, sheet_name='Test Item All')
-            # highlight_testids: 來源TestID
-            highlight_testids = [str(tid).strip() for tid in df_result['你寫的 Error Code']]
-            self._format_excel(output_path, highlight_testids=highlight_testids)
-            logger.info(f"成功儲存比對結果: {output_path}")
+            result_file = self.open_results(output_path)
+            for sheet_name, df_result in results.items():
+                result_file.add(sheet_name, df_result, (ai_recommendations or {}).get(sheet_name))
+            result_file.close(df_error_codes, metadata, reference_path)
             return True
+        except ImportError:
+            logger.error("Parquet 匯出需要安裝 pyarrow")
+            return False
         except Exception as e:
             logger.error(f"儲存比對結果時發生錯誤: {str(e)}")
             return False
 
+    def open_results(self, output_path: str) -> 'ResultFile':
+        """
+        建立逐一寫入工作表的輸出檔（參數同 save_results），失敗時拋出例外
+
+        工作表比對完成即可 add 寫入，不需等所有工作表都比對完成；最後 close 寫入參考工作表並存檔
+        """
+        export_path = export_path_for(output_path, self.export_format) if self.export_format else None
+        if self.export_only:
+            return ResultFile(self, None, export_path)
+        return ResultFile(self, self._writable_path(output_path), export_path)
+
+    def _writable_path(self, output_path: str) -> str:
+        """輸出檔案被佔用時改用備用檔名"""
+        # 檢查輸出檔案是否被佔用
+        if os.path.exists(output_path):
+            try:
+                # 嘗試開啟檔案檢查是否被佔用
+                with open(output_path, 'a'):
+                    pass
+            except PermissionError:
+                logger.warning(f"檔案被佔用，嘗試重新命名: {output_path}")
+                # 生成備用檔名
+                base_name = os.path.splitext(output_path)[0]
+                extension = os.path.splitext(output_path)[1]
+                counter = 1
+                while True:
+                    new_path = f"{base_name}_backup_{counter}{extension}"
+                    try:
+                        with open(new_path, 'a'):
+                            pass
+                        output_path = new_path
+                        logger.info(f"使用備用檔名: {output_path}")
+                        break
+                    except PermissionError:
+                        counter += 1
+                        if counter > 10:  # 避免無限循環
+                            raise Exception(f"無法找到可用的檔名，檔案可能被多個程式佔用")
+        return output_path
+
+    def output_file(self, output_path: str) -> str:
+        """實際寫出的主要檔案（只輸出匯出檔時為匯出檔，否則為 xlsx）"""
+        return export_path_for(output_path, self.export_format) if self.export_only else output_path
+
+    def output_options(self) -> Dict[str, object]:
+        """輸出相關設定（供資料夾比對的工作程序建立相同設定的 ExcelHandler）"""
+        return {
+            'highlight_mode': self.highlight_mode, 'write_engine': self.write_engine,
+            'reference_sheet': self.reference_sheet, 'export_format': self.export_format,
+            'export_only': self.export_only,
+        }
+
+    def write_reference_sheets(self, book, df_error_codes: pd.DataFrame, testids: Set[str],
+                               reference_path: Optional[str] = None):
+        """
+        寫入輸出檔的參考工作表
+
+        REFERENCE_FULL: 完整 Test Item All 副本，來源 TestID 對應的行（C 欄）反白
+        （HIGHLIGHT_CONDITIONAL 時以條件式格式反白，鍵值另存於隱藏工作表）
+        REFERENCE_USED: 只含來源 TestID 對應行的 Test Item Used，以及記錄參考檔案路徑與 SHA-256 的 Reference
+
+        Args:
+            book: 輸出活頁簿
+            df_error_codes: Test Item All 輸出副本
+            testids: 來源 TestID 鍵值（testid_keys，與比對使用相同的正規化規則）
+            reference_path: 參考檔案路徑（省略時使用已載入的參考檔案）
+        """
+        if self.reference_sheet != REFERENCE_USED:
+            write_frame(book, REFERENCE_SHEET_NAME, df_error_codes, testids,
+                        conditional=self.highlight_mode == HIGHLIGHT_CONDITIONAL)
+            return
+        df_used = df_error_codes[normalize_testids(df_error_codes.iloc[:, 2]).isin(testids).to_numpy()]
+        write_frame(book, USED_SHEET_NAME, df_used)
+
+        reference_path = reference_path or (self.reference.file_path if self.reference is not None else None)
+        sha256 = ''
+        if reference_path:
+            try:
+                sha256 = file_sha256(reference_path)
+            except OSError as e:
+                logger.warning(f"無法計算參考檔案雜湊: {e}")
+        write_frame(book, REFERENCE_INFO_SHEET_NAME, pd.DataFrame({
+            '項目': ['參考檔案', 'SHA-256', '工作表', '引用行數'],
+            '內容': [os.path.abspath(reference_path) if reference_path else '', sha256, REFERENCE_SHEET_NAME,
+                   f"{len(df_used)} / {len(df_error_codes)}"],
+        }))
+
     def _add_ai_recommendations(self, df_result: pd.DataFrame, ai_recommendations: list) -> pd.DataFrame:
         """
         為 DataFrame 新增 AI 推薦的 E、F 欄位
         
         Args:
             df_result: 原始結果 DataFrame
-            ai_recommendations: AI 推薦列表，格式為 [(test_id_1, test_id_2), ...]
+            ai_recommendations: AI 推薦列表，格式為 [(test_id, chinese_desc), ...]
             
         Returns:
             pd.DataFrame: 新增 E、F 欄位後的 DataFrame
@@ -191,8 +450,8 @@ class ExcelHandler:
             
             # 新增 E、F 欄位
             df_result = df_result.copy()
-            df_result['AI推薦 test ID 1'] = [rec[0] for rec in ai_recommendations]
-            df_result['AI推薦 test ID 2'] = [rec[1] for rec in ai_recommendations]
+            df_result['AI推薦 test ID'] = [rec[0] for rec in ai_recommendations]
+            df_result['AI推薦 中文'] = [rec[1] for rec in ai_recommendations]
             
             logger.info(f"成功新增 AI 推薦欄位，共 {len(ai_recommendations)} 個推薦")
             return df_result
@@ -200,249 +459,79 @@ class ExcelHandler:
             logger.error(f"新增 AI 推薦欄位時發生錯誤: {str(e)}")
             return df_result
 
-    def add_ai_recommendations_to_existing_file(self, file_path: str, ai_recommendations: list) -> bool:
-        """
-        為現有的比對結果檔案新增 AI 推薦欄位
-        使用 openpyxl 直接操作，完全保持原有格式（包括字體和行高）
-        
-        Args:
-            file_path: 現有檔案路徑
-            ai_recommendations: AI 推薦列表，格式為 [(test_id, chinese_desc), ...]
-            
-        Returns:
-            bool: 是否成功
-        """
+    def get_sheet_names(self, file_path: str) -> list:
+        """獲取Excel檔案中的所有工作表名稱（xlsx 直接讀取 workbook.xml，其他格式使用 pandas）"""
         try:
-            # 使用 openpyxl 直接載入工作簿，保持所有格式
-            wb = load_workbook(file_path)
-            ws = wb.active  # 使用第一個工作表
-            
-            logger.info(f"使用 openpyxl 載入檔案: {file_path}")
-            logger.info(f"工作表名稱: {ws.title}")
-            logger.info(f"工作表尺寸: {ws.max_row} 行 x {ws.max_column} 列")
-            
-            # 確保 ai_recommendations 長度與資料行數一致
-            data_rows = ws.max_row - 1  # 減去標題行
-            if len(ai_recommendations) != data_rows:
-                logger.warning(f"AI 推薦數量 ({len(ai_recommendations)}) 與資料行數 ({data_rows}) 不一致")
-                # 補齊不足的推薦
-                while len(ai_recommendations) < data_rows:
-                    ai_recommendations.append(("", ""))
-                # 截斷多餘的推薦
-                ai_recommendations = ai_recommendations[:data_rows]
-            
-            # 檢查是否已經有 AI 推薦欄位
-            col_e_exists = False
-            col_g_exists = False
-            col_e_index = None
-            col_g_index = None
-            
-            # 檢查 E 和 G 列是否已經有 AI 推薦欄位
-            for col_idx in range(1, ws.max_column + 1):
-                cell_value = ws.cell(row=1, column=col_idx).value
-                if cell_value and 'AI推薦 test ID' in str(cell_value):
-                    col_e_exists = True
-                    col_e_index = col_idx
-                elif cell_value and 'AI推薦 中文' in str(cell_value):
-                    col_g_exists = True
-                    col_g_index = col_idx
-            
-            # 如果沒有 AI 推薦欄位，新增到 E 和 G 列
-            if not col_e_exists:
-                col_e_index = ws.max_column + 1
-                ws.cell(row=1, column=col_e_index, value='AI推薦 test ID')
-                logger.info(f"新增 AI推薦 test ID 欄位到第 {col_e_index} 列")
-            
-            if not col_g_exists:
-                col_g_index = ws.max_column + 1
-                ws.cell(row=1, column=col_g_index, value='AI推薦 中文')
-                logger.info(f"新增 AI推薦 中文 欄位到第 {col_g_index} 列")
-            
-            # 寫入 AI 推薦資料，保持原有格式
-            for row_idx, (test_id, chinese_desc) in enumerate(ai_recommendations, start=2):  # 從第2行開始（跳過標題）
-                if col_e_index:
-                    cell_e = ws.cell(row=row_idx, column=col_e_index, value=test_id)
-                    # 保持與其他資料行相同的格式
-                    self._apply_data_cell_format(cell_e)
-                
-                if col_g_index:
-                    cell_g = ws.cell(row=row_idx, column=col_g_index, value=chinese_desc)
-                    # 保持與其他資料行相同的格式
-                    self._apply_data_cell_format(cell_g)
-            
-            # 如果新增了欄位，需要為標題行應用格式
-            if not col_e_exists or not col_g_exists:
-                self._apply_header_format(ws, col_e_index if not col_e_exists else None)
-                self._apply_header_format(ws, col_g_index if not col_g_exists else None)
-            
-            # 自動調整 AI 推薦欄位的寬度，確保內容完整顯示
-            self._auto_adjust_column_widths(ws, col_e_index, col_g_index)
-            
-            # 保存檔案，保持所有原有格式
-            wb.save(file_path)
-            wb.close()
-            
-            logger.info(f"成功為現有檔案新增 AI 推薦欄位: {file_path}")
-            logger.info(f"AI推薦 test ID 寫入到第 {col_e_index} 列")
-            logger.info(f"AI推薦 中文 寫入到第 {col_g_index} 列")
-            logger.info(f"共寫入 {len(ai_recommendations)} 筆推薦資料")
-            
-            return True
+            if str(file_path).lower().endswith(('.xlsx', '.xlsm')):
+                try:
+                    return read_sheet_names(file_path)
+                except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+                    logger.warning(f"快速讀取工作表名稱失敗，改用 pandas: {e}")
+            excel_file = pd.ExcelFile(file_path)
+            return excel_file.sheet_names
         except Exception as e:
-            logger.error(f"為現有檔案新增 AI 推薦欄位時發生錯誤: {str(e)}")
-            return False
-    
-    def _apply_data_cell_format(self, cell):
-        """為資料儲存格應用標準格式（與比對結果一致）"""
-        from openpyxl.styles import Font, Border, Side
-        
-        # 設定字體為 Calibri 12
-        cell.font = Font(name="Calibri", size=12)
-        
-        # 設定邊框
-        thin_border = Border(
-            left=Side(style="thin"),
-            right=Side(style="thin"),
-            top=Side(style="thin"),
-            bottom=Side(style="thin")
-        )
-        cell.border = thin_border
-    
-    def _auto_adjust_column_widths(self, worksheet, col_e_index, col_g_index):
+            logger.error(f"獲取工作表名稱時發生錯誤: {str(e)}")
+            return [] 
+
+class ResultFile:
+    """
+    逐一寫入比對結果工作表的輸出檔（由 ExcelHandler.open_results 建立）
+
+    一次寫出（save_results）與背景寫檔共用；同一個輸出檔的 add/close 需依序在同一個執行緒呼叫
+    """
+
+    def __init__(self, handler: ExcelHandler, output_path: Optional[str], export_path: Optional[str]):
         """
-        自動調整 AI 推薦欄位的寬度，確保內容完整顯示
-        
         Args:
-            worksheet: 工作表物件
-            col_e_index: E 欄位索引
-            col_g_index: G 欄位索引
+            handler: 提供輸出設定的 ExcelHandler
+            output_path: xlsx 輸出路徑（只輸出匯出檔時為 None）
+            export_path: 匯出檔路徑（未設定匯出格式時為 None）
         """
-        try:
-            # 定義各欄位的建議寬度
-            column_widths = {
-                col_e_index: 20,  # AI推薦 test ID - 增加寬度
-                col_g_index: 40   # AI推薦 中文 - 大幅增加寬度
-            }
-            
-            # 為每個欄位設定寬度
-            for col_index, width in column_widths.items():
-                if col_index:
-                    worksheet.column_dimensions[worksheet.cell(row=1, column=col_index).column_letter].width = width
-                    logger.info(f"設定第 {col_index} 欄位寬度為 {width}")
-            
-            # 額外檢查：如果內容超過設定寬度，動態調整
-            for col_index in [col_e_index, col_g_index]:
-                if col_index:
-                    max_length = 0
-                    col_letter = worksheet.cell(row=1, column=col_index).column_letter
-                    
-                    # 檢查標題和所有資料行的長度
-                    for row_idx in range(1, worksheet.max_row + 1):
-                        cell_value = worksheet.cell(row=row_idx, column=col_index).value
-                        if cell_value:
-                            # 計算字串長度（中文字算2.5個字元）
-                            str_length = len(str(cell_value))
-                            # 中文字符長度調整
-                            chinese_chars = sum(1 for char in str(cell_value) if '\u4e00' <= char <= '\u9fff')
-                            adjusted_length = str_length + (chinese_chars * 1.5)
-                            max_length = max(max_length, adjusted_length)
-                    
-                    # 設定最小寬度為 15，最大寬度為 80（增加最大寬度）
-                    optimal_width = max(15, min(80, max_length + 3))
-                    worksheet.column_dimensions[col_letter].width = optimal_width
-                    logger.info(f"動態調整第 {col_index} 欄位寬度為 {optimal_width} (內容最大長度: {max_length})")
-            
-        except Exception as e:
-            logger.error(f"自動調整欄位寬度時發生錯誤: {str(e)}")
-    
-    def _apply_header_format(self, worksheet, col_index):
-        """為標題儲存格應用標準格式（與比對結果一致）"""
-        if col_index is None:
-            return
-            
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-        
-        cell = worksheet.cell(row=1, column=col_index)
-        
-        # 設定標題格式（綠色背景，粗體，置中）
-        green_fill = PatternFill(start_color="00C853", end_color="00C853", fill_type="solid")
-        bold_font = Font(name="Calibri", size=12, bold=True)
-        center_alignment = Alignment(horizontal="center", vertical="center")
-        thin_border = Border(
-            left=Side(style="thin"),
-            right=Side(style="thin"),
-            top=Side(style="thin"),
-            bottom=Side(style="thin")
-        )
-        
-        cell.fill = green_fill
-        cell.font = bold_font
-        cell.alignment = center_alignment
-        cell.border = thin_border
+        self.handler = handler
+        self.output_path = output_path
+        self.export_path = export_path
+        self.exporter = ResultExporter(export_path, handler.export_format) if export_path else None
+        self.book = open_workbook(output_path, handler.write_engine) if output_path else None
+        self.sheets: List[str] = []
+        self.highlight_testids: Set[str] = set()
+        self._failed: Optional[str] = None
 
-    def _format_excel(self, file_path: str, highlight_testids: list = None):
-        """格式化Excel檔案，並反白 Test Item All sheet 對應 TestID 行"""
+    def add(self, sheet_name: str, df_result: pd.DataFrame, ai_recommendations: Optional[list] = None):
+        """寫入一個工作表的比對結果（有 AI 推薦時新增 E、F 欄位；狀態欄位只用於匯出檔的比對狀態）"""
         try:
-            wb = load_workbook(file_path)
-            calibri_font = Font(name='Calibri', size=12)
-            bold_font = Font(name='Calibri', size=12, bold=True)
-            thin = Side(border_style="thin", color="000000")
-            border = Border(left=thin, right=thin, top=thin, bottom=thin)
-            green_fill = PatternFill("solid", fgColor="00C853")  # 綠色
-            for ws in wb.worksheets:
-                # 設定標題列樣式
-                for cell in ws[1]:
-                    cell.font = bold_font
-                    cell.border = border
-                    cell.alignment = Alignment(horizontal='center', vertical='center')
-                    cell.fill = green_fill
-                # 設定資料列樣式
-                for row in ws.iter_rows(min_row=2):
-                    for cell in row:
-                        cell.font = calibri_font
-                        cell.border = border
-                        cell.alignment = Alignment(vertical='center')
-                # 自動調整欄寬（優化：考慮中文字、英文、數字）
-                for column in ws.columns:
-                    max_length = 0
-                    column_letter = column[0].column_letter
-                    for cell in column:
-                        try:
-                            if cell.value:
-                                cell_str = str(cell.value)
-                                cell_len = len(cell_str)
-                                # 中文字符長度調整（中文字算2.5個字元，更準確）
-                                chinese_chars = sum(1 for char in cell_str if '\u4e00' <= char <= '\u9fff')
-                                adjusted_len = cell_len + (chinese_chars * 1.5)  # 中文字更寬
-                                max_length = max(max_length, adjusted_len)
-                        except:
-                            pass
-                    # 設定最小寬度為 15，最大寬度為 80（增加最大寬度）
-                    optimal_width = max(15, min(80, max_length + 3))  # 增加邊距
-                    ws.column_dimensions[column_letter].width = optimal_width
-                # 凍結第一列
-                ws.freeze_panes = ws["A2"]
-            # 反白 Test Item All sheet 對應 TestID 行
-            if highlight_testids:
-                try:
-                    ws2 = wb['Test Item All']
-                    for row in ws2.iter_rows(min_row=2):  # 跳過標題
-                        testid_cell = row[2]  # C欄
-                        if str(testid_cell.value).strip() in highlight_testids:
-                            for cell in row:
-                                cell.fill = green_fill
-                except Exception as e:
-                    pass  # 若 sheet 名稱或格式異常不影響主流程
-            wb.save(file_path)
-            logger.info("成功格式化Excel檔案")
-        except Exception as e:
-            logger.error(f"格式化Excel檔案時發生錯誤: {str(e)}")
+            if ai_recommendations:
+                df_result = self.handler._add_ai_recommendations(df_result, ai_recommendations)
+            if self.exporter is not None:
+                self.exporter.write(export_frame(df_result, sheet_name))
+            if self.book is not None:
+                write_frame(self.book, sheet_name, without_flags(df_result))
+            # highlight_testids: 來源TestID（Test Item All 反白或篩選 Test Item Used 用）
+            if self.book is not None:
+                self.highlight_testids.update(testid_keys(df_result['你寫的 Error Code']))
+            self.sheets.append(sheet_name)
+        except Exception:
+            self._failed = sheet_name
+            raise
 
-    def get_sheet_names(self, file_path: str) -> list:
-        """獲取Excel檔案中的所有工作表名稱"""
-        try:
-            excel_file = pd.ExcelFile(file_path)
-            return excel_file.sheet_names
-        except Exception as e:
-            logger.error(f"獲取工作表名稱時發生錯誤: {str(e)}")
-            return [] 
\ No newline at end of file
+    def close(self, df_error_codes: pd.DataFrame, metadata: Optional[pd.DataFrame] = None,
+              reference_path: Optional[str] = None) -> str:
+        """
+        寫入參考工作表與中繼資料並存檔（參數同 save_results）
+
+        Returns:
+            str: 實際寫出的主要檔案
+        """
+        if self._failed is not None:
+            raise RuntimeError(f"工作表 {self._failed} 寫入失敗，未儲存輸出檔")
+        if self.exporter is not None:
+            self.exporter.close()
+            logger.info(f"成功匯出比對結果（{self.handler.export_format}）: {self.export_path}")
+        if self.book is None:
+            return self.export_path
+        # 逐列寫出的活頁簿一次寫出：標題、框線、欄寬、凍結窗格與反白都在寫出時套用
+        self.handler.write_reference_sheets(self.book, df_error_codes, self.highlight_testids, reference_path)
+        if metadata is not None:
+            self.book.add_hidden_sheet(META_SHEET_NAME, metadata)
+        self.book.save()
+        logger.info(f"成功儲存比對結果: {self.output_path}")
+        return self.output_path
@@ -0,0 +1,146 @@
+"""
+Excel 讀取引擎模組
+提供可切換的讀取後端（openpyxl、openpyxl 唯讀串流、calamine），
+由 setup.txt 的 ExcelReadEngine 選擇，供 ExcelHandler、參考資料與查詢工具共用
+"""
+import logging
+import pandas as pd
+from pandas.io.parsers import TextParser
+from typing import Iterator, Tuple, Optional, Dict, Type
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENGINE = "auto"
+
+
+class ExcelReader:
+    """讀取引擎基底類別"""
+    name = ""
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """此引擎需要的套件是否已安裝"""
+        return True
+
+    def read_sheet(self, file_path: str, sheet_name: str) -> pd.DataFrame:
+        """讀取整個工作表（等同 pd.read_excel(..., header=None)）"""
+        raise NotImplementedError
+
+    def iter_rows(self, file_path: str, sheet_name: str) -> Iterator[Tuple]:
+        """逐列串流讀取工作表的值（空白儲存格為 None）"""
+        from openpyxl import load_workbook
+        wb = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            yield from wb[sheet_name].iter_rows(values_only=True)
+        finally:
+            wb.close()
+
+
+class OpenpyxlReader(ExcelReader):
+    """pandas 預設的 openpyxl 引擎（原本的讀取方式）"""
+    name = "openpyxl"
+
+    def read_sheet(self, file_path: str, sheet_name: str) -> pd.DataFrame:
+        return pd.read_excel(file_path, sheet_name=sheet_name, header=None, engine="openpyxl")
+
+
+class OpenpyxlReadOnlyReader(ExcelReader):
+    """直接以 openpyxl read_only / values_only 串流讀取，略過 pandas 的逐格轉換"""
+    name = "openpyxl_readonly"
+
+    def read_sheet(self, file_path: str, sheet_name: str) -> pd.DataFrame:
+        rows = []
+        last_used = 0
+        for row in self.iter_rows(file_path, sheet_name):
+            # 與 pandas 相同：去除列尾空白、空白為空字串、整數值的浮點數轉為整數
+            end = len(row)
+            while end and row[end - 1] is None:
+                end -= 1
+            rows.append([
+                '' if v is None else (int(v) if isinstance(v, float) and v.is_integer() else v)
+                for v in row[:end]
+            ])
+            if end:
+                last_used = len(rows)
+        rows = rows[:last_used]
+        if not rows:
+            return pd.DataFrame()
+        # 補齊每列長度後交給 pandas 同一個 TextParser 做型別推斷
+        width = max(len(r) for r in rows)
+        rows = [r + [''] * (width - len(r)) for r in rows]
+        return TextParser(rows, header=None).read()
+
+
+class XlsxStreamReader(OpenpyxlReadOnlyReader):
+    """
+    直接以 iterparse 逐列解析 xlsx 工作表 XML（僅支援 xlsx/xlsm），記憶體用量與行數無關；
+    供串流比對使用，不列入 ExcelReadEngine 選項
+    """
+    name = "xlsx_stream"
+
+    def iter_rows(self, file_path: str, sheet_name: str) -> Iterator[Tuple]:
+        from xlsx_stream import iter_sheet_rows
+        yield from iter_sheet_rows(file_path, sheet_name)
+
+
+class CalamineReader(ExcelReader):
+    """Rust 實作的 calamine 引擎（需安裝 python-calamine，pandas >= 2.2）"""
+    name = "calamine"
+
+    @classmethod
+    def is_available(cls) -> bool:
+        # pandas 2.2 起才支援 engine="calamine"
+        major, minor = (int(part) for part in pd.__version__.split('.')[:2])
+        if (major, minor) < (2, 2):
+            return False
+        try:
+            import python_calamine  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def read_sheet(self, file_path: str, sheet_name: str) -> pd.DataFrame:
+        return pd.read_excel(file_path, sheet_name=sheet_name, header=None, engine="calamine")
+
+    def iter_rows(self, file_path: str, sheet_name: str) -> Iterator[Tuple]:
+        from python_calamine import CalamineWorkbook
+        sheet = CalamineWorkbook.from_path(file_path).get_sheet_by_name(sheet_name)
+        for row in sheet.to_python(skip_empty_area=False):
+            # 與 openpyxl 一致：空白為 None、整數值不帶小數
+            yield tuple(
+                None if v == '' else (int(v) if isinstance(v, float) and v.is_integer() else v)
+                for v in row
+            )
+
+
+READERS: Dict[str, Type[ExcelReader]] = {
+    reader.name: reader for reader in (OpenpyxlReader, OpenpyxlReadOnlyReader, CalamineReader)
+}
+
+
+def get_reader(engine: Optional[str] = None) -> ExcelReader:
+    """
+    依名稱取得讀取引擎
+
+    Args:
+        engine: "auto"、"openpyxl"、"openpyxl_readonly" 或 "calamine"；auto 會優先使用已安裝的 calamine
+
+    Returns:
+        ExcelReader: 讀取引擎，指定的引擎無法使用時退回 openpyxl
+    """
+    engine = (engine or DEFAULT_ENGINE).strip().lower()
+    if engine == "auto":
+        return CalamineReader() if CalamineReader.is_available() else OpenpyxlReader()
+    reader_cls = READERS.get(engine)
+    if reader_cls is None:
+        logger.warning(f"未知的讀取引擎 {engine}，改用 openpyxl")
+        return OpenpyxlReader()
+    if not reader_cls.is_available():
+        logger.warning(f"讀取引擎 {engine} 未安裝，改用 openpyxl")
+        return OpenpyxlReader()
+    return reader_cls()
+
+
+def get_reader_from_config(config_manager) -> ExcelReader:
+    """依 setup.txt 的 ExcelReadEngine 取得讀取引擎"""
+    return get_reader(config_manager.get('ExcelReadEngine', DEFAULT_ENGINE))
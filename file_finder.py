@@ -68,6 +68,32 @@ class FileFinder:
         
         return excel_files
     
+    @staticmethod
+    def find_source_files(directory: str) -> List[str]:
+        """
+        搜尋資料夾中的 TestFlow 來源檔案（不含子目錄）
+        排除比對結果、參考檔案（Test Item Code）與 Excel 暫存檔
+
+        Args:
+            directory: 搜尋目錄
+
+        Returns:
+            List[str]: 依檔名排序的檔案路徑列表
+        """
+        source_files = []
+        for name in sorted(os.listdir(directory)):
+            if not name.lower().endswith(('.xlsx', '.xlsm', '.xls')):
+                continue
+            if name.startswith('~$') or name.startswith('Test Item Code'):
+                continue
+            if '_compare_ERRORCODE' in name or name.startswith('compare_summary'):
+                continue
+            file_path = os.path.join(directory, name)
+            if os.path.isfile(file_path):
+                source_files.append(file_path)
+        logger.info(f"在 {directory} 中找到 {len(source_files)} 個來源檔案")
+        return source_files
+
     @staticmethod
     def get_file_info(file_path: str) -> dict:
         """
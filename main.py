@@ -1,8 +1,15 @@
 """
 主程式檔案
 整合所有模組，提供程式的主要入口點
-包含錯誤碼比對和錯誤碼查詢兩個功能
+包含錯誤碼比對和錯誤碼查詢兩個功能；python main.py compare ... 為不載入視窗介面的命令列模式（見 cli.py）
 """
+import sys
+
+if __name__ == "__main__" and len(sys.argv) > 1 and sys.argv[1] == "compare":
+    # 命令列模式在載入 tkinter / ttkbootstrap / PIL 之前分流
+    from cli import main as cli_main
+    sys.exit(cli_main(sys.argv[1:]))
+
 import tkinter as tk
 from tkinter import ttk
 import ttkbootstrap as tb
@@ -10,14 +17,23 @@ import logging
 from pathlib import Path
 from config_manager import ConfigManager
 from ui_manager import UIManager
-from excel_handler import ExcelHandler
+from excel_handler import ExcelHandler, REFERENCE_FULL
+from compare_pipeline import ComparePipeline, CompareError, output_path_for
+from reference_cache import ReferenceCache
+from excel_reader import get_reader_from_config
 from guide_popup.guide import show_guide
 from excel_errorcode_search_ui import ExcelErrorCodeSearchUI
 from ai_recommendation_engine import AIRecommendationEngine
 from ai_prompt_templates import AIPromptTemplates
 from file_finder import FileFinder
-import pandas as pd
+from batch_compare import compare_directory
+from stream_compare import should_stream
+from styled_writer import HIGHLIGHT_STATIC, DEFAULT_WRITE_ENGINE
+from background_writer import BackgroundWriter
+from concurrent.futures import Future
+import queue
 import threading
+import multiprocessing
 import subprocess
 import platform
 import os
@@ -33,6 +49,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 主執行緒取出背景寫檔通知的間隔（毫秒）
+UI_POLL_MS = 100
+
 class ErrorCodeTool:
     """主流程控制類別，整合錯誤碼比對和查詢功能"""
     def __init__(self):
@@ -52,13 +71,40 @@ class ErrorCodeTool:
         self.ui_manager = UIManager(self.root, self.config_manager)
         self.ui_manager.set_search_callback(self.toggle_search_ui)
         
-        # 初始化Excel處理器
-        self.excel_handler = ExcelHandler()
+        # 初始化Excel處理器（讀取引擎由 setup.txt 的 ExcelReadEngine 決定）
+        self.excel_reader = get_reader_from_config(self.config_manager)
+        self.excel_handler = ExcelHandler(
+            self.excel_reader, highlight_mode=self.config_manager.get('HighlightMode', HIGHLIGHT_STATIC),
+            write_engine=self.config_manager.get('WriteEngine', DEFAULT_WRITE_ENGINE),
+            reference_sheet=self.config_manager.get('ReferenceSheet', REFERENCE_FULL),
+            export_format=self.config_manager.get('ExportFormat', ''),
+            export_only=self.config_manager.get('ExportOnly', '0') == '1'
+        )
+        
+        # 參考檔案解析結果的磁碟快取（setup.txt 的 ReferenceCacheEnabled 可關閉）
+        self.reference_cache = ReferenceCache.from_config(self.config_manager)
+        self.reference_fast_parser = self.config_manager.get('ReferenceFastParser', '1') == '1'
         
         # 初始化AI推薦引擎
-        self.ai_engine = AIRecommendationEngine()
+        self.ai_engine = AIRecommendationEngine(self.excel_reader)
         self.prompt_templates = AIPromptTemplates()
         
+        # 單一工作表比對流程（各階段依輸入指紋快取，重複比對時略過未變更的階段）
+        self.pipeline = ComparePipeline(
+            self.excel_handler, self.ai_engine, self.excel_reader,
+            cache=self.reference_cache, fast_parser=self.reference_fast_parser
+        )
+        
+        # 背景寫檔：比對執行緒送出存檔後即可結束，寫檔狀態與比對狀態分開顯示；
+        # 背景執行緒不直接操作視窗，改由主執行緒定期取出 _ui_calls 執行
+        self._ui_calls: queue.Queue = queue.Queue()
+        self.background_writer = BackgroundWriter(
+            on_change=lambda pending: self._run_on_ui(self.ui_manager.update_write_status, pending)
+        )
+        self.root.after(UI_POLL_MS, self._poll_ui_calls)
+        # 比對、AI 推薦與資料夾比對共用同一個流程，同時間只執行一個
+        self._task_running = threading.Event()
+        
         # 初始化錯誤碼查詢UI
         self.search_ui = ExcelErrorCodeSearchUI(parent=self.root, offset_x=100, offset_y=80)
         self.search_ui.root.withdraw()
@@ -69,6 +115,9 @@ class ErrorCodeTool:
         # 設定比對按鈕的命令
         self.ui_manager.set_compare_command(self.compare_files)
         
+        # 設定比對資料夾按鈕的命令
+        self.ui_manager.set_compare_dir_command(self.compare_directory)
+        
         # 設定開啟結果檔案按鈕的命令
         self.ui_manager.set_open_result_callback(self.open_result_files)
         
@@ -93,9 +142,91 @@ class ErrorCodeTool:
         except Exception as e:
             logger.error(f"主視窗關閉時保存 Test Item 文件路徑發生錯誤: {str(e)}")
         
+        # 等待背景寫檔完成，避免輸出檔只寫了一半
+        if self.background_writer.pending:
+            self.ui_manager.update_status("等待比對結果寫入完成...", "orange")
+        self.background_writer.shutdown(wait=True)
+        
         # 關閉主視窗
         self.root.destroy()
 
+    def _run_on_ui(self, func, *args):
+        """由主執行緒執行 func（可在任何執行緒呼叫）"""
+        self._ui_calls.put((func, args))
+
+    def _call_on_ui(self, func, *args):
+        """由主執行緒執行 func 並等待其回傳值（背景執行緒需要使用者回應時使用，例如確認對話框）"""
+        if threading.current_thread() is threading.main_thread():
+            return func(*args)
+        future: Future = Future()
+
+        def run():
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+        self._run_on_ui(run)
+        return future.result()
+
+    def _start_task(self, target) -> bool:
+        """
+        在背景執行緒執行 target（執行期間顯示處理中游標），已有工作在執行時忽略這次點擊
+
+        Returns:
+            bool: 是否已開始執行
+        """
+        if self._task_running.is_set():
+            self.ui_manager.update_status("上一個比對仍在執行中，請稍候...", "orange")
+            return False
+        self._task_running.set()
+        self.root.config(cursor="wait")
+
+        def run():
+            try:
+                target()
+            finally:
+                self._run_on_ui(self._finish_task)
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+    def _finish_task(self):
+        """背景工作結束後由主執行緒還原游標並允許下一次執行"""
+        self.root.config(cursor="")
+        self._task_running.clear()
+
+    def _poll_ui_calls(self):
+        """執行背景執行緒排入的介面更新"""
+        while True:
+            try:
+                func, args = self._ui_calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"更新介面時發生錯誤: {str(e)}")
+        self.root.after(UI_POLL_MS, self._poll_ui_calls)
+
+    def _notify_when_written(self, future: Future, message: str, ask_open: bool = True):
+        """
+        背景寫檔完成後由主執行緒更新狀態，並詢問是否開啟結果
+
+        Args:
+            future: 背景寫檔的 Future（結果為寫出的檔案）
+            message: 完成訊息，{file} 代入寫出的檔名
+            ask_open: 是否詢問開啟結果
+        """
+        def on_done(done: Future):
+            try:
+                written = done.result()
+            except Exception as e:
+                self.ui_manager.update_status(f"儲存結果失敗: {str(e)[:100]}", "red")
+                return
+            self.ui_manager.update_status(message.format(file=os.path.basename(written)), "green")
+            if ask_open:
+                self._ask_open_file(written)
+        future.add_done_callback(lambda done: self._run_on_ui(on_done, done))
+
     def toggle_search_ui(self):
         """切換查詢 UI 浮動視窗顯示/隱藏，若視窗已被關閉則重建"""
         try:
@@ -136,138 +267,258 @@ class ErrorCodeTool:
     def compare_files(self):
         """比對檔案（在背景執行緒執行，避免UI卡住）"""
         def do_compare():
+            self.ui_manager.show_progress(True)
+            self.ui_manager.update_progress(0, 100)
+            self.ui_manager.update_status("正在進行檔案比對...", "orange")
+            return self._run_compare(with_ai=True)
+        self._start_task(do_compare)
+
+    def _run_compare(self, with_ai: bool) -> bool:
+        """
+        依序執行比對流程各階段（輸入未變更的階段由 ComparePipeline 沿用上次結果）
+
+        Args:
+            with_ai: 是否在寫檔前執行 AI 推薦（與比對結果一起寫出）並開啟結果
+
+        Returns:
+            bool: 是否成功
+        """
+        reference_path = self.ui_manager.excel1_path
+        source_path = self.ui_manager.excel2_path
+        sheet_name = self.ui_manager.get_selected_sheet()
+        not_found = self.config_manager.get('NotFound')
+        not_found_cn = self.config_manager.get('NotFoundCN')
+        try:
+            # 檢查必要檔案是否已選擇
+            self.ui_manager.update_status("檢查檔案設定...", "orange")
+            self.ui_manager.update_progress(10, 100)
+            if not all([reference_path, source_path, sheet_name]):
+                self.ui_manager.update_status("請選擇所有必要的檔案和工作表", "red")
+                self.ui_manager.show_progress(False)
+                return False
+
+            # 載入錯誤碼檔案
+            self.ui_manager.update_status("載入錯誤碼檔案...", "orange")
+            self.ui_manager.update_progress(20, 100)
+            reference = self.pipeline.load_reference(reference_path)
+
+            # 比對全部工作表：參考檔案只載入一次，各測站輸出到同一個活頁簿
+            if self.ui_manager.get_compare_all_option():
+                return self._compare_all_sheets(reference)
+
+            # 超過 StreamCompareMinRows 行的工作表改用串流比對，記憶體用量與行數無關
+            if should_stream(source_path, sheet_name, int(self.config_manager.get('StreamCompareMinRows', '200000'))):
+                return self._stream_compare(reference_path, source_path, sheet_name, not_found, not_found_cn)
+
+            # 載入來源工作表並比對
+            self.ui_manager.update_status("載入來源工作表...", "orange")
+            self.ui_manager.update_progress(40, 100)
+            self.pipeline.load_source(source_path, sheet_name)
+            self.ui_manager.update_status("執行資料比對...", "orange")
+            self.ui_manager.update_progress(80, 100)
+            # 輸出檔案與來源檔案放在同一目錄（比對時沿用其中上次的結果）
+            output_path = output_path_for(source_path)
+            self.pipeline.match(reference_path, source_path, sheet_name, output_path, not_found, not_found_cn)
+
+            # 檔案需重新寫入時才檢查覆蓋
+            self.ui_manager.update_status("準備儲存檔案...", "orange")
+            self.ui_manager.update_progress(85, 100)
+            if Path(self.excel_handler.output_file(output_path)).exists() and self.pipeline.needs_write(
+                    reference_path, source_path, sheet_name, output_path, not_found, not_found_cn, with_ai):
+                if self.ui_manager.get_overwrite_option():
+                    # 如果勾選了覆蓋選項，直接覆蓋，不顯示對話框
+                    self.ui_manager.update_status("檔案已存在，將直接覆蓋...", "orange")
+                elif not self._call_on_ui(self._confirm_overwrite, output_path):
+                    # 如果沒有勾選覆蓋選項，由主執行緒顯示確認對話框
+                    return False
+
+            progress_callback = None
+            if with_ai:
+                # AI 推薦分析（進度從 90% 更新到 100%），推薦結果與比對結果一起寫出
+                self.ui_manager.update_status("比對完成！正在進行 AI 推薦分析...", "green")
+
+                def progress_callback(current, total, message):
+                    self.ui_manager.update_status(message, "orange")
+                    self.ui_manager.update_progress(int(90 + (current / total) * 10), 100)
+
+            # 儲存結果（含反白與 AI 推薦）交給背景寫檔，完成後更新狀態並詢問是否要打開文件
+            self.ui_manager.update_progress(90, 100)
+            future = self.pipeline.write_async(self.background_writer, reference_path, source_path, sheet_name,
+                                               output_path, not_found, not_found_cn, with_ai=with_ai,
+                                               progress_callback=progress_callback)
+            # 更新最後使用的輸出目錄
+            self.config_manager.update_last_paths(output_dir=str(Path(output_path).parent))
+            self.ui_manager.update_progress(100, 100)
+            self.ui_manager.update_status("比對完成！正在寫入結果...", "orange")
+            self.ui_manager.show_progress(False)
+            if not with_ai:
+                self._notify_when_written(future, "比對完成！結果已儲存於：{file}", ask_open=False)
+            else:
+                self._notify_when_written(future, "AI 推薦分析完成！結果已儲存於：{file}")
+            return True
+        except CompareError as e:
+            self.ui_manager.update_status(str(e), "red")
+            self.ui_manager.show_progress(False)
+            return False
+        except Exception as e:
+            logger.error(f"比對檔案時發生錯誤: {str(e)}")
+            self.ui_manager.update_status(f"比對失敗: {str(e)[:100]}", "red")
+            self.ui_manager.show_progress(False)
+            return False
+
+    def _confirm_overwrite(self, output_path: str) -> bool:
+        """輸出檔案已存在且未勾選覆蓋時詢問使用者，取消時回傳 False（顯示對話框，須在主執行緒呼叫）"""
+        output_path = self.excel_handler.output_file(output_path)
+        if Path(output_path).exists() and not self.ui_manager.get_overwrite_option():
+            if not self.ui_manager.ask_yes_no(
+                self.config_manager.get('FileExistsTitle'),
+                self.config_manager.get('FileExistsMsg').format(output_path=output_path)
+            ):
+                self.ui_manager.show_info(
+                    self.config_manager.get('CancelTitle'),
+                    self.config_manager.get('CancelMsg')
+                )
+                self.ui_manager.show_progress(False)
+                return False
+        return True
+
+    def _stream_compare(self, reference_path: str, source_path: str, sheet_name: str,
+                        not_found: str, not_found_cn: str) -> bool:
+        """超大工作表改用串流比對：逐區塊比對並直接寫入輸出檔案（不執行 AI 推薦）"""
+        output_path = output_path_for(source_path)
+        if not self._call_on_ui(self._confirm_overwrite, output_path):
+            return False
+        self.ui_manager.update_status(f"工作表 {sheet_name} 行數眾多，改用串流比對（不執行 AI 推薦）...", "orange")
+        self.ui_manager.update_progress(50, 100)
+        chunk_rows = int(self.config_manager.get('StreamChunkRows', '50000'))
+        rows, _ = self.pipeline.stream(reference_path, source_path, sheet_name, output_path,
+                                       not_found, not_found_cn, chunk_rows)
+        self.config_manager.update_last_paths(output_dir=str(Path(output_path).parent))
+        self.ui_manager.update_progress(100, 100)
+        written = self.excel_handler.output_file(output_path)
+        self.ui_manager.update_status(f"串流比對完成（{rows} 行）！結果已儲存於：{os.path.basename(written)}", "green")
+        self.ui_manager.show_progress(False)
+        self._run_on_ui(self._ask_open_file, written)
+        return True
+
+    def _compare_all_sheets(self, reference):
+        """比對來源檔案的所有測站工作表（平行載入），結果寫入同一個活頁簿，每個測站一個工作表"""
+        sheets = self.ui_manager.get_station_sheets()
+        if not sheets:
+            self.ui_manager.update_status("來源檔案沒有可比對的工作表", "red")
+            self.ui_manager.show_progress(False)
+            return False
+
+        # 平行載入所有來源工作表
+        self.ui_manager.update_status(f"載入 {len(sheets)} 個來源工作表...", "orange")
+        self.ui_manager.update_progress(40, 100)
+        workers = int(self.config_manager.get('BatchCompareWorkers', '4'))
+        sources = self.excel_handler.load_source_sheets(self.ui_manager.excel2_path, sheets, workers)
+
+        # 逐一比對，找不到欄位的工作表略過
+        self.ui_manager.update_status("執行資料比對...", "orange")
+        self.ui_manager.update_progress(60, 100)
+        testid_index = reference.testid_index()
+        results = {}
+        skipped = []
+        for sheet_name, df_source in sources.items():
+            df_merge = None
+            if df_source is not None:
+                df_merge = self.excel_handler.build_compare_result(
+                    df_source, testid_index,
+                    self.config_manager.get('NotFound'), self.config_manager.get('NotFoundCN')
+                )
+            if df_merge is None:
+                skipped.append(sheet_name)
+                continue
+            results[sheet_name] = df_merge
+        if skipped:
+            logger.warning(f"以下工作表找不到 Description 或 TestID 欄位，已略過: {skipped}")
+        if not results:
+            self.ui_manager.update_status("所有工作表都找不到 Description 或 TestID 欄位", "red")
+            self.ui_manager.show_progress(False)
+            return False
+
+        output_path = output_path_for(self.ui_manager.excel2_path)
+        if not self._call_on_ui(self._confirm_overwrite, output_path):
+            return False
+
+        try:
+            # 同一輸出檔上次的背景寫檔完成後才建立新的輸出檔
+            self.pipeline.wait_for_write(output_path)
+            result_file = self.excel_handler.open_results(output_path)
+        except Exception as e:
+            logger.error(f"建立輸出檔案時發生錯誤: {str(e)}")
+            self.ui_manager.update_status("儲存結果失敗", "red")
+            self.ui_manager.show_progress(False)
+            return False
+
+        # AI 推薦在寫檔前完成；每個工作表推薦完成即交給背景寫檔，與下一個工作表的推薦重疊
+        ai_ready = self.ai_engine.load_reference_data(self.ui_manager.excel1_path, reference)
+        for index, (sheet_name, df_merge) in enumerate(results.items()):
+            recommendations = None
+            if ai_ready:
+                self.ui_manager.update_status(f"AI 推薦分析 {sheet_name}（{index + 1}/{len(results)}）...", "orange")
+                self.ui_manager.update_progress(70 + int(20 * index / len(results)), 100)
+                descriptions = df_merge['你的 description'].fillna('').astype(str).tolist()
+                recommendations = self.ai_engine.generate_recommendations_with_search(descriptions)
+            self.background_writer.submit(result_file.add, sheet_name, df_merge, recommendations)
+        future = self.background_writer.submit(result_file.close, reference.output_frame(),
+                                               reference_path=reference.file_path)
+        self.pipeline.track_write(output_path, future)
+
+        self.config_manager.update_last_paths(output_dir=str(Path(output_path).parent))
+        self.ui_manager.update_progress(100, 100)
+        self.ui_manager.update_status("比對完成！正在寫入結果...", "orange")
+        self.ui_manager.show_progress(False)
+        message = f"已比對 {len(results)} 個工作表，結果已儲存於：{{file}}"
+        if skipped:
+            message += f"（略過 {len(skipped)} 個）"
+        self._notify_when_written(future, message)
+        return True
+
+    def compare_directory(self):
+        """比對資料夾中的所有 TestFlow 檔案（多程序，在背景執行緒等待結果）"""
+        if not self.ui_manager.excel1_path:
+            self.ui_manager.update_status("請先選擇錯誤碼檔案", "red")
+            return
+        if self._task_running.is_set():
+            self.ui_manager.update_status("上一個比對仍在執行中，請稍候...", "orange")
+            return
+        directory = self.ui_manager.ask_directory()
+        if not directory:
+            return
+
+        def do_compare_directory():
             try:
-                # 顯示進度條
                 self.ui_manager.show_progress(True)
                 self.ui_manager.update_progress(0, 100)
-                self.ui_manager.update_status("正在進行檔案比對...", "orange")
-                
-                # 檢查必要檔案是否已選擇
-                self.ui_manager.update_status("檢查檔案設定...", "orange")
-                self.ui_manager.update_progress(10, 100)
-                if not all([self.ui_manager.excel1_path, 
-                           self.ui_manager.excel2_path, 
-                           self.ui_manager.get_selected_sheet()]):
-                    self.ui_manager.update_status("請選擇所有必要的檔案和工作表", "red")
-                    self.ui_manager.show_progress(False)
-                    return False
-
-                # 載入錯誤碼檔案
                 self.ui_manager.update_status("載入錯誤碼檔案...", "orange")
-                self.ui_manager.update_progress(20, 100)
-                if not self.excel_handler.load_error_codes(self.ui_manager.excel1_path):
-                    self.ui_manager.update_status("載入錯誤碼檔案失敗", "red")
-                    self.ui_manager.show_progress(False)
-                    return False
+                reference = self.pipeline.load_reference(self.ui_manager.excel1_path)
 
-                # 載入來源工作表
-                self.ui_manager.update_status("載入來源工作表...", "orange")
-                self.ui_manager.update_progress(40, 100)
-                df_source = self.excel_handler.load_source_sheet(
-                    self.ui_manager.excel2_path,
-                    self.ui_manager.get_selected_sheet()
-                )
-                if df_source is None:
-                    self.ui_manager.update_status("載入來源工作表失敗", "red")
-                    self.ui_manager.show_progress(False)
-                    return False
+                def progress_callback(done, total, message):
+                    self.ui_manager.update_status(message, "orange")
+                    self.ui_manager.update_progress(int(done / total * 100), 100)
 
-                # 優化比對：用 merge 取代 for 迴圈
-                self.ui_manager.update_status("載入參考資料...", "orange")
-                self.ui_manager.update_progress(60, 100)
-                df_error_codes = pd.read_excel(self.ui_manager.excel1_path, sheet_name="Test Item All")
-                # 取 C欄(TestID)、D欄(Description)、E欄(ChineseDesc)
-                df_error_codes = df_error_codes.iloc[:, [2, 3, 4]]
-                df_error_codes.columns = ['TestID', 'Description', 'ChineseDesc']
-                
-                # 找來源的 Description, TestID 欄位
-                self.ui_manager.update_status("分析資料結構...", "orange")
-                self.ui_manager.update_progress(70, 100)
-                desc_col = self.excel_handler.find_column(df_source, 'Description')
-                testid_col = self.excel_handler.find_column(df_source, 'TestID')
-                if not desc_col or not testid_col:
-                    self.ui_manager.update_status(f"找不到 Description 或 TestID 欄位，實際欄位: {df_source.columns.tolist()[:5]}", "red")
-                    self.ui_manager.show_progress(False)
-                    return False
-                
-                # 執行比對
-                self.ui_manager.update_status("執行資料比對...", "orange")
-                self.ui_manager.update_progress(80, 100)
-                df_result = df_source[[desc_col, testid_col]].copy()
-                df_result.columns = ['你的 description', '你寫的 Error Code']
-                # merge
-                df_merge = pd.merge(
-                    df_result,
-                    df_error_codes,
-                    how='left',
-                    left_on='你寫的 Error Code',
-                    right_on='TestID'
+                workers = int(self.config_manager.get('DirectoryCompareWorkers', '0'))
+                summary_path = compare_directory(
+                    directory, reference,
+                    self.config_manager.get('NotFound'), self.config_manager.get('NotFoundCN'),
+                    max_workers=workers, progress_callback=progress_callback,
+                    handler_options=self.excel_handler.output_options()
                 )
-                df_merge['Test Item 文件的 description'] = df_merge['Description'].fillna(self.config_manager.get('NotFound'))
-                df_merge['Test Item 的 Error Code'] = df_merge['ChineseDesc'].fillna(self.config_manager.get('NotFoundCN'))
-                df_merge = df_merge[['你的 description', '你寫的 Error Code', 'Test Item 文件的 description', 'Test Item 的 Error Code']]
-                
-                # 準備輸出路徑
-                self.ui_manager.update_status("準備儲存檔案...", "orange")
-                self.ui_manager.update_progress(85, 100)
-                output_path = str(Path(self.ui_manager.excel2_path).with_name(
-                    f"{Path(self.ui_manager.excel2_path).stem}_compare_ERRORCODE.xlsx"
-                ))
-                
-                # 檢查檔案是否存在
-                if Path(output_path).exists():
-                    # 檢查是否要覆蓋檔案
-                    if not self.ui_manager.get_overwrite_option():
-                        # 如果沒有勾選覆蓋選項，顯示確認對話框
-                        if not self.ui_manager.ask_yes_no(
-                            self.config_manager.get('FileExistsTitle'),
-                            self.config_manager.get('FileExistsMsg').format(output_path=output_path)
-                        ):
-                            self.ui_manager.show_info(
-                                self.config_manager.get('CancelTitle'),
-                                self.config_manager.get('CancelMsg')
-                            )
-                            self.ui_manager.show_progress(False)
-                            return False
-                    else:
-                        # 如果勾選了覆蓋選項，直接覆蓋，不顯示對話框
-                        self.ui_manager.update_status("檔案已存在，將直接覆蓋...", "orange")
-                
-                # 儲存結果（含反白）
-                self.ui_manager.update_status("儲存比對結果...", "orange")
-                self.ui_manager.update_progress(90, 100)
-                if self.excel_handler.save_result(
-                    df_merge,
-                    pd.read_excel(self.ui_manager.excel1_path, sheet_name="Test Item All"),
-                    output_path,
-                    self.ui_manager.get_selected_sheet()
-                ):
-                    self.ui_manager.update_progress(90, 100)
-                    self.ui_manager.update_status("比對完成！正在進行 AI 推薦分析...", "green")
-                    
-                    # 更新最後使用的輸出目錄
-                    self.config_manager.update_last_paths(
-                        output_dir=str(Path(output_path).parent)
-                    )
-                    
-                    # 自動執行 AI 推薦分析
-                    self._perform_ai_recommendation(output_path)
-                    
-                    return True
+                if summary_path:
+                    self.ui_manager.update_status(f"資料夾比對完成！彙總已儲存於：{os.path.basename(summary_path)}", "green")
+                    self._run_on_ui(self._ask_open_file, summary_path)
                 else:
-                    self.ui_manager.update_status("儲存結果失敗", "red")
-                    self.ui_manager.show_progress(False)
-                    return False
+                    self.ui_manager.update_status("資料夾比對失敗或沒有可比對的檔案", "red")
             except Exception as e:
-                logger.error(f"比對檔案時發生錯誤: {str(e)}")
-                self.ui_manager.update_status(f"比對失敗: {str(e)[:100]}", "red")
-                self.ui_manager.show_progress(False)
-                return False
+                logger.error(f"資料夾比對時發生錯誤: {str(e)}")
+                self.ui_manager.update_status(f"資料夾比對失敗: {str(e)[:100]}", "red")
             finally:
-                self.root.config(cursor="")
-        # 執行時顯示處理中游標
-        self.root.config(cursor="wait")
-        threading.Thread(target=do_compare, daemon=True).start()
+                self.ui_manager.show_progress(False)
+
+        self._start_task(do_compare_directory)
 
     def load_sheets(self, excel_path):
         """載入 Excel 檔案的所有 sheet 名稱並更新 UI"""
@@ -301,222 +552,19 @@ class ErrorCodeTool:
                     self.ui_manager.update_status("請先選擇要分析的 Excel 檔案", "red")
                     return
                 
-                # 檢查是否已有比對結果檔案
-                output_file = self._get_expected_output_file()
-                
-                if not os.path.exists(output_file):
-                    # 如果沒有比對結果檔案，先執行比對
-                    self.ui_manager.update_status("未找到比對結果檔案，正在自動執行比對...", "orange")
-                    
-                    # 執行比對功能
-                    success = self._perform_comparison()
-                    if not success:
-                        self.ui_manager.update_status("自動比對失敗，無法進行 AI 推薦分析", "red")
-                        return
-                
-                # 現在進行 AI 推薦分析
-                self._perform_ai_recommendation(output_file)
+                # 與比對共用同一流程：比對結果未變更時只執行 AI 推薦階段
+                self._run_compare(with_ai=True)
                 
             except Exception as e:
                 logger.error(f"AI 推薦分析時發生錯誤: {str(e)}")
                 self.ui_manager.update_status(f"AI 推薦分析失敗: {str(e)[:100]}", "red")
                 self.ui_manager.show_progress(False)
-            finally:
-                self.root.config(cursor="")
         
-        self.root.config(cursor="wait")
-        threading.Thread(target=do_ai_analysis, daemon=True).start()
-
-    def _get_expected_output_file(self):
-        """取得預期的輸出檔案路徑"""
-        base_name = os.path.splitext(os.path.basename(self.ui_manager.excel2_path))[0]
-        return os.path.join("EXCEL", f"{base_name}_compare_ERRORCODE.xlsx")
+        self._start_task(do_ai_analysis)
 
     def _perform_comparison(self):
-        """執行比對功能（同步版本）"""
-        try:
-            # 更新狀態列
-            self.ui_manager.update_status("正在進行檔案比對...", "orange")
-            
-            # 檢查必要檔案是否已選擇
-            if not all([self.ui_manager.excel1_path, 
-                       self.ui_manager.excel2_path, 
-                       self.ui_manager.get_selected_sheet()]):
-                self.ui_manager.update_status("請選擇所有必要的檔案和工作表", "red")
-                return False
-
-            # 載入錯誤碼檔案
-            if not self.excel_handler.load_error_codes(self.ui_manager.excel1_path):
-                self.ui_manager.update_status("載入錯誤碼檔案失敗", "red")
-                return False
-
-            # 載入來源工作表
-            df_source = self.excel_handler.load_source_sheet(
-                self.ui_manager.excel2_path,
-                self.ui_manager.get_selected_sheet()
-            )
-            if df_source is None:
-                self.ui_manager.update_status("載入來源工作表失敗", "red")
-                return False
-
-            # 優化比對：用 merge 取代 for 迴圈
-            df_error_codes = pd.read_excel(self.ui_manager.excel1_path, sheet_name="Test Item All")
-            # 取 C欄(TestID)、D欄(Description)、E欄(ChineseDesc)
-            df_error_codes = df_error_codes.iloc[:, [2, 3, 4]]
-            df_error_codes.columns = ['TestID', 'Description', 'ChineseDesc']
-            # 找來源的 Description, TestID 欄位
-            desc_col = self.excel_handler.find_column(df_source, 'Description')
-            testid_col = self.excel_handler.find_column(df_source, 'TestID')
-            if not desc_col or not testid_col:
-                self.ui_manager.update_status(f"找不到 Description 或 TestID 欄位，實際欄位: {df_source.columns.tolist()[:5]}", "red")
-                return False
-            df_result = df_source[[desc_col, testid_col]].copy()
-            df_result.columns = ['你的 description', '你寫的 Error Code']
-            # merge
-            df_merge = pd.merge(
-                df_result,
-                df_error_codes,
-                how='left',
-                left_on='你寫的 Error Code',
-                right_on='TestID'
-            )
-            df_merge['Test Item 文件的 description'] = df_merge['Description'].fillna(self.config_manager.get('NotFound'))
-            df_merge['Test Item 的 Error Code'] = df_merge['ChineseDesc'].fillna(self.config_manager.get('NotFoundCN'))
-            df_merge = df_merge[['你的 description', '你寫的 Error Code', 'Test Item 文件的 description', 'Test Item 的 Error Code']]
-            # 準備輸出路徑
-            output_dir = self.config_manager.get('LastOutputDir', str(Path(self.ui_manager.excel2_path).parent))
-            output_filename = f"{Path(self.ui_manager.excel2_path).stem}_compare_ERRORCODE.xlsx"
-            output_path = Path(output_dir) / output_filename
-            
-            # 檢查檔案是否已存在
-            if os.path.exists(output_path):
-                # 檢查是否要覆蓋檔案
-                if not self.ui_manager.get_overwrite_option():
-                    # 如果沒有勾選覆蓋選項，顯示確認對話框
-                    if not self.ui_manager.ask_yes_no(
-                        self.config_manager.get('FileExistsTitle'),
-                        self.config_manager.get('FileExistsMsg').format(output_path=output_path)
-                    ):
-                        self.ui_manager.show_info(
-                            self.config_manager.get('CancelTitle'),
-                            self.config_manager.get('CancelMsg')
-                        )
-                        return False
-                else:
-                    # 如果勾選了覆蓋選項，直接覆蓋，不顯示對話框
-                    logger.info(f"檔案已存在，將直接覆蓋: {output_path}")
-            # 儲存結果（含反白）
-            if self.excel_handler.save_result(
-                df_merge,
-                pd.read_excel(self.ui_manager.excel1_path, sheet_name="Test Item All"),
-                output_path,
-                self.ui_manager.get_selected_sheet()
-            ):
-                self.ui_manager.update_status(f"比對完成！結果已儲存於：{os.path.basename(output_path)}", "green")
-                # 更新最後使用的輸出目錄
-                self.config_manager.update_last_paths(
-                    output_dir=str(Path(output_path).parent)
-                )
-                return True
-            else:
-                self.ui_manager.update_status("儲存結果失敗", "red")
-                return False
-        except Exception as e:
-            logger.error(f"執行比對時發生錯誤: {str(e)}")
-            self.ui_manager.update_status(f"比對失敗: {str(e)[:100]}", "red")
-            return False
-
-    def _perform_ai_recommendation(self, output_file):
-        """執行 AI 推薦分析"""
-        try:
-            # 載入參考資料
-            if not self.ai_engine.load_reference_data(self.ui_manager.excel1_path):
-                self.ui_manager.update_status("無法載入 Error Code 參考資料", "red")
-                return
-            
-            # 讀取比對結果檔案
-            # 先檢查檔案有哪些工作表
-            try:
-                excel_file = pd.ExcelFile(output_file)
-                available_sheets = excel_file.sheet_names
-                logger.info(f"比對結果檔案的工作表: {available_sheets}")
-                
-                # 嘗試使用原始工作表名稱，如果沒有則使用第一個工作表
-                if self.ui_manager.selected_sheet in available_sheets:
-                    sheet_name = self.ui_manager.selected_sheet
-                else:
-                    sheet_name = available_sheets[0] if available_sheets else None
-                
-                if not sheet_name:
-                    self.ui_manager.update_status("比對結果檔案沒有可用的工作表", "red")
-                    return
-                
-                df_result = pd.read_excel(output_file, sheet_name=sheet_name)
-                logger.info(f"使用工作表: {sheet_name}")
-                
-            except Exception as e:
-                logger.error(f"讀取比對結果檔案時發生錯誤: {str(e)}")
-                self.ui_manager.update_status(f"讀取比對結果檔案失敗: {str(e)[:100]}", "red")
-                return
-            
-            if 'Description' not in df_result.columns:
-                # 檢查可能的欄位名稱變體
-                possible_desc_columns = [
-                    'Description', 'description', 'DESCRIPTION', 'O', 'O欄位',
-                    '你的 description', 'Description', '描述', 'desc'
-                ]
-                desc_column = None
-                
-                for col in possible_desc_columns:
-                    if col in df_result.columns:
-                        desc_column = col
-                        break
-                
-                if not desc_column:
-                    # 顯示實際的欄位名稱
-                    actual_columns = list(df_result.columns)
-                    self.ui_manager.update_status(f"比對結果檔案沒有 Description 欄位，實際欄位: {actual_columns[:5]}", "red")
-                    return
-                
-                # 重新命名欄位為 Description
-                df_result = df_result.rename(columns={desc_column: 'Description'})
-                logger.info(f"找到描述欄位: {desc_column}，已重新命名為 Description")
-            
-            # 提取描述並生成推薦
-            descriptions = df_result['Description'].fillna('').astype(str).tolist()
-            
-            # 定義進度回調函數（從 90% 開始更新到 100%）
-            def progress_callback(current, total, message):
-                # 將 AI 推薦的進度映射到 90%-100% 範圍
-                ai_progress = int(90 + (current / total) * 10)
-                self.ui_manager.update_status(message, "orange")
-                self.ui_manager.update_progress(ai_progress, 100)
-            
-            recommendations = self.ai_engine.generate_recommendations_with_search(descriptions, progress_callback)
-            
-            # 更新檔案
-            self._update_file_with_recommendations(output_file, df_result, recommendations)
-            
-            self.ui_manager.update_progress(100, 100)
-            self.ui_manager.update_status(f"AI 推薦分析完成！結果已更新到：{os.path.basename(output_file)}", "green")
-            self.ui_manager.show_progress(False)
-            
-            # 詢問是否要打開文件
-            self._ask_open_file(output_file)
-            
-        except Exception as e:
-            logger.error(f"執行 AI 推薦時發生錯誤: {str(e)}")
-            self.ui_manager.update_status(f"AI 推薦失敗: {str(e)[:100]}", "red")
-            self.ui_manager.show_progress(False)
-
-    def _update_file_with_recommendations(self, file_path, df_result, recommendations):
-        """更新檔案並添加 AI 推薦"""
-        try:
-            # 使用 excel_handler 的現有功能
-            self.excel_handler.add_ai_recommendations_to_existing_file(file_path, recommendations)
-        except Exception as e:
-            logger.error(f"更新檔案時發生錯誤: {str(e)}")
-            raise
+        """執行比對功能（同步版本，不含 AI 推薦）"""
+        return self._run_compare(with_ai=False)
 
     def _ask_open_file(self, file_path: str):
         """詢問用戶是否要打開生成的文件"""
@@ -849,6 +897,8 @@ class ErrorCodeTool:
             raise
 
 if __name__ == "__main__":
+    # 打包為 EXE 時，資料夾比對的工作程序需要 freeze_support
+    multiprocessing.freeze_support()
     # 程式進入點
     app = ErrorCodeTool()
     app.run() 
\ No newline at end of file
@@ -0,0 +1,185 @@
+"""
+參考資料快取模組
+將解析後的 "Test Item All" 內容以 Parquet 存在參考檔案旁的 .errorcode_cache 目錄，
+以路徑、大小、修改時間與內容雜湊為鍵，檔案變更時自動失效，並限制快取總大小。
+快取目錄可能位於共用資料夾，只使用純資料格式（Parquet 與 JSON），不以 pickle 載入任何物件；
+Parquet 需要 pyarrow，未安裝時快取停用
+"""
+import os
+import json
+import hashlib
+import logging
+import pandas as pd
+from typing import Optional, Dict, Any
+from result_export import parquet_available
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_NAME = ".errorcode_cache"
+INDEX_FILE_NAME = "index.json"
+CACHE_FILE_SUFFIX = ".parquet"
+# 快取格式版本，格式變更時遞增使舊快取失效
+CACHE_VERSION = 2
+# Parquet 檔案中繼資料中記錄工作表名稱的鍵
+SHEET_NAME_KEY = b'errorcode_sheet_name'
+
+
+def file_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """計算檔案內容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_frame(path: str, sheet_name: str, raw: pd.DataFrame) -> bool:
+    """
+    以 Parquet 寫出 raw，工作表名稱記在檔案中繼資料
+
+    Returns:
+        bool: 欄位型別混雜（例如同一欄有文字與日期）無法以 Parquet 儲存時為 False
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    try:
+        # Parquet 欄位名稱必須是字串，raw 的欄位為 0..n-1
+        table = pa.Table.from_pandas(raw.rename(columns=str))
+    except (pa.ArrowTypeError, pa.ArrowInvalid) as e:
+        logger.info(f"參考資料欄位型別無法以 Parquet 儲存，略過快取: {e}")
+        return False
+    metadata = dict(table.schema.metadata or {})
+    metadata[SHEET_NAME_KEY] = sheet_name.encode('utf-8')
+    pq.write_table(table.replace_schema_metadata(metadata), path)
+    return True
+
+
+def read_frame(path: str, sheet_name: str) -> Optional[pd.DataFrame]:
+    """讀取 write_frame 寫出的快取，工作表名稱不符時為 None"""
+    import pyarrow.parquet as pq
+    table = pq.read_table(path)
+    if (table.schema.metadata or {}).get(SHEET_NAME_KEY) != sheet_name.encode('utf-8'):
+        return None
+    raw = table.to_pandas()
+    raw.columns = [int(c) for c in raw.columns]
+    return raw
+
+
+class ReferenceCache:
+    """參考檔案解析結果的磁碟快取（每個參考檔案目錄一個快取目錄）"""
+
+    def __init__(self, enabled: bool = True, max_bytes: int = 50 * 1024 * 1024):
+        if enabled and not parquet_available():
+            logger.info("未安裝 pyarrow，停用參考資料快取")
+            enabled = False
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_config(cls, config_manager) -> 'ReferenceCache':
+        """依 setup.txt 的 ReferenceCacheEnabled / ReferenceCacheMaxMB 建立快取"""
+        enabled = str(config_manager.get('ReferenceCacheEnabled', '1')).strip() not in ('0', 'false', 'False', '')
+        try:
+            max_mb = float(config_manager.get('ReferenceCacheMaxMB', 50))
+        except (TypeError, ValueError):
+            max_mb = 50
+        return cls(enabled=enabled, max_bytes=int(max_mb * 1024 * 1024))
+
+    def _cache_dir(self, file_path: str) -> str:
+        return os.path.join(os.path.dirname(os.path.abspath(file_path)), CACHE_DIR_NAME)
+
+    def _load_index(self, cache_dir: str) -> Dict[str, Any]:
+        index_path = os.path.join(cache_dir, INDEX_FILE_NAME)
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            return index if index.get('version') == CACHE_VERSION else {'version': CACHE_VERSION, 'entries': {}}
+        except (OSError, ValueError):
+            return {'version': CACHE_VERSION, 'entries': {}}
+
+    def _save_index(self, cache_dir: str, index: Dict[str, Any]):
+        index_path = os.path.join(cache_dir, INDEX_FILE_NAME)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+
+    def _content_key(self, file_path: str, index: Dict[str, Any], stat: os.stat_result) -> str:
+        """取得內容雜湊；路徑、大小與修改時間未變時直接沿用索引中的雜湊"""
+        entry = index['entries'].get(os.path.abspath(file_path))
+        if entry and entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+            return entry['sha256']
+        return file_sha256(file_path)
+
+    def load(self, file_path: str, sheet_name: str) -> Optional[pd.DataFrame]:
+        """讀取快取，未命中或快取停用時回傳 None"""
+        if not self.enabled:
+            return None
+        try:
+            cache_dir = self._cache_dir(file_path)
+            if not os.path.isdir(cache_dir):
+                return None
+            stat = os.stat(file_path)
+            index = self._load_index(cache_dir)
+            sha = self._content_key(file_path, index, stat)
+            cache_file = os.path.join(cache_dir, f"{sha}{CACHE_FILE_SUFFIX}")
+            if not os.path.exists(cache_file):
+                return None
+            raw = read_frame(cache_file, sheet_name)
+            if raw is None:
+                return None
+            # 更新使用時間（供 LRU 淘汰）與索引
+            os.utime(cache_file, None)
+            index['entries'][os.path.abspath(file_path)] = {
+                'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha
+            }
+            self._save_index(cache_dir, index)
+            logger.info(f"參考資料快取命中: {cache_file}")
+            return raw
+        except Exception as e:
+            logger.warning(f"讀取參考資料快取失敗，改為重新解析: {e}")
+            return None
+
+    def store(self, file_path: str, sheet_name: str, raw: pd.DataFrame):
+        """寫入快取並依大小上限淘汰最久未使用的項目"""
+        if not self.enabled:
+            return
+        try:
+            cache_dir = self._cache_dir(file_path)
+            os.makedirs(cache_dir, exist_ok=True)
+            stat = os.stat(file_path)
+            sha = file_sha256(file_path)
+            cache_file = os.path.join(cache_dir, f"{sha}{CACHE_FILE_SUFFIX}")
+            tmp_file = cache_file + ".tmp"
+            if not write_frame(tmp_file, sheet_name, raw):
+                return
+            os.replace(tmp_file, cache_file)
+            index = self._load_index(cache_dir)
+            index['entries'][os.path.abspath(file_path)] = {
+                'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha
+            }
+            self._evict(cache_dir, index, keep=cache_file)
+            self._save_index(cache_dir, index)
+            logger.info(f"已寫入參考資料快取: {cache_file}")
+        except Exception as e:
+            logger.warning(f"寫入參考資料快取失敗: {e}")
+
+    def _evict(self, cache_dir: str, index: Dict[str, Any], keep: str):
+        """總大小超過上限時，依最後使用時間由舊到新刪除快取檔"""
+        files = [
+            os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith(CACHE_FILE_SUFFIX)
+        ]
+        files.sort(key=lambda p: os.path.getmtime(p))
+        total = sum(os.path.getsize(p) for p in files)
+        for path in files:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            total -= os.path.getsize(path)
+            os.remove(path)
+            removed_sha = os.path.splitext(os.path.basename(path))[0]
+            index['entries'] = {
+                k: v for k, v in index['entries'].items() if v.get('sha256') != removed_sha
+            }
+            logger.info(f"淘汰參考資料快取: {path}")
@@ -0,0 +1,221 @@
+"""
+參考資料模組
+負責解析 Test Item Code 檔案的 "Test Item All" 工作表（每次執行只解析一次），
+並提供錯誤碼字典、比對用 merge 表、輸出副本與 AI 推薦所需的各種檢視
+"""
+import os
+import logging
+import threading
+from collections import OrderedDict
+import pandas as pd
+from pandas.io.parsers import TextParser
+from typing import Dict, Tuple, Optional
+from reference_cache import ReferenceCache
+from excel_reader import ExcelReader, get_reader
+from testid_index import TestIDIndex
+from xlsx_stream import parse_reference_sheet, LayoutError
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_SHEET_NAME = "Test Item All"
+
+# AI 推薦與查詢工具使用的 8 個欄位名稱
+REFERENCE_COLUMNS = [
+    'Main Function', 'Interface', 'Interenal Error Code',
+    'Description', 'Chinese', 'Version', 'Error Code', 'Note'
+]
+
+# AI 檢視的標題列位置（等同 skiprows=3，第 4 行為標題）
+AI_HEADER_ROW = 3
+
+# 重複值多的欄位（Main Function, Interface, Version, Note）以 category 儲存
+CATEGORY_COLUMN_POSITIONS = [0, 1, 5, 7]
+
+# 最多保留的共用實例數（依最近使用淘汰，切換參考檔案時不會一直累積）
+SHARED_WORKBOOK_LIMIT = 4
+
+
+def frame_with_header(raw: pd.DataFrame, header_row: int) -> pd.DataFrame:
+    """
+    以指定列作為標題建立 DataFrame
+    使用與 pd.read_excel 相同的 TextParser，欄位命名與型別推斷結果一致
+    """
+    if raw.empty or header_row >= len(raw):
+        return pd.DataFrame()
+    # read_excel 以空字串表示空白儲存格，再由 TextParser 轉為 NaN
+    rows = raw.iloc[header_row:].astype(object).where(raw.iloc[header_row:].notna(), '').values.tolist()
+    return TextParser(rows, header=0).read()
+
+
+def intern_strings(df: pd.DataFrame) -> pd.DataFrame:
+    """將字串欄位中內容相同的字串合併為同一個物件（各讀取引擎逐格產生字串時會重複）"""
+    pool: Dict[str, str] = {}
+    for pos in range(df.shape[1]):
+        column = df.iloc[:, pos]
+        if column.dtype == object or pd.api.types.is_string_dtype(column.dtype):
+            values = [pool.setdefault(v, v) if type(v) is str else v for v in column]
+            df.isetitem(pos, pd.Series(values, index=df.index, dtype=column.dtype))
+    return df
+
+
+def compact_frame(df: pd.DataFrame, positions=CATEGORY_COLUMN_POSITIONS) -> pd.DataFrame:
+    """將指定位置的低基數欄位轉為 category"""
+    for pos in positions:
+        if pos < df.shape[1]:
+            df.isetitem(pos, df.iloc[:, pos].astype('category'))
+    return df
+
+
+class ReferenceWorkbook:
+    """Test Item Code 參考檔案，"Test Item All" 只讀取一次，供各模組共用"""
+
+    # 以（檔案路徑, 讀取引擎, 串流解析器）為鍵的共用實例，讓比對、AI 推薦與查詢工具持有同一份資料
+    _shared: 'OrderedDict[Tuple[str, str, bool], ReferenceWorkbook]' = OrderedDict()
+    _shared_lock = threading.Lock()
+
+    def __init__(self, file_path: str, cache: Optional[ReferenceCache] = None,
+                 reader: Optional[ExcelReader] = None, fast_parser: bool = False):
+        self.file_path = str(file_path)
+        self.cache = cache
+        self.reader = reader or get_reader()
+        # 固定版面的串流解析器；calamine 已比它快，使用 calamine 時不啟用
+        self.fast_parser = fast_parser and self.reader.name != "calamine"
+        self._raw: Optional[pd.DataFrame] = None
+        self._views: Dict[str, object] = {}
+        self._signature: Optional[Tuple[int, int]] = None
+        # 比對在背景執行緒、查詢工具在主執行緒，解析與建立檢視需互斥
+        self._lock = threading.RLock()
+
+    @classmethod
+    def shared(cls, file_path: str, cache: Optional[ReferenceCache] = None,
+               reader: Optional[ExcelReader] = None, fast_parser: bool = False) -> 'ReferenceWorkbook':
+        """
+        取得同一參考檔案與讀取選項的共用實例；檔案大小或修改時間變更時重新建立，
+        最多保留 SHARED_WORKBOOK_LIMIT 個，超過時淘汰最久未使用的實例
+        """
+        reader = reader or get_reader()
+        fast_parser = fast_parser and reader.name != "calamine"
+        key = (os.path.abspath(str(file_path)), reader.name, fast_parser)
+        try:
+            stat = os.stat(file_path)
+            signature = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            signature = None
+        with cls._shared_lock:
+            workbook = cls._shared.get(key)
+            if workbook is None or signature is None or workbook._signature != signature:
+                workbook = cls(file_path, cache=cache, reader=reader, fast_parser=fast_parser)
+                workbook._signature = signature
+                cls._shared[key] = workbook
+            cls._shared.move_to_end(key)
+            while len(cls._shared) > SHARED_WORKBOOK_LIMIT:
+                cls._shared.popitem(last=False)
+            return workbook
+
+    @property
+    def raw(self) -> pd.DataFrame:
+        """工作表原始內容（header=None），第一次存取時才解析（有快取時優先讀取快取）"""
+        with self._lock:
+            if self._raw is None:
+                self._raw = self._load_raw()
+            return self._raw
+
+    def _load_raw(self) -> pd.DataFrame:
+        if self.cache is not None:
+            raw = self.cache.load(self.file_path, REFERENCE_SHEET_NAME)
+            if raw is not None:
+                return raw
+        raw = None
+        if self.fast_parser:
+            try:
+                raw = parse_reference_sheet(self.file_path, REFERENCE_SHEET_NAME)
+                logger.info(f"以串流解析器讀取參考檔案: {self.file_path} ({len(raw)} 行)")
+            except LayoutError as e:
+                logger.info(f"參考檔案版面不符串流解析器，改用 {self.reader.name}: {e}")
+            except Exception as e:
+                # 串流解析器只是加速用，任何解析錯誤（XML 結構、儲存格內容等）都改用一般讀取引擎
+                logger.warning(f"串流解析器讀取參考檔案失敗，改用 {self.reader.name}: {type(e).__name__}: {e}")
+        if raw is None:
+            raw = self.reader.read_sheet(self.file_path, REFERENCE_SHEET_NAME)
+            logger.info(f"解析參考檔案 {REFERENCE_SHEET_NAME}（{self.reader.name}）: {self.file_path} ({len(raw)} 行)")
+        # 各檢視都由 raw 衍生，先去重字串讓所有檢視共用同一份字串物件
+        raw = intern_strings(raw)
+        if self.cache is not None:
+            self.cache.store(self.file_path, REFERENCE_SHEET_NAME, raw)
+        return raw
+
+    def _view(self, name: str, builder):
+        """快取各檢視，避免重複建立"""
+        with self._lock:
+            if name not in self._views:
+                self._views[name] = builder()
+            return self._views[name]
+
+    def output_frame(self) -> pd.DataFrame:
+        """與 pd.read_excel(file, "Test Item All") 相同的表格，用於輸出檔的副本"""
+        return self._view('output', lambda: compact_frame(frame_with_header(self.raw, 0)))
+
+    def error_code_map(self) -> Dict[str, Tuple[str, str]]:
+        """TestID（C欄）對應 (Description, 中文說明) 的字典"""
+        def build():
+            df = self.output_frame()
+            if df.shape[1] < 5:
+                return {}
+            return {
+                str(k).strip(): (str(v1).strip(), str(v2).strip())
+                for k, v1, v2 in zip(df.iloc[:, 2], df.iloc[:, 3], df.iloc[:, 4])
+            }
+        return self._view('error_code_map', build)
+
+    def merge_frame(self) -> pd.DataFrame:
+        """比對用的 C/D/E 欄（TestID, Description, ChineseDesc）"""
+        def build():
+            df = self.output_frame().iloc[:, [2, 3, 4]].copy()
+            df.columns = ['TestID', 'Description', 'ChineseDesc']
+            return df
+        return self._view('merge', build)
+
+    def testid_index(self) -> TestIDIndex:
+        """C欄 TestID 的正規化雜湊索引（比對時整欄批次查詢）"""
+        def build():
+            df = self.merge_frame()
+            return TestIDIndex(df['TestID'], df['Description'], df['ChineseDesc'])
+        return self._view('testid_index', build)
+
+    def ai_frame(self) -> pd.DataFrame:
+        """AI 推薦使用的 8 欄表格（等同 skiprows=3 讀取並重新命名欄位）"""
+        def build():
+            df = frame_with_header(self.raw, AI_HEADER_ROW)
+            if len(df.columns) >= len(REFERENCE_COLUMNS):
+                df.columns = REFERENCE_COLUMNS + list(df.columns[len(REFERENCE_COLUMNS):])
+            return compact_frame(df)
+        return self._view('ai', build)
+
+    def search_frame(self) -> pd.DataFrame:
+        """
+        查詢工具使用的 BCDE 欄（Interface, Interenal Error Code, Description, Chinese）
+        依序嘗試第 4、5 行為標題，仍有空白標題時尋找含 "Main Function" 的行
+        """
+        def build():
+            raw = self.raw
+            header_row = None
+            for candidate in (AI_HEADER_ROW, AI_HEADER_ROW + 1):
+                if candidate < len(raw) and raw.iloc[candidate].notna().all():
+                    header_row = candidate
+                    break
+            if header_row is None:
+                header_row = 0
+                for i, row in enumerate(raw.itertuples(index=False)):
+                    if 'Main Function' in str(row):
+                        logger.info(f"找到標題行在第 {i + 1} 行")
+                        header_row = i
+                        break
+            df = frame_with_header(raw, header_row)
+            df.columns = [str(col).strip() for col in df.columns]
+            if len(df.columns) >= len(REFERENCE_COLUMNS):
+                df.columns = REFERENCE_COLUMNS + list(df.columns[len(REFERENCE_COLUMNS):])
+            if df.shape[1] >= 5:
+                df = df.iloc[:, 1:5]
+                df.columns = ['Interface', 'Interenal Error Code', 'Description', 'Chinese']
+            return df
+        return self._view('search', build)
@@ -0,0 +1,99 @@
+"""
+比對結果匯出模組
+將比對結果另存為不含格式的 CSV、Parquet 或 JSON Lines，供儀表板等程式直接讀取；
+欄位為工作表、比對結果四欄、AI 推薦兩欄（沒有推薦時為空白）與比對狀態
+"""
+import os
+import logging
+import pandas as pd
+from compare_metadata import FOUND_COLUMN, CHINESE_FOUND_COLUMN
+
+logger = logging.getLogger(__name__)
+
+# 匯出格式 -> 副檔名
+EXPORT_FORMATS = {'csv': '.csv', 'parquet': '.parquet', 'jsonl': '.jsonl'}
+
+SHEET_COLUMN = '工作表'
+STATUS_COLUMN = '比對狀態'
+EXPORT_COLUMNS = [SHEET_COLUMN, '你的 description', '你寫的 Error Code', 'Test Item 文件的 description',
+                  'Test Item 的 Error Code', 'AI推薦 test ID', 'AI推薦 中文', STATUS_COLUMN]
+
+# 比對狀態：找到說明 / 查無說明 / 有說明但查無中文說明
+STATUS_FOUND = 'found'
+STATUS_NOT_FOUND = 'not_found'
+STATUS_NO_CHINESE = 'no_chinese'
+
+
+def export_path_for(output_path: str, export_format: str) -> str:
+    """與輸出檔同名、副檔名依匯出格式的匯出檔路徑"""
+    return os.path.splitext(output_path)[0] + EXPORT_FORMATS[export_format]
+
+
+def parquet_available() -> bool:
+    """Parquet 匯出需要 pyarrow"""
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def export_frame(df_result: pd.DataFrame, sheet_name: str) -> pd.DataFrame:
+    """
+    轉成匯出欄位：加上工作表與比對狀態，補齊 AI 推薦欄位，所有欄位皆為字串（空白為缺值）
+
+    Args:
+        df_result: 比對結果（build_compare_result 的結果，含狀態欄位，可含 AI 推薦欄位）
+        sheet_name: 工作表名稱
+    """
+    df = df_result.reindex(columns=EXPORT_COLUMNS[1:-1])
+    df.insert(0, SHEET_COLUMN, sheet_name)
+    status = pd.Series(STATUS_FOUND, index=df.index, dtype=object)
+    # 比對狀態依 TestID 索引的查詢結果，不比對查無說明的顯示文字
+    status[~df_result[CHINESE_FOUND_COLUMN].to_numpy(dtype=bool)] = STATUS_NO_CHINESE
+    status[~df_result[FOUND_COLUMN].to_numpy(dtype=bool)] = STATUS_NOT_FOUND
+    df[STATUS_COLUMN] = status
+    # 欄位型別固定為字串，分段寫出時 Parquet 結構一致，CSV/JSONL 也不會把 TestID 轉成數字
+    return df.astype('string')
+
+
+class ResultExporter:
+    """依序寫入一或多段比對結果的匯出檔（供一次寫出與串流比對分段寫出共用）"""
+
+    def __init__(self, path: str, export_format: str):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"未知的匯出格式: {export_format}")
+        self.path = path
+        self.export_format = export_format
+        self.rows = 0
+        self._parquet_writer = None
+        if export_format == 'parquet':
+            import pyarrow  # noqa: F401  未安裝時在開始寫入前就失敗
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def write(self, df: pd.DataFrame):
+        """附加一段 export_frame 轉換後的資料"""
+        if self.export_format == 'csv':
+            df.to_csv(self.path, mode='a', header=self.rows == 0, index=False, encoding='utf-8')
+        elif self.export_format == 'jsonl':
+            with open(self.path, 'a', encoding='utf-8') as f:
+                if len(df):
+                    f.write(df.to_json(orient='records', lines=True, force_ascii=False).rstrip('\n') + '\n')
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        """完成匯出檔（沒有任何資料時仍寫出只有欄位的檔案）"""
+        if self.rows == 0:
+            self.write(pd.DataFrame(columns=EXPORT_COLUMNS, dtype='string'))
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
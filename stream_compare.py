@@ -0,0 +1,115 @@
+"""
+串流比對模組
+超大測站工作表（數十萬行）以固定行數的區塊逐段讀取、以 TestID 索引查詢，
+並直接逐列寫入輸出工作表；同一時間只保留一個區塊，記憶體用量與工作表行數無關
+"""
+import time
+import logging
+import zipfile
+import pandas as pd
+from xml.etree import ElementTree
+from typing import Optional, Set, Tuple
+from excel_handler import ExcelHandler, RESULT_COLUMNS, FOUND_COLUMN, without_flags
+from excel_reader import XlsxStreamReader
+from xlsx_stream import read_sheet_dimension
+from styled_writer import column_widths, open_workbook
+from testid_index import testid_keys
+from result_export import ResultExporter, export_frame, export_path_for
+
+logger = logging.getLogger(__name__)
+
+# 每個區塊的行數
+STREAM_CHUNK_ROWS = 50000
+
+
+def should_stream(file_path: str, sheet_name: str, min_rows: int) -> bool:
+    """
+    工作表行數（依 <dimension> 記錄）是否達到串流比對的門檻
+
+    Args:
+        min_rows: 門檻行數，0 表示不使用串流比對
+    """
+    if min_rows <= 0 or not str(file_path).lower().endswith(('.xlsx', '.xlsm')):
+        return False
+    try:
+        rows = read_sheet_dimension(file_path, sheet_name)
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        logger.warning(f"讀取工作表大小失敗，使用一般比對: {e}")
+        return False
+    return rows is not None and rows >= min_rows
+
+
+def stream_compare_sheet(handler: ExcelHandler, source_path: str, sheet_name: str, output_path: str,
+                         not_found_text: str, not_found_cn_text: str,
+                         chunk_rows: int = STREAM_CHUNK_ROWS) -> Optional[Tuple[int, int]]:
+    """
+    串流比對單一工作表並寫入輸出檔案（比對結果工作表 + 參考工作表）
+
+    不寫入 AI 推薦與增量比對中繼資料（兩者都需要整張比對結果）
+
+    Args:
+        handler: 已載入參考檔案的 ExcelHandler
+        source_path: 來源檔案路徑
+        sheet_name: 工作表名稱
+        output_path: 輸出檔案路徑
+        not_found_text: 查無說明時的文字
+        not_found_cn_text: 查無中文說明時的文字
+        chunk_rows: 每個區塊的行數
+
+    Returns:
+        Optional[Tuple[int, int]]: (寫入的行數, 查無說明的行數)，失敗時為 None
+    """
+    if handler.testid_index is None or handler.reference is None:
+        logger.error("尚未載入錯誤碼檔案")
+        return None
+    start = time.perf_counter()
+    try:
+        # 只輸出匯出檔時不建立活頁簿
+        book = None if handler.export_only else open_workbook(output_path, handler.write_engine)
+        exporter = None
+        if handler.export_format:
+            exporter = ResultExporter(export_path_for(output_path, handler.export_format), handler.export_format)
+        # calamine 會一次載入整張工作表，openpyxl 唯讀模式會保留已讀過的列元素（每列約 80 bytes），
+        # 串流比對固定使用 XlsxStreamReader 逐列讀取
+        chunks = handler.iter_source_chunks(source_path, sheet_name, chunk_rows, reader=XlsxStreamReader())
+        writer = None
+        highlight_testids: Set[str] = set()
+        rows = 0
+        not_found = 0
+        for df_source in chunks:
+            df_result = handler.build_compare_result(
+                df_source, handler.testid_index, not_found_text, not_found_cn_text
+            )
+            if df_result is None:
+                return None
+            not_found += int((~df_result[FOUND_COLUMN]).sum())
+            if book is not None:
+                highlight_testids.update(testid_keys(df_result['你寫的 Error Code']))
+            if exporter is not None:
+                exporter.write(export_frame(df_result, sheet_name))
+            rows += len(df_result)
+            if book is None:
+                logger.info(f"串流比對 {sheet_name}: 已匯出 {rows} 行")
+                continue
+            df_result = without_flags(df_result)
+            df_result = df_result.astype(object).where(df_result.notna(), None)
+            if writer is None:
+                # 欄寬依第一個區塊估算（逐列寫出時需在寫入資料前設定）
+                writer = book.add_sheet(sheet_name, RESULT_COLUMNS, column_widths(df_result))
+            for values in df_result.itertuples(index=False, name=None):
+                writer.append(values)
+            logger.info(f"串流比對 {sheet_name}: 已寫入 {rows} 行")
+        if exporter is not None:
+            exporter.close()
+        if book is not None:
+            if writer is None:
+                book.add_sheet(sheet_name, RESULT_COLUMNS, column_widths(pd.DataFrame(columns=RESULT_COLUMNS)))
+            # Test Item All：來源 TestID 對應的行（C 欄）反白（或只寫入引用到的行）
+            handler.write_reference_sheets(book, handler.reference.output_frame(), highlight_testids)
+            book.save()
+        logger.info(f"串流比對完成: {sheet_name} 共 {rows} 行，耗時 {time.perf_counter() - start:.1f} 秒，"
+                    f"輸出 {handler.output_file(output_path)}")
+        return rows, not_found
+    except Exception as e:
+        logger.error(f"串流比對時發生錯誤: {str(e)}")
+        return None
@@ -0,0 +1,324 @@
+"""
+樣式化輸出模組
+以 openpyxl write_only 活頁簿（或選用的 xlsxwriter）一次寫出最終的比對結果：標題列、框線、字型、
+欄寬、凍結窗格與 Test Item All 反白都在逐列寫出時套用，不需要寫檔後再重新載入格式化
+"""
+import logging
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Border, Side, Alignment, PatternFill, NamedStyle
+from openpyxl.utils import get_column_letter, quote_sheetname
+from openpyxl.formatting.rule import FormulaRule
+from typing import Optional, List, Set, Dict, Type, Union
+from testid_index import normalize_testids
+
+logger = logging.getLogger(__name__)
+
+# 欄寬：內容長度（中文字多算 1.5 個字元）加上邊距，限制在最小與最大寬度之間
+MIN_COLUMN_WIDTH = 15
+MAX_COLUMN_WIDTH = 80
+COLUMN_PADDING = 3
+
+# 已註冊的具名樣式：標題列、資料列、Test Item All 反白列
+EC_HEADER = 'ec_header'
+EC_DATA = 'ec_data'
+EC_HIGHLIGHT = 'ec_highlight'
+
+# Test Item All 反白方式：static 為寫入時逐列填色，conditional 為單一條件式格式規則（由 Excel 開啟時計算）
+HIGHLIGHT_STATIC = 'static'
+HIGHLIGHT_CONDITIONAL = 'conditional'
+# 條件式格式反白的隱藏鍵值工作表：A 欄為反白工作表各列的正規化鍵值（與資料列同列），B 欄為需反白的鍵值
+HIGHLIGHT_KEYS_SHEET_NAME = '_highlight_keys'
+# 鍵值前綴：讓 COUNTIF 一律以文字比較（'1001' 不會被當成數字，'01' 與 '1' 不會視為相同）
+HIGHLIGHT_KEY_PREFIX = 'id:'
+
+# 寫檔引擎：openpyxl（預設）或 xlsxwriter（需安裝 XlsxWriter）
+DEFAULT_WRITE_ENGINE = 'openpyxl'
+# xlsxwriter 的欄寬以顯示字元數計算並另加 5 像素（每字元 7 像素）邊距，openpyxl 直接寫入欄寬值；
+# 扣除邊距後兩者寫入檔案的欄寬相同（誤差在 1 像素內）
+XLSXWRITER_WIDTH_PADDING = 5 / 7
+
+# 樣式內容（openpyxl 具名樣式與 xlsxwriter 格式共用）
+FONT_NAME = 'Calibri'
+FONT_SIZE = 12
+HIGHLIGHT_COLOR = '00C853'
+
+# 中文字的 Unicode 範圍（欄寬估算時多算 1.5 個字元）
+CJK_FIRST = 0x4e00
+CJK_LAST = 0x9fff
+
+
+def text_width(values) -> float:
+    """
+    最長內容的顯示長度（字元數，中文字多算 1.5 個字元；空白與 NaN 不計）
+
+    只處理不重複的值：轉成固定寬度的 numpy 字串陣列後，以碼位範圍整批計算中文字數；
+    欄寬上限為 MAX_COLUMN_WIDTH，每個值只取前 MAX_COLUMN_WIDTH 個字元（避免一個超長儲存格放大整個陣列）
+    """
+    texts = [str(v)[:MAX_COLUMN_WIDTH] for v in pd.unique(pd.Series(values, dtype=object).dropna())]
+    texts = [t for t in texts if t]
+    if not texts:
+        return 0.0
+    array = np.array(texts, dtype=str)
+    codepoints = array.view(np.uint32).reshape(len(array), -1)
+    cjk = ((codepoints >= CJK_FIRST) & (codepoints <= CJK_LAST)).sum(axis=1)
+    return float((np.char.str_len(array) + cjk * 1.5).max())
+
+
+def fit_width(length: float) -> float:
+    """內容長度加上邊距，限制在 MIN_COLUMN_WIDTH ~ MAX_COLUMN_WIDTH"""
+    return max(MIN_COLUMN_WIDTH, min(MAX_COLUMN_WIDTH, length + COLUMN_PADDING))
+
+
+def column_widths(df: pd.DataFrame) -> List[float]:
+    """依標題與內容估算每欄寬度"""
+    return [fit_width(max(text_width([name]), text_width(df[name]))) for name in df.columns]
+
+
+def register_styles(wb: Workbook):
+    """在活頁簿註冊 ec_header / ec_data / ec_highlight 具名樣式（已存在時略過）"""
+    existing = set(wb.named_styles)
+    thin = Side(border_style="thin", color="000000")
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    green_fill = PatternFill("solid", fgColor=HIGHLIGHT_COLOR)
+    styles = [
+        NamedStyle(EC_HEADER, font=Font(name=FONT_NAME, size=FONT_SIZE, bold=True), border=border,
+                   alignment=Alignment(horizontal='center', vertical='center'), fill=green_fill),
+        NamedStyle(EC_DATA, font=Font(name=FONT_NAME, size=FONT_SIZE), border=border,
+                   alignment=Alignment(vertical='center')),
+        NamedStyle(EC_HIGHLIGHT, font=Font(name=FONT_NAME, size=FONT_SIZE), border=border,
+                   alignment=Alignment(vertical='center'), fill=green_fill),
+    ]
+    for style in styles:
+        if style.name not in existing:
+            wb.add_named_style(style)
+
+
+class StyledSheetWriter:
+    """write_only 工作表的樣式化寫入（具名樣式的標題與資料列、欄寬、凍結第一列）"""
+
+    def __init__(self, wb: Workbook, title: str, headers: List[str], widths: List[float]):
+        register_styles(wb)
+        self.ws = wb.create_sheet(title)
+        # write_only 的欄寬與凍結窗格需在寫入第一列之前設定
+        for i, width in enumerate(widths, start=1):
+            self.ws.column_dimensions[get_column_letter(i)].width = width
+        self.ws.freeze_panes = "A2"
+        self.ws.append([self._cell(EC_HEADER, value) for value in headers])
+        # 每欄一個樣式化儲存格重複使用：append 會立即寫出，寫出後只需更新值
+        self._cells = [self._cell(EC_DATA) for _ in headers]
+        self._highlight_cells = [self._cell(EC_HIGHLIGHT) for _ in headers]
+
+    def _cell(self, style: str, value=None):
+        cell = WriteOnlyCell(self.ws, value)
+        cell.style = style
+        return cell
+
+    def append(self, values, highlight: bool = False):
+        cells = self._highlight_cells if highlight else self._cells
+        for cell, value in zip(cells, values):
+            cell.value = value
+        self.ws.append(cells)
+
+    def add_formula_fill(self, cell_range: str, formula: str):
+        """公式成立時以反白色填滿 cell_range 的條件式格式"""
+        self.ws.conditional_formatting.add(
+            cell_range,
+            FormulaRule(formula=[formula],
+                        fill=PatternFill(start_color=HIGHLIGHT_COLOR, end_color=HIGHLIGHT_COLOR, fill_type="solid"))
+        )
+
+
+class XlsxWriterSheetWriter:
+    """xlsxwriter 工作表的樣式化寫入（與 StyledSheetWriter 相同的格式與介面）"""
+
+    def __init__(self, book: 'XlsxWriterWorkbook', title: str, headers: List[str], widths: List[float]):
+        self.ws = book.wb.add_worksheet(title)
+        self._formats = book.formats
+        for i, width in enumerate(widths):
+            self.ws.set_column(i, i, width - XLSXWRITER_WIDTH_PADDING)
+        self.ws.freeze_panes(1, 0)
+        self.ws.write_row(0, 0, headers, self._formats[EC_HEADER])
+        self._row = 1
+
+    def append(self, values, highlight: bool = False):
+        self.ws.write_row(self._row, 0, values, self._formats[EC_HIGHLIGHT if highlight else EC_DATA])
+        self._row += 1
+
+    def add_formula_fill(self, cell_range: str, formula: str):
+        """公式成立時以反白色填滿 cell_range 的條件式格式"""
+        self.ws.conditional_format(cell_range, {'type': 'formula', 'criteria': f"={formula}",
+                                                'format': self._formats['conditional']})
+
+
+class StyledWorkbook:
+    """openpyxl write_only 輸出活頁簿（預設寫檔引擎）"""
+    name = 'openpyxl'
+
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self.wb = Workbook(write_only=True)
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return True
+
+    def add_sheet(self, title: str, headers: List[str], widths: List[float]):
+        """新增樣式化工作表（需依序寫完一張再新增下一張）"""
+        return StyledSheetWriter(self.wb, title, headers, widths)
+
+    def add_hidden_sheet(self, title: str, df: pd.DataFrame):
+        """新增不含格式的隱藏工作表（中繼資料）"""
+        ws = self.wb.create_sheet(title)
+        ws.sheet_state = 'hidden'
+        ws.append([str(c) for c in df.columns])
+        for row in df.itertuples(index=False, name=None):
+            ws.append(row)
+
+    def save(self):
+        self.wb.save(self.output_path)
+
+
+class XlsxWriterWorkbook(StyledWorkbook):
+    """
+    xlsxwriter 輸出活頁簿（需安裝 XlsxWriter）
+
+    以 constant_memory 模式逐列寫出；xlsxwriter 不支援具名樣式，格式直接套用在儲存格上，
+    字型、框線、填色、對齊、欄寬、凍結窗格與反白與 openpyxl 輸出相同
+    """
+    name = 'xlsxwriter'
+
+    def __init__(self, output_path: str):
+        import xlsxwriter
+        self.output_path = output_path
+        # 字串不轉為超連結（與 openpyxl 相同），並保留 openpyxl 的日期顯示格式
+        self.wb = xlsxwriter.Workbook(output_path, {
+            'constant_memory': True, 'strings_to_urls': False, 'default_date_format': 'yyyy-mm-dd h:mm:ss',
+        })
+        base = {'font_name': FONT_NAME, 'font_size': FONT_SIZE, 'border': 1, 'valign': 'vcenter'}
+        fill = {'pattern': 1, 'bg_color': f"#{HIGHLIGHT_COLOR}"}
+        self.formats = {
+            EC_HEADER: self.wb.add_format({**base, **fill, 'bold': True, 'align': 'center'}),
+            EC_DATA: self.wb.add_format(base),
+            EC_HIGHLIGHT: self.wb.add_format({**base, **fill}),
+            'conditional': self.wb.add_format(fill),
+        }
+
+    @classmethod
+    def is_available(cls) -> bool:
+        try:
+            import xlsxwriter  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def add_sheet(self, title: str, headers: List[str], widths: List[float]):
+        return XlsxWriterSheetWriter(self, title, headers, widths)
+
+    def add_hidden_sheet(self, title: str, df: pd.DataFrame):
+        ws = self.wb.add_worksheet(title)
+        ws.hide()
+        ws.write_row(0, 0, [str(c) for c in df.columns])
+        for row_index, row in enumerate(df.itertuples(index=False, name=None), start=1):
+            ws.write_row(row_index, 0, row)
+
+    def save(self):
+        self.wb.close()
+
+
+SheetWriter = Union[StyledSheetWriter, XlsxWriterSheetWriter]
+
+WRITE_ENGINES: Dict[str, Type[StyledWorkbook]] = {
+    book.name: book for book in (StyledWorkbook, XlsxWriterWorkbook)
+}
+
+
+def open_workbook(output_path: str, engine: Optional[str] = None) -> StyledWorkbook:
+    """
+    依寫檔引擎名稱建立輸出活頁簿
+
+    Args:
+        output_path: 輸出檔案路徑
+        engine: "openpyxl" 或 "xlsxwriter"
+
+    Returns:
+        StyledWorkbook: 輸出活頁簿，指定的引擎無法使用時退回 openpyxl
+    """
+    engine = (engine or DEFAULT_WRITE_ENGINE).strip().lower()
+    book_cls = WRITE_ENGINES.get(engine)
+    if book_cls is None:
+        logger.warning(f"未知的寫檔引擎 {engine}，改用 openpyxl")
+        book_cls = StyledWorkbook
+    elif not book_cls.is_available():
+        logger.warning(f"寫檔引擎 {engine} 未安裝，改用 openpyxl")
+        book_cls = StyledWorkbook
+    return book_cls(output_path)
+
+
+def highlight_keys_frame(keys: pd.Series, highlight_values: Set[str]) -> pd.DataFrame:
+    """
+    條件式格式反白的鍵值工作表內容：A 欄為 keys（與反白工作表的資料列同列，空白鍵值為空白儲存格），
+    B 欄為排序後的 highlight_values，兩欄都加上 HIGHLIGHT_KEY_PREFIX
+    """
+    row_keys = [HIGHLIGHT_KEY_PREFIX + key if key else None for key in keys]
+    used_keys = [HIGHLIGHT_KEY_PREFIX + key for key in sorted(highlight_values)]
+    length = max(len(row_keys), len(used_keys))
+    return pd.DataFrame({
+        'Key': row_keys + [None] * (length - len(row_keys)),
+        'Highlight': used_keys + [None] * (length - len(used_keys)),
+    }, dtype=object)
+
+
+def add_highlight_rule(writer: SheetWriter, rows: int, columns: int, keys_sheet: str = HIGHLIGHT_KEYS_SHEET_NAME):
+    """
+    以單一 COUNTIF 條件式格式規則反白：keys_sheet 工作表 A 欄同列的鍵值出現在其 B 欄的列整列反白
+
+    鍵值由 normalize_testid 產生（與比對與逐列填色相同）；COUNTIF 條件以 "=" 開頭並跳脫萬用字元 ~ * ?，
+    加上前綴後一律為文字比較。Excel 的 COUNTIF 條件最長 255 字元，超過的鍵值不會反白
+
+    Args:
+        writer: 要加上規則的工作表
+        rows: 資料列數（不含標題）
+        columns: 欄數
+        keys_sheet: highlight_keys_frame 內容的工作表名稱
+    """
+    if rows <= 0:
+        return
+    sheet = quote_sheetname(keys_sheet)
+    key = f"{sheet}!$A2"
+    escaped = f'SUBSTITUTE(SUBSTITUTE(SUBSTITUTE({key},"~","~~"),"*","~*"),"?","~?")'
+    writer.add_formula_fill(f"A2:{get_column_letter(columns)}{rows + 1}",
+                            f'AND({key}<>"",COUNTIF({sheet}!$B:$B,"="&{escaped})>0)')
+
+
+def write_frame(book: StyledWorkbook, title: str, df: pd.DataFrame, highlight_values: Optional[Set[str]] = None,
+                highlight_position: int = 2, conditional: bool = False) -> SheetWriter:
+    """
+    將 DataFrame 寫成樣式化工作表
+
+    Args:
+        book: 輸出活頁簿（open_workbook 建立）
+        title: 工作表名稱
+        df: 資料
+        highlight_values: 需反白的 TestID 鍵值（normalize_testid），第 highlight_position 欄（預設 C 欄）正規化後在集合中的列整列反白
+        highlight_position: 比對反白的欄位位置
+        conditional: 改以條件式格式反白（鍵值另存於隱藏的 HIGHLIGHT_KEYS_SHEET_NAME 工作表，不逐列填色）
+    """
+    writer = book.add_sheet(title, [str(c) for c in df.columns], column_widths(df))
+    highlighted = [False] * len(df)
+    keys = None
+    if highlight_values is not None and len(df.columns) > highlight_position:
+        # 與比對相同的鍵值規則（normalize_testid），比對找得到的 TestID 一定反白
+        keys = normalize_testids(df.iloc[:, highlight_position])
+        if conditional:
+            add_highlight_rule(writer, len(df), len(df.columns))
+        else:
+            highlighted = keys.isin(highlight_values).tolist()
+    values = df.astype(object).where(df.notna(), None)
+    for row, highlight in zip(values.itertuples(index=False, name=None), highlighted):
+        writer.append(row, highlight)
+    if conditional and keys is not None:
+        book.add_hidden_sheet(HIGHLIGHT_KEYS_SHEET_NAME, highlight_keys_frame(keys, highlight_values))
+    return writer
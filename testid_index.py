@@ -0,0 +1,96 @@
+"""
+TestID 索引模組
+以統一的鍵值正規化（去空白、不分大小寫、整數/浮點數/字串一致）建立 TestID 雜湊索引，
+供比對時整欄批次查詢；每份參考檔案只建立一次（由 ReferenceWorkbook.testid_index 快取）
+"""
+import re
+import logging
+import numpy as np
+import pandas as pd
+from typing import Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 整數值的浮點數字串（'1001.0'、'1001.00'）去掉小數部分
+_INTEGRAL_FLOAT = re.compile(r'^([+-]?\d+)\.0+$')
+
+
+def normalize_testid(value) -> str:
+    """
+    單一 TestID 的正規化鍵值
+
+    去除前後空白並轉為 casefold；1001、1001.0 與 '1001.0' 都視為 '1001'；空白或 NaN 為空字串
+    """
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    key = str(value).strip().casefold()
+    return _INTEGRAL_FLOAT.sub(r'\1', key) if '.' in key else key
+
+
+def normalize_testids(values: pd.Series) -> pd.Series:
+    """整欄 TestID 正規化（與 normalize_testid 結果相同；只對不重複的值做字串處理）"""
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    # 最後一格給 NaN（factorize 代碼 -1）
+    normalized = np.array([normalize_testid(v) for v in uniques] + [''], dtype=object)
+    return pd.Series(normalized[codes], index=values.index, dtype=object)
+
+
+def testid_keys(values: pd.Series) -> Set[str]:
+    """整欄 TestID 的不重複鍵值（空白與 NaN 不計），反白與 Test Item Used 篩選用"""
+    keys = set(normalize_testids(values).unique())
+    keys.discard('')
+    return keys
+
+
+class TestIDIndex:
+    """TestID -> (Description, 中文說明) 的雜湊索引"""
+
+    def __init__(self, testids: pd.Series, descriptions: pd.Series, chinese: pd.Series):
+        keys = normalize_testids(testids.reset_index(drop=True))
+        # 空白 TestID 不建立索引；重複的 TestID 以第一筆為準，確保每個來源列只對應一筆
+        keep = (keys != '') & ~keys.duplicated(keep='first')
+        duplicates = int(((keys != '') & keys.duplicated(keep='first')).sum())
+        if duplicates:
+            logger.warning(f"參考檔案有 {duplicates} 個重複的 TestID，以第一筆為準")
+        self._keys = pd.Index(keys[keep])
+        self._descriptions = descriptions.reset_index(drop=True)[keep].to_numpy(dtype=object)
+        self._chinese = chinese.reset_index(drop=True)[keep].to_numpy(dtype=object)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def get(self, testid) -> Optional[Tuple[object, object]]:
+        """查詢單一 TestID，找不到時為 None"""
+        position = self._keys.get_indexer([normalize_testid(testid)])[0]
+        if position < 0:
+            return None
+        return self._descriptions[position], self._chinese[position]
+
+    def lookup(self, testids: pd.Series, not_found_text: str, not_found_cn_text: str) -> pd.DataFrame:
+        """
+        整欄批次查詢
+
+        Args:
+            testids: 來源 TestID 欄位
+            not_found_text: 查無說明時的文字（說明為空白時也使用）
+            not_found_cn_text: 查無中文說明時的文字
+
+        Returns:
+            pd.DataFrame: 與 testids 同索引的 Description、ChineseDesc，以及 Found（TestID 在索引中且有說明）、
+            HasChinese（另有中文說明）；查無時的文字只用於顯示，是否找到以 Found / HasChinese 判斷
+        """
+        positions = self._keys.get_indexer(normalize_testids(testids))
+        found = positions >= 0
+        descriptions = pd.Series(np.full(len(positions), np.nan, dtype=object), index=testids.index)
+        chinese = pd.Series(np.full(len(positions), np.nan, dtype=object), index=testids.index)
+        descriptions[found] = self._descriptions[positions[found]]
+        chinese[found] = self._chinese[positions[found]]
+        has_description = descriptions.notna()
+        return pd.DataFrame({
+            'Description': descriptions.fillna(not_found_text),
+            'ChineseDesc': chinese.fillna(not_found_cn_text),
+            'Found': has_description,
+            'HasChinese': has_description & chinese.notna(),
+        }, index=testids.index)
@@ -11,6 +11,7 @@ from typing import Callable, Optional
 import logging
 import os
 import sys
+from excel_handler import filter_station_sheets
 
 logger = logging.getLogger(__name__)
 
@@ -243,6 +244,7 @@ class UIManager:
         btn_frame.columnconfigure(0, weight=1)
         btn_frame.columnconfigure(1, weight=1)
         btn_frame.columnconfigure(2, weight=1)
+        btn_frame.columnconfigure(3, weight=1)
 
         self.compare_btn = tb.Button(
             btn_frame,
@@ -268,7 +270,16 @@ class UIManager:
             style="Big.TButton",
             command=getattr(self, 'open_result_callback', None)
         )
-        self.open_result_btn.grid(row=0, column=2, sticky='ew', padx=(2, 0))
+        self.open_result_btn.grid(row=0, column=2, sticky='ew', padx=(2, 2))
+
+        self.compare_dir_btn = tb.Button(
+            btn_frame,
+            text="比對資料夾",
+            bootstyle="outline-warning",
+            style="Big.TButton"
+        )
+        self.compare_dir_btn.grid(row=0, column=3, sticky='ew', padx=(2, 0))
+        ToolTip(self.compare_dir_btn, "選擇資料夾，將其中每個 TestFlow 檔案與錯誤碼檔案比對")
         
         # 添加覆蓋檔案選項的 checkbox
         self.overwrite_checkbox = tb.Checkbutton(
@@ -277,7 +288,16 @@ class UIManager:
             bootstyle="success-round-toggle",
             variable=tk.BooleanVar(value=True)  # 預設打勾
         )
-        self.overwrite_checkbox.grid(row=1, column=0, columnspan=3, pady=(10, 0), sticky='w')
+        self.overwrite_checkbox.grid(row=1, column=0, columnspan=4, pady=(10, 0), sticky='w')
+
+        # 比對全部工作表：每個測站輸出一個結果工作表
+        self.compare_all_checkbox = tb.Checkbutton(
+            btn_frame,
+            text="比對全部工作表（每個測站一個結果工作表）",
+            bootstyle="success-round-toggle",
+            variable=tk.BooleanVar(value=False)
+        )
+        self.compare_all_checkbox.grid(row=2, column=0, columnspan=4, pady=(5, 0), sticky='w')
         
         # 添加狀態列
         self._create_status_bar(row + 1)
@@ -311,6 +331,15 @@ class UIManager:
         )
         self.progress_bar.pack(side=tk.RIGHT, padx=(10, 0))
 
+        # 背景寫檔狀態（與比對狀態分開顯示，寫檔時仍可進行下一次比對）
+        self.write_status_label = tb.Label(
+            status_frame,
+            text="",
+            foreground="orange",
+            font=("Microsoft JhengHei", 11)
+        )
+        self.write_status_label.pack(side=tk.RIGHT, padx=(10, 0))
+
     def _auto_load_last_files(self):
         """自動載入上次使用的檔案"""
         try:
@@ -346,6 +375,12 @@ class UIManager:
             self.status_label.config(text=message, foreground=color)
             self.root.update_idletasks()
 
+    def update_write_status(self, pending: int):
+        """更新背景寫檔狀態（pending 為尚未完成的寫檔數，0 時清除）"""
+        if hasattr(self, 'write_status_label'):
+            self.write_status_label.config(text=f"寫入中…（{pending}）" if pending else "")
+            self.root.update_idletasks()
+
     def update_progress(self, value: int, max_value: int = 100):
         """更新進度條"""
         if hasattr(self, 'progress_bar'):
@@ -359,6 +394,16 @@ class UIManager:
             return self.overwrite_checkbox.instate(['selected'])
         return True  # 預設為 True（覆蓋）
 
+    def get_compare_all_option(self) -> bool:
+        """獲取比對全部工作表選項的狀態"""
+        if hasattr(self, 'compare_all_checkbox'):
+            return self.compare_all_checkbox.instate(['selected'])
+        return False
+
+    def get_station_sheets(self) -> list:
+        """取得下拉選單中的所有測站工作表"""
+        return list(self.sheet_combobox['values'])
+
     def show_progress(self, show: bool = True):
         """顯示或隱藏進度條"""
         if hasattr(self, 'progress_bar'):
@@ -435,14 +480,8 @@ class UIManager:
 
     def update_sheet_list(self, sheets: list):
         """更新下拉選單的工作表列表，自動排除不需要的 Sheet"""
-        # 要排除的 Sheet 名稱（不區分大小寫）
-        excluded_sheets = ['properties', 'duts', 'switch', 'instrument']
-        
-        # 過濾掉不需要的 Sheet
-        filtered_sheets = []
-        for sheet in sheets:
-            if sheet.lower() not in excluded_sheets:
-                filtered_sheets.append(sheet)
+        # 過濾掉不需要的 Sheet（排除規則與全部工作表比對共用）
+        filtered_sheets = filter_station_sheets(sheets)
         
         # 更新下拉選單
         self.sheet_combobox['values'] = filtered_sheets
@@ -463,6 +502,15 @@ class UIManager:
         """設定比對按鈕的 callback"""
         self.compare_btn.config(command=command)
 
+    def set_compare_dir_command(self, command: Callable):
+        """設定比對資料夾按鈕的 callback"""
+        self.compare_dir_btn.config(command=command)
+
+    def ask_directory(self) -> str:
+        """選擇要批次比對的資料夾，預設用上次選的目錄"""
+        initial_dir = self.config_manager.get('LastExcelPath') or self.get_exe_dir()
+        return filedialog.askdirectory(title="選擇要比對的資料夾", initialdir=initial_dir)
+
     def set_ai_recommend_callback(self, command: Callable):
         """設定 AI 推薦按鈕的 callback"""
         self.ai_recommend_callback = command
@@ -0,0 +1,281 @@
+"""
+xlsx 串流解析模組
+直接從 xlsx 壓縮檔以 iterparse 串流讀取 sharedStrings.xml 與工作表 XML，
+不建立 openpyxl 儲存格物件；提供 "Test Item All" 固定版面的快速解析
+"""
+import re
+import sys
+import zipfile
+import logging
+import posixpath
+import pandas as pd
+from pandas.io.parsers import TextParser
+from xml.etree import ElementTree
+from typing import List, Dict, Optional, Set, Iterator
+from openpyxl.utils.datetime import from_excel
+
+logger = logging.getLogger(__name__)
+
+SPREADSHEET_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+RELATIONSHIP_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PACKAGE_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+_MAIN = f"{{{SPREADSHEET_NS}}}"
+_CELL_REF = re.compile(r"([A-Z]+)(\d+)")
+
+# 內建的日期/時間數字格式代碼
+_BUILTIN_DATE_FORMATS = set(range(14, 23)) | {45, 46, 47}
+
+# "Test Item All" 的標題列（E 欄在各版本可能為「中文」或 Chinese，不檢查）
+REFERENCE_HEADER_PREFIX = ['Main Function', 'Interface', 'Interenal Error Code', 'Description']
+REFERENCE_COLUMN_COUNT = 8
+# 標題列需出現在前幾行內（3 行前言 + 標題）
+REFERENCE_HEADER_MAX_ROW = 10
+
+
+class LayoutError(Exception):
+    """工作表不符合預期版面，需改用一般讀取方式"""
+
+
+def read_sheet_names(file_path: str) -> List[str]:
+    """只讀取 xl/workbook.xml 取得工作表名稱（依活頁簿順序）"""
+    with zipfile.ZipFile(file_path) as archive:
+        root = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    return [sheet.get('name') for sheet in root.iter(f'{_MAIN}sheet')]
+
+
+def _sheet_xml_path(archive: zipfile.ZipFile, sheet_name: str) -> str:
+    """由 workbook.xml 與其關聯檔找出工作表 XML 在壓縮檔內的路徑"""
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    rel_id = None
+    for sheet in workbook.iter(f'{_MAIN}sheet'):
+        if sheet.get('name') == sheet_name:
+            rel_id = sheet.get(f'{{{RELATIONSHIP_NS}}}id')
+            break
+    if rel_id is None:
+        raise KeyError(f"找不到工作表: {sheet_name}")
+    rels = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    for rel in rels.iter(f'{{{PACKAGE_REL_NS}}}Relationship'):
+        if rel.get('Id') == rel_id:
+            target = rel.get('Target')
+            if target.startswith('/'):
+                return target.lstrip('/')
+            return posixpath.normpath(posixpath.join('xl', target))
+    raise KeyError(f"找不到工作表關聯: {rel_id}")
+
+
+def read_sheet_dimension(file_path: str, sheet_name: str) -> Optional[int]:
+    """
+    只讀取工作表 XML 開頭的 <dimension> 取得最後一列的列號（不解析儲存格）
+
+    Returns:
+        Optional[int]: 最後一列的列號；沒有 dimension 記錄時為 None
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        with archive.open(_sheet_xml_path(archive, sheet_name)) as f:
+            for _, elem in ElementTree.iterparse(f, events=('start',)):
+                if elem.tag == f'{_MAIN}dimension':
+                    match = _CELL_REF.match(elem.get('ref', '').split(':')[-1])
+                    return int(match.group(2)) if match else None
+                if elem.tag == f'{_MAIN}sheetData':
+                    return None
+    return None
+
+
+def _read_shared_strings(archive: zipfile.ZipFile) -> List[str]:
+    """串流讀取共用字串表，字串以 sys.intern 去重"""
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return []
+    strings = []
+    with archive.open('xl/sharedStrings.xml') as f:
+        for _, elem in ElementTree.iterparse(f, events=('end',)):
+            if elem.tag == f'{_MAIN}si':
+                # 一般字串為單一 <t>，RTF 字串由多個 <r><t> 組成（略過注音 <rPh>）
+                parts = []
+                for child in elem:
+                    if child.tag == f'{_MAIN}t':
+                        parts.append(child.text or '')
+                    elif child.tag == f'{_MAIN}r':
+                        parts.extend(t.text or '' for t in child.iter(f'{_MAIN}t'))
+                strings.append(sys.intern(''.join(parts)))
+                elem.clear()
+    return strings
+
+
+def _is_date_format(code: str) -> bool:
+    """判斷自訂數字格式是否為日期/時間格式"""
+    code = re.sub(r'"[^"]*"|\[[^\]]*\]|\\.', '', code).lower()
+    return any(ch in code for ch in 'dmyhs')
+
+
+def _date_style_ids(archive: zipfile.ZipFile) -> Set[int]:
+    """回傳使用日期格式的儲存格樣式索引"""
+    if 'xl/styles.xml' not in archive.namelist():
+        return set()
+    styles = ElementTree.fromstring(archive.read('xl/styles.xml'))
+    date_formats = set(_BUILTIN_DATE_FORMATS)
+    for fmt in styles.iter(f'{_MAIN}numFmt'):
+        if _is_date_format(fmt.get('formatCode', '')):
+            date_formats.add(int(fmt.get('numFmtId')))
+    cell_xfs = styles.find(f'{_MAIN}cellXfs')
+    if cell_xfs is None:
+        return set()
+    return {
+        i for i, xf in enumerate(cell_xfs.findall(f'{_MAIN}xf'))
+        if int(xf.get('numFmtId', 0)) in date_formats
+    }
+
+
+def _column_index(letters: str) -> int:
+    index = 0
+    for ch in letters:
+        index = index * 26 + ord(ch) - 64
+    return index - 1
+
+
+def read_sheet_rows(file_path: str, sheet_name: str, max_columns: Optional[int] = None) -> List[list]:
+    """
+    串流讀取工作表，回傳與 pandas openpyxl 讀取器相同格式的列資料
+    （空白為空字串、整數值不帶小數、去除列尾與表尾空白）
+
+    Args:
+        file_path: xlsx 檔案路徑
+        sheet_name: 工作表名稱
+        max_columns: 允許的最大欄數，超過時拋出 LayoutError
+
+    Returns:
+        List[list]: 每列的值
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        shared = _read_shared_strings(archive)
+        date_styles = _date_style_ids(archive)
+        rows: List[list] = []
+        with archive.open(_sheet_xml_path(archive, sheet_name)) as f:
+            row_number = 0
+            current: Dict[int, object] = {}
+            for _, elem in ElementTree.iterparse(f, events=('end',)):
+                tag = elem.tag
+                if tag == f'{_MAIN}c':
+                    ref = elem.get('r')
+                    col = _column_index(_CELL_REF.match(ref).group(1)) if ref else len(current)
+                    cell_type = elem.get('t', 'n')
+                    v = elem.find(f'{_MAIN}v')
+                    if cell_type == 'inlineStr':
+                        value = ''.join(t.text or '' for t in elem.iter(f'{_MAIN}t'))
+                    elif v is None or v.text is None:
+                        value = None
+                    elif cell_type == 's':
+                        value = shared[int(v.text)]
+                    elif cell_type == 'n':
+                        if int(elem.get('s', 0)) in date_styles:
+                            raise LayoutError(f"儲存格 {ref} 為日期格式")
+                        number = float(v.text)
+                        value = int(number) if number.is_integer() else number
+                    elif cell_type == 'b':
+                        value = v.text == '1'
+                    elif cell_type == 'e':
+                        value = float('nan')
+                    elif cell_type == 'd':
+                        raise LayoutError(f"儲存格 {ref} 為日期格式")
+                    else:
+                        value = v.text
+                    if value is not None:
+                        if max_columns is not None and col >= max_columns:
+                            raise LayoutError(f"儲存格 {ref} 超出 {max_columns} 欄")
+                        current[col] = value
+                    elem.clear()
+                elif tag == f'{_MAIN}row':
+                    r = elem.get('r')
+                    row_number = int(r) if r else row_number + 1
+                    # 缺少的列（完全空白）補空列，與 openpyxl 唯讀模式一致
+                    while len(rows) < row_number - 1:
+                        rows.append([])
+                    width = max(current) + 1 if current else 0
+                    rows.append([current.get(i, '') for i in range(width)])
+                    current = {}
+                    elem.clear()
+    # 去除表尾空白列並補齊欄數
+    while rows and not rows[-1]:
+        rows.pop()
+    width = max((len(r) for r in rows), default=0)
+    return [r + [''] * (width - len(r)) for r in rows]
+
+
+def iter_sheet_rows(file_path: str, sheet_name: str) -> Iterator[tuple]:
+    """
+    逐列串流讀取工作表的值（與 openpyxl read_only 的 values_only 相同：空白為 None、
+    整數值不帶小數、日期格式轉為 datetime），已處理的列會從 XML 樹移除，記憶體用量與行數無關
+
+    Yields:
+        tuple: 每列的值（缺少的空白列產生空 tuple）
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        shared = _read_shared_strings(archive)
+        date_styles = _date_style_ids(archive)
+        with archive.open(_sheet_xml_path(archive, sheet_name)) as f:
+            row_number = 0
+            current: Dict[int, object] = {}
+            sheet_data = None
+            for event, elem in ElementTree.iterparse(f, events=('start', 'end')):
+                tag = elem.tag
+                if event == 'start':
+                    if tag == f'{_MAIN}sheetData':
+                        sheet_data = elem
+                    continue
+                if tag == f'{_MAIN}c':
+                    ref = elem.get('r')
+                    col = _column_index(_CELL_REF.match(ref).group(1)) if ref else len(current)
+                    cell_type = elem.get('t', 'n')
+                    v = elem.find(f'{_MAIN}v')
+                    if cell_type == 'inlineStr':
+                        value = ''.join(t.text or '' for t in elem.iter(f'{_MAIN}t'))
+                    elif v is None or v.text is None:
+                        value = None
+                    elif cell_type == 's':
+                        value = shared[int(v.text)]
+                    elif cell_type == 'n':
+                        number = float(v.text)
+                        if int(elem.get('s', 0)) in date_styles:
+                            value = from_excel(number)
+                        else:
+                            value = int(number) if number.is_integer() else number
+                    elif cell_type == 'b':
+                        value = v.text == '1'
+                    elif cell_type == 'e':
+                        value = v.text
+                    else:
+                        value = v.text
+                    if value is not None:
+                        current[col] = value
+                elif tag == f'{_MAIN}row':
+                    r = elem.get('r')
+                    number = int(r) if r else row_number + 1
+                    while row_number < number - 1:
+                        row_number += 1
+                        yield ()
+                    row_number = number
+                    width = max(current) + 1 if current else 0
+                    yield tuple(current.get(i) for i in range(width))
+                    current = {}
+                    # 移除已處理的列，避免 sheetData 保留所有（已清空的）列元素
+                    if sheet_data is not None:
+                        sheet_data.clear()
+
+
+def parse_reference_sheet(file_path: str, sheet_name: str = "Test Item All") -> pd.DataFrame:
+    """
+    以固定版面快速解析 "Test Item All"，結果等同 pd.read_excel(..., header=None)
+
+    Raises:
+        LayoutError: 版面不符（欄數超過 8、找不到標題列、含日期儲存格）
+    """
+    if not str(file_path).lower().endswith(('.xlsx', '.xlsm')):
+        raise LayoutError("僅支援 xlsx 格式")
+    rows = read_sheet_rows(file_path, sheet_name, max_columns=REFERENCE_COLUMN_COUNT)
+    header_found = any(
+        [str(v).strip() for v in row[:len(REFERENCE_HEADER_PREFIX)]] == REFERENCE_HEADER_PREFIX
+        for row in rows[:REFERENCE_HEADER_MAX_ROW]
+    )
+    if not header_found:
+        raise LayoutError("前幾行找不到 Main Function 標題列")
+    return TextParser(rows, header=None).read()